@@ -0,0 +1,189 @@
+"""
+Checkpoints and dead letters for resumable Glue embedding jobs.
+
+A Checkpoint records how far through the input dataset a job has committed:
+every parquet fragment whose path sorts before `fragment`, plus the first
+`rows` rows of that one, have been embedded and indexed or dead-lettered.
+It is rewritten after each committed batch, so a job that dies part way can
+be rerun with --resume and continue from there instead of starting over.
+
+A DeadLetter collects batches that failed to embed or index as JSON lines
+(the batch's input rows and the error), so one bad batch doesn't stop the
+job, and they can be replayed later with --replay_dead_letter.
+
+Both live on local disk or S3 (s3:// locations).
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+
+def _s3_object(location):
+    url = urlparse(location)
+    return url.netloc, url.path.lstrip("/")
+
+
+def read_text(location):
+    """Contents of a local or s3:// file, or None if there is none."""
+    if location.startswith("s3://"):
+        import boto3
+        from botocore.exceptions import ClientError
+
+        bucket, key = _s3_object(location)
+        try:
+            body = boto3.client("s3").get_object(Bucket=bucket, Key=key)["Body"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return None
+            raise
+        return body.read().decode("utf-8")
+    if not os.path.exists(location):
+        return None
+    with open(location, encoding="utf-8") as f:
+        return f.read()
+
+
+def write_text(location, text):
+    """Replaces a local or s3:// file with text."""
+    if location.startswith("s3://"):
+        import boto3
+
+        bucket, key = _s3_object(location)
+        boto3.client("s3").put_object(Bucket=bucket, Key=key, Body=text.encode("utf-8"))
+        return
+    # Written next to the old one and renamed, so a crash never leaves half a checkpoint
+    tmp = f"{location}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, location)
+
+
+def iter_batches(dataset, columns, batch_size, start=None):
+    """
+    (fragment path, rows of it read so far, record batch) for each batch of
+    dataset, fragment by fragment in path order, beginning after position
+    start = (fragment path, rows) from a checkpoint.
+    """
+    start_path, start_rows = start or (None, 0)
+    for fragment in sorted(dataset.get_fragments(), key=lambda f: f.path):
+        if start_path is not None and fragment.path < start_path:
+            continue
+        skip = start_rows if fragment.path == start_path else 0
+        offset = 0
+        for batch in fragment.to_batches(schema=dataset.schema, columns=columns, batch_size=batch_size):
+            first, offset = offset, offset + batch.num_rows
+            if offset <= skip:
+                continue
+            if first < skip:
+                batch = batch.slice(skip - first)
+            yield fragment.path, offset, batch
+
+
+class Checkpoint:
+    """Progress of one job over one input, saved at `location` as JSON."""
+
+    def __init__(self, location, input_location):
+        self.location = location
+        self.state    = {
+            "input":         input_location,
+            "fragment":      None,
+            "rows":          0,
+            "total_rows":    0,
+            "indexed":       0,
+            "dead_lettered": 0,
+            "dead_letters":  [],
+            "complete":      False,
+        }
+
+    def load(self):
+        """Loads the saved checkpoint to resume from. Returns False if there is none."""
+        text = read_text(self.location)
+        if text is None:
+            return False
+        state = json.loads(text)
+        if state.get("input") != self.state["input"]:
+            raise ValueError(f"Checkpoint {self.location} is for input {state.get('input')!r}, "
+                             f"not {self.state['input']!r}; run without --resume to start over")
+        self.state.update(state)
+        return True
+
+    @property
+    def position(self):
+        return self.state["fragment"], self.state["rows"]
+
+    @property
+    def complete(self):
+        return self.state["complete"]
+
+    def add_dead_letter(self, location):
+        if location not in self.state["dead_letters"]:
+            self.state["dead_letters"].append(location)
+
+    def commit(self, fragment, rows, batch_rows, indexed=0, dead_lettered=0):
+        """Records that the batch ending at row `rows` of fragment is done, and saves."""
+        self.state.update(fragment=fragment, rows=rows)
+        self.state["total_rows"]    += batch_rows
+        self.state["indexed"]       += indexed
+        self.state["dead_lettered"] += dead_lettered
+        self.save()
+
+    def finish(self):
+        self.state["complete"] = True
+        self.save()
+
+    def save(self):
+        self.state["updated_at"] = int(time.time())
+        write_text(self.location, json.dumps(self.state, indent=2))
+
+
+class DeadLetter:
+    """
+    Failed batches, one JSON line each:
+    {"stage", "error", "failed_at", "rows": [input row, ...], ...context}.
+    Lines are appended to a local file; an s3:// location is uploaded by
+    flush() whenever something new was added.
+    """
+
+    def __init__(self, location):
+        self.location = location
+        self.s3       = location.startswith("s3://")
+        self.path     = os.path.join(tempfile.gettempdir(), "dead_letter.jsonl") if self.s3 else location
+        self.batches  = 0
+        self.rows     = 0
+        self.dirty    = False
+        self.lock     = threading.Lock()
+        if self.s3 and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def add(self, stage, error, rows, **context):
+        record = {"stage": stage, "error": str(error), "failed_at": int(time.time()), **context, "rows": rows}
+        line = json.dumps(record, default=str)
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.batches += 1
+            self.rows    += len(rows)
+            self.dirty    = True
+        print(f"[dead letter] {len(rows)} rows failed to {stage}: {error}")
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            if self.s3:
+                import boto3
+
+                bucket, key = _s3_object(self.location)
+                boto3.client("s3").upload_file(self.path, bucket, key)
+            self.dirty = False
+
+
+def read_dead_letter(location):
+    """The records of a dead-letter file, in the order they were written."""
+    text = read_text(location)
+    if text is None:
+        raise FileNotFoundError(f"No dead-letter file at {location}")
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
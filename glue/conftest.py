@@ -0,0 +1,2 @@
+# test_embed.py is the standalone embed-and-index script, not a test module
+collect_ignore = ["test_embed.py"]
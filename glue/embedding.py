@@ -0,0 +1,248 @@
+"""
+Concurrent, adaptively rate-limited text embedding for the Glue jobs.
+
+An Embedder splits texts into request-sized batches and sends them on a
+bounded thread pool. Every request waits for a slot from an
+AdaptiveRateLimiter, which raises its rate while requests succeed and cuts
+it when the backend throttles (AIMD), so the job settles just under the
+account's Bedrock quota without fixed sleeps.
+
+Backends: BedrockBackend (Titan v2, or Cohere models that take up to 96
+texts per request) and StandInBackend, a local stand-in with deterministic
+vectors and an optional simulated quota for testing and dry runs.
+"""
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MODEL_ID   = "amazon.titan-embed-text-v2:0"
+DEFAULT_DIMENSIONS = 1024
+
+# Bedrock error codes that mean "slow down" rather than "this request is bad"
+THROTTLE_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException"}
+
+
+class Throttled(Exception):
+    """Raised by a backend when the service asked us to slow down."""
+
+
+class BedrockBackend:
+    """
+    Bedrock InvokeModel embeddings. Titan takes one text per request; Cohere
+    embed models take a list. botocore's own retries are turned off so
+    throttling reaches the rate limiter instead of being slept through.
+    """
+
+    def __init__(self, model_id=DEFAULT_MODEL_ID, dimensions=DEFAULT_DIMENSIONS, region=None, pool_size=10):
+        import boto3
+        from botocore.config import Config
+
+        self.model_id   = model_id
+        self.dimensions = dimensions
+        self.cohere     = model_id.startswith("cohere.")
+        self.max_batch  = 96 if self.cohere else 1
+        self.client     = boto3.client("bedrock-runtime", region_name=region, config=Config(
+            retries={"max_attempts": 1, "mode": "standard"},
+            max_pool_connections=pool_size,
+            read_timeout=60
+        ))
+
+    def embed_batch(self, texts):
+        from botocore.exceptions import ClientError
+
+        if self.cohere:
+            body = {"texts": texts, "input_type": "search_document"}
+        else:
+            body = {"inputText": texts[0], "dimensions": self.dimensions}
+        try:
+            response = self.client.invoke_model(modelId=self.model_id, body=json.dumps(body))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in THROTTLE_CODES:
+                raise Throttled(str(e)) from e
+            raise
+        result = json.loads(response["body"].read())
+        return result["embeddings"] if self.cohere else [result["embedding"]]
+
+
+class StandInBackend:
+    """
+    Local stand-in for Bedrock: unit vectors derived from a hash of the
+    text (the same text always gets the same vector), `latency` seconds
+    per request, and Throttled once more than `quota` requests arrive in
+    a one-second window. No AWS access needed.
+    """
+
+    def __init__(self, dimensions=DEFAULT_DIMENSIONS, latency=0.0, quota=None, max_batch=1, model_id="stand-in"):
+        self.model_id   = model_id
+        self.dimensions = dimensions
+        self.latency    = latency
+        self.quota      = quota
+        self.max_batch  = max_batch
+        self.window     = (0, 0)
+        self.lock       = threading.Lock()
+
+    def embed_batch(self, texts):
+        if self.quota is not None:
+            with self.lock:
+                second, count = self.window
+                now = int(time.monotonic())
+                count = count + 1 if now == second else 1
+                self.window = (now, count)
+            if count > self.quota:
+                raise Throttled(f"more than {self.quota} requests/second")
+        if self.latency:
+            time.sleep(self.latency)
+        return [self.vector(text) for text in texts]
+
+    def vector(self, text):
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        values = [rng.gauss(0, 1) for _ in range(self.dimensions)]
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return [v / norm for v in values]
+
+
+class AdaptiveRateLimiter:
+    """
+    Requests/second limit tuned by additive increase, multiplicative
+    decrease: each success adds about `increase` requests/second per
+    second, and a throttle multiplies the rate by `decrease`. Throttles
+    within `cooldown` seconds of the last cut are ignored, since they come
+    from requests already sent at the old rate. acquire() hands out evenly
+    spaced slots, so concurrent workers never burst.
+    """
+
+    def __init__(self, rate=5.0, min_rate=0.5, max_rate=200.0, increase=1.0, decrease=0.5,
+                 cooldown=1.0, clock=time.monotonic, sleep=time.sleep):
+        self.rate      = rate
+        self.min_rate  = min_rate
+        self.max_rate  = max_rate
+        self.increase  = increase
+        self.decrease  = decrease
+        self.cooldown  = cooldown
+        self.clock     = clock
+        self.sleep     = sleep
+        self.next_slot = clock()
+        self.last_cut  = None
+        self.lock      = threading.Lock()
+
+    def acquire(self):
+        """Waits for the next request slot. Returns the seconds waited."""
+        with self.lock:
+            now = self.clock()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + 1.0 / self.rate
+        wait = slot - now
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def on_success(self):
+        with self.lock:
+            # ~rate successes a second, so this adds ~increase per second
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_throttle(self):
+        with self.lock:
+            now = self.clock()
+            if self.last_cut is not None and now - self.last_cut < self.cooldown:
+                return
+            self.last_cut = now
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.next_slot = max(self.next_slot, now + 1.0 / self.rate)
+
+
+class Embedder:
+    """
+    Embeds lists of texts through `backend` on `workers` threads, in
+    batches of up to `batch_size` texts (capped at what the backend accepts
+    per request), keeping the input order. Throttled requests are retried
+    after the limiter backs off, up to `max_throttles` times per batch, a
+    budget meant to ride out sustained throttling at the limiter's minimum
+    rate; other errors are retried up to `max_retries` times. Either
+    running out raises.
+    """
+
+    def __init__(self, backend, batch_size=16, workers=8, limiter=None, max_retries=8, max_throttles=200):
+        self.backend       = backend
+        self.batch_size    = max(1, min(batch_size, getattr(backend, "max_batch", batch_size)))
+        self.workers       = workers
+        self.limiter       = limiter or AdaptiveRateLimiter()
+        self.max_retries   = max_retries
+        self.max_throttles = max_throttles
+        self.pool        = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed")
+        self.stats       = {"embedded": 0, "requests": 0, "throttled": 0, "errors": 0, "seconds": 0.0}
+        self.lock        = threading.Lock()
+
+    def _count(self, counter, n=1):
+        with self.lock:
+            self.stats[counter] += n
+
+    def _embed_batch(self, texts):
+        errors = throttles = 0
+        while True:
+            self.limiter.acquire()
+            self._count("requests")
+            try:
+                vectors = self.backend.embed_batch(texts)
+            except Throttled:
+                self._count("throttled")
+                self.limiter.on_throttle()
+                throttles += 1
+                if throttles >= self.max_throttles:
+                    raise RuntimeError(f"Embedding still throttled after {throttles} attempts")
+                continue
+            except Exception as e:
+                self._count("errors")
+                errors += 1
+                if errors >= self.max_retries:
+                    raise
+                print(f"[embed retry {errors}/{self.max_retries}] {e}")
+                continue
+            self.limiter.on_success()
+            self._count("embedded", len(texts))
+            return vectors
+
+    def embed(self, texts, progress=None):
+        """
+        Vectors for texts, in order. progress(n) is called as each batch of
+        n texts completes (e.g. a tqdm bar's update).
+        """
+        start = time.perf_counter()
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+        def run(batch):
+            vectors = self._embed_batch(batch)
+            if progress is not None:
+                progress(len(batch))
+            return vectors
+
+        try:
+            results = list(self.pool.map(run, batches))
+        finally:
+            self._count("seconds", time.perf_counter() - start)
+        return [vector for batch in results for vector in batch]
+
+    def throughput(self):
+        """Embeddings per second over all embed() calls so far."""
+        return self.stats["embedded"] / self.stats["seconds"] if self.stats["seconds"] else 0.0
+
+    def report(self):
+        return (f"{self.stats['embedded']} embeddings in {self.stats['seconds']:.1f}s "
+                f"({self.throughput():.1f}/s), {self.stats['requests']} requests, "
+                f"{self.stats['throttled']} throttled, final rate {self.limiter.rate:.1f} req/s")
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+
+def make_backend(name, model_id=DEFAULT_MODEL_ID, dimensions=DEFAULT_DIMENSIONS, region=None, workers=8):
+    """Backend for the --embedding_backend job argument: "bedrock" or "standin"."""
+    if name == "standin":
+        return StandInBackend(dimensions=dimensions, latency=0.05)
+    if name == "bedrock":
+        return BedrockBackend(model_id=model_id, dimensions=dimensions, region=region, pool_size=max(10, workers))
+    raise ValueError(f"Unknown embedding backend {name!r}; expected bedrock or standin")
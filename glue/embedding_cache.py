@@ -0,0 +1,183 @@
+"""
+Content-addressed embedding cache for incremental reindexing.
+
+Vectors are stored in SQLite under sha256(model id, dimensions, normalized
+text), so a text is only sent to Bedrock the first time that exact content
+is seen with that model. The same file remembers a hash of each document
+as last indexed per collection, so unchanged documents are not re-sent to
+OpenSearch either.
+
+The file lives on local disk, or on S3 (an s3:// location is downloaded at
+open and uploaded by save(), which the job calls before each checkpoint).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import unicodedata
+from array import array
+from urllib.parse import urlparse
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB);
+CREATE TABLE IF NOT EXISTS indexed (
+    collection TEXT, doc_id TEXT, doc_hash TEXT,
+    PRIMARY KEY (collection, doc_id)
+);
+"""
+
+# SQLite caps bound parameters per statement
+MAX_PARAMS = 900
+
+
+def normalize_text(text):
+    """Unicode-normalized, whitespace-collapsed text: what the cache key covers."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def doc_hash(source, model_key=""):
+    """
+    Stable hash of a document's indexed fields. The vector itself is left
+    out; model_key stands in for it, since the text is already hashed.
+    """
+    fields = {k: v for k, v in source.items() if k != "vector" and not k.startswith("_")}
+    content = model_key + json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embedding cache and indexed-document hashes in one SQLite file. Safe to
+    share between pipeline threads.
+    """
+
+    def __init__(self, location, model_id, dimensions):
+        self.location   = location
+        self.model_id   = model_id
+        self.dimensions = dimensions
+        self.s3_url     = urlparse(location) if location.startswith("s3://") else None
+        self.path       = self._fetch() if self.s3_url else location
+        self.conn       = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.stats      = {"hits": 0, "misses": 0, "skipped_docs": 0, "indexed_docs": 0}
+        self.lock       = threading.Lock()
+        self.uploaded   = None   # conn.total_changes when last uploaded
+
+    def _fetch(self):
+        import boto3
+        from botocore.exceptions import ClientError
+
+        path = os.path.join(tempfile.gettempdir(), "embedding_cache.sqlite")
+        try:
+            boto3.client("s3").download_file(self.s3_url.netloc, self.s3_url.path.lstrip("/"), path)
+            print(f"Loaded embedding cache from {self.location}")
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey"):
+                raise
+            print(f"No embedding cache at {self.location} yet; starting empty")
+            if os.path.exists(path):
+                os.remove(path)
+        return path
+
+    def key(self, text):
+        content = f"{self.model_id}\n{self.dimensions}\n{normalize_text(text)}"
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _select(self, sql, values, leading=()):
+        """Rows of sql for all values, run in chunks small enough for SQLite's IN ({marks})."""
+        rows = []
+        for i in range(0, len(values), MAX_PARAMS):
+            chunk = values[i:i + MAX_PARAMS]
+            with self.lock:
+                rows.extend(self.conn.execute(sql.format(marks=",".join("?" * len(chunk))), [*leading, *chunk]).fetchall())
+        return rows
+
+    def embed(self, texts, embed_missing):
+        """
+        Vectors for texts, in order: cached ones from the cache, the rest
+        from embed_missing(list of distinct uncached texts), which are then
+        stored.
+        """
+        keys = [self.key(text) for text in texts]
+        found = {
+            key: array("f", blob).tolist()
+            for key, blob in self._select("SELECT key, vector FROM embeddings WHERE key IN ({marks})", list(set(keys)))
+        }
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            vectors = embed_missing(list(missing.values()))
+            new = dict(zip(missing, vectors))
+            with self.lock:
+                self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                                      [(key, array("f", vector).tobytes()) for key, vector in new.items()])
+                self.conn.commit()
+            found.update(new)
+        # Misses are the distinct texts sent to embed_missing; every other
+        # text, repeats of those included, was served without a request
+        with self.lock:
+            self.stats["hits"] += len(keys) - len(missing)
+            self.stats["misses"] += len(missing)
+        return [found[key] for key in keys]
+
+    def changed(self, collection, docs):
+        """
+        (bulk actions from docs whose fields differ from what was last
+        indexed into collection, or were never indexed; {_id: hash} of
+        those, for mark_indexed() once they are indexed).
+        """
+        model_key = f"{self.model_id}\n{self.dimensions}\n"
+        hashes = {doc["_id"]: doc_hash(doc, model_key) for doc in docs}
+        known = dict(self._select(
+            "SELECT doc_id, doc_hash FROM indexed WHERE collection = ? AND doc_id IN ({marks})",
+            list(hashes), leading=(collection,)
+        ))
+        changed = [doc for doc in docs if known.get(doc["_id"]) != hashes[doc["_id"]]]
+        with self.lock:
+            self.stats["skipped_docs"] += len(docs) - len(changed)
+        return changed, {doc["_id"]: hashes[doc["_id"]] for doc in changed}
+
+    def mark_indexed(self, collection, hashes):
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO indexed VALUES (?, ?, ?)",
+                                  [(collection, doc_id, h) for doc_id, h in hashes.items()])
+            self.conn.commit()
+            self.stats["indexed_docs"] += len(hashes)
+
+    def hit_rate(self):
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def report(self):
+        return (f"embedding cache hit rate {100 * self.hit_rate():.1f}% "
+                f"({self.stats['hits']} hits, {self.stats['misses']} embedded); "
+                f"{self.stats['indexed_docs']} documents indexed, {self.stats['skipped_docs']} unchanged skipped")
+
+    def save(self):
+        """
+        Commits, and for an s3:// location uploads a consistent snapshot of
+        the file, so it can be called while the pipeline is still writing.
+        Nothing is uploaded if the file hasn't changed since the last upload.
+        """
+        with self.lock:
+            self.conn.commit()
+            if not self.s3_url or self.conn.total_changes == self.uploaded:
+                return
+            changes = self.conn.total_changes
+            snapshot_path = f"{self.path}.upload"
+            snapshot = sqlite3.connect(snapshot_path)
+            self.conn.backup(snapshot)
+            snapshot.close()
+        import boto3
+        boto3.client("s3").upload_file(snapshot_path, self.s3_url.netloc, self.s3_url.path.lstrip("/"))
+        os.remove(snapshot_path)
+        self.uploaded = changes
+        print(f"Saved embedding cache to {self.location}")
+
+    def close(self):
+        self.save()
+        self.conn.close()
@@ -0,0 +1,89 @@
+"""
+Bounded streaming pipeline for the Glue jobs.
+
+stream(source, stage1, stage2, ...) runs the source iterable and each stage
+on its own thread, connected by queues holding at most `queue_size` items,
+and yields what the last stage returns. A slow stage makes the ones before
+it block instead of buffering, so memory is bounded by the queue sizes
+rather than the dataset. An exception in any stage stops the others and is
+re-raised to the caller.
+"""
+import queue
+import threading
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(q, item, stop):
+    """q.put that gives up once the pipeline is stopping."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _DONE
+
+
+def _produce(source, out, stop):
+    try:
+        for item in source:
+            if not _put(out, item, stop):
+                return
+    except Exception as e:
+        _put(out, _Failure(e), stop)
+        return
+    _put(out, _DONE, stop)
+
+
+def _work(stage, inbox, out, stop):
+    while True:
+        item = _get(inbox, stop)
+        if item is _DONE or isinstance(item, _Failure):
+            _put(out, item, stop)
+            return
+        try:
+            result = stage(item)
+        except Exception as e:
+            _put(out, _Failure(e), stop)
+            return
+        if not _put(out, result, stop):
+            return
+
+
+def stream(source, *stages, queue_size=2):
+    """Yields stages[-1](...stages[0](item)) for each item of source, in order."""
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    threads = [threading.Thread(target=_produce, args=(source, queues[0], stop), daemon=True)]
+    for i, stage in enumerate(stages):
+        name = getattr(stage, "__name__", f"stage{i}")
+        threads.append(threading.Thread(target=_work, args=(stage, queues[i], queues[i + 1], stop), name=name, daemon=True))
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            item = queues[-1].get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
@@ -2,68 +2,46 @@ import os
 import sys
 import boto3
 import pandas as pd
-from langchain_aws import BedrockEmbeddings
 from opensearchpy import OpenSearch, AWSV4SignerAuth, RequestsHttpConnection
 from opensearchpy.helpers import bulk
+import pyarrow as pa
 import pyarrow.dataset as ds
 from tqdm import tqdm
 import argparse
+import json
 import time
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--bucket_name", required=True)
-    parser.add_argument("--input_key", default="clean_data/vectorised/")
-    parser.add_argument("--region", default="us-east-1")
-    parser.add_argument("--opensearch_endpoint", required=True)
-    parser.add_argument("--collection_name", default="products-embeddings")
+from checkpoint import Checkpoint, DeadLetter, iter_batches, read_dead_letter
+from embedding import DEFAULT_DIMENSIONS, DEFAULT_MODEL_ID, AdaptiveRateLimiter, Embedder, make_backend
+from embedding_cache import EmbeddingCache
+from pipeline import stream
 
-    args, _ = parser.parse_known_args()
+# Only these columns are read from the parquet dataset
+TEXT_COLUMNS     = ["product_name", "ingredients_text", "categories"]
+NUMERIC_COLUMNS  = ["sugars_100g", "fat_100g", "proteins_100g", "carbohydrates_100g", "energy_kcal_100g"]
+COLUMNS          = ["id"] + TEXT_COLUMNS + NUMERIC_COLUMNS
 
-    bucket_name        = args.bucket_name
-    input_key          = args.input_key
-    region             = args.region
-    opensearch_endpoint= args.opensearch_endpoint
-    collection_name    = args.collection_name
-
-    # Read CSV from S3 into pandas DataFrame
-
-    dataset = ds.dataset(
-        f"s3://{bucket_name}/{input_key}",
-        format="parquet",
-        partitioning="hive"
-    )
-    table = dataset.to_table()
-    df = table.to_pandas()
-    print("Loaded", len(df), "records for embedding")
+def prepare_batch(record_batch):
+    """One parquet record batch as a DataFrame with doc_text built."""
+    df = record_batch.to_pandas()
     # Fill missing fields
-    df["product_name"]     = df["product_name"].fillna("")
-    df["ingredients_text"] = df["ingredients_text"].fillna("")
-    df["categories"]       = df["categories"].fillna("")
-    df["doc_text"]         = (
+    for col in TEXT_COLUMNS:
+        df[col] = df[col].fillna("") if col in df.columns else ""
+    df["doc_text"] = (
         df["product_name"] + " "
         + df["ingredients_text"] + " "
         + df["categories"]
     )
+    return df
 
-    # Initialize Bedrock embeddings
-    embeddings = BedrockEmbeddings(
-        model_id="amazon.titan-embed-text-v2:0"
-    )
-
-    def safe_embed(text, retries=3, delay=2):
-        for attempt in range(retries):
-            try:
-                return embeddings.embed_query(text)
-            except Exception as e:
-                print(f"[Retry {attempt+1}] Failed to embed: {e}")
-                time.sleep(delay * (2 ** attempt))
-        raise RuntimeError("Embedding failed after retries.")
+def dead_letter_rows(df):
+    """A batch's input rows as JSON-safe dicts, to replay from a dead-letter file."""
+    return json.loads(df[[col for col in COLUMNS if col in df.columns]].to_json(orient="records"))
 
-    # Prepare documents for bulk indexing
+def make_actions(df, vectors, collection_name):
+    """Bulk index actions for a batch and its vectors."""
     docs = []
-    for _, row in df.iterrows():
-        vector = safe_embed(row["doc_text"][:1000])
+    for (_, row), vector in zip(df.iterrows(), vectors):
         docs.append({
             "_index":   collection_name,
             "_id":      str(row["id"]),
@@ -78,6 +56,99 @@ def main():
             "ingredients_text":   row["ingredients_text"],
             "vector":             vector
         })
+    return docs
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bucket_name", required=True)
+    parser.add_argument("--input_key", default="clean_data/vectorised/")
+    parser.add_argument("--region", default="us-east-1")
+    parser.add_argument("--opensearch_endpoint", required=True)
+    parser.add_argument("--collection_name", default="products-embeddings")
+    parser.add_argument("--embedding_backend", default="bedrock", choices=["bedrock", "standin"])
+    parser.add_argument("--model_id", default=DEFAULT_MODEL_ID)
+    parser.add_argument("--dimensions", type=int, default=DEFAULT_DIMENSIONS)
+    parser.add_argument("--embed_workers", type=int, default=8)
+    parser.add_argument("--embed_batch_size", type=int, default=16)
+    parser.add_argument("--embed_rate", type=float, default=5.0, help="initial requests/second; adapts to throttling")
+    parser.add_argument("--read_batch_size", type=int, default=500, help="rows per record batch, embedded and indexed together")
+    parser.add_argument("--queue_size", type=int, default=2, help="batches buffered between pipeline stages")
+    parser.add_argument("--embedding_cache", default=None,
+                        help="local path or s3:// URI of the embedding cache (default: in the bucket; empty to disable)")
+    parser.add_argument("--reindex_all", action="store_true", help="re-send unchanged documents to OpenSearch too")
+    parser.add_argument("--checkpoint", default=None,
+                        help="local path or s3:// URI of the progress checkpoint (default: in the bucket; empty to disable)")
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint instead of starting over")
+    parser.add_argument("--checkpoint_every", type=int, default=20,
+                        help="batches between checkpoints; each one also uploads the embedding cache")
+    parser.add_argument("--dead_letter", default=None,
+                        help="local path or s3:// URI for batches that fail to embed or index (default: in the bucket)")
+    parser.add_argument("--replay_dead_letter", default=None, help="embed and index the batches of this dead-letter file instead")
+
+    args, _ = parser.parse_known_args()
+
+    bucket_name        = args.bucket_name
+    input_key          = args.input_key
+    region             = args.region
+    opensearch_endpoint= args.opensearch_endpoint
+    collection_name    = args.collection_name
+    input_location     = f"s3://{bucket_name}/{input_key}"
+
+    # Progress is checkpointed every checkpoint_every batches, so a failed run
+    # can be resumed with --resume; replays of dead letters are not checkpointed
+    checkpoint_location = args.checkpoint
+    if checkpoint_location is None:
+        checkpoint_location = f"s3://{bucket_name}/embedding_checkpoints/{collection_name}.json"
+    checkpoint = None
+    if checkpoint_location and not args.replay_dead_letter:
+        checkpoint = Checkpoint(checkpoint_location, input_location)
+    start = None
+    if args.resume:
+        if checkpoint is None:
+            sys.exit("--resume needs a --checkpoint")
+        if checkpoint.load():
+            if checkpoint.complete:
+                print(f"Checkpoint {checkpoint_location} says this input is already done; nothing to resume")
+                return
+            start = checkpoint.position
+            print(f"Resuming after {checkpoint.state['total_rows']} records ({start[0]}, row {start[1]})")
+        else:
+            print(f"No checkpoint at {checkpoint_location}; starting from the beginning")
+
+    dead_letter_location = args.dead_letter
+    if dead_letter_location is None:
+        run_id = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        dead_letter_location = f"s3://{bucket_name}/embedding_dead_letter/{collection_name}/{run_id}.jsonl"
+    dead_letter = DeadLetter(dead_letter_location)
+
+    if args.replay_dead_letter:
+        # Each dead-lettered batch goes through the pipeline again as one batch
+        records = read_dead_letter(args.replay_dead_letter)
+        batches = ((None, None, pa.RecordBatch.from_pylist(record["rows"])) for record in records if record["rows"])
+        total   = sum(len(record["rows"]) for record in records)
+        print("Replaying", total, "dead-lettered records from", args.replay_dead_letter)
+    else:
+        # Stream the parquet dataset from S3 in record batches, reading only the
+        # columns we index; at most queue_size batches sit between each stage
+        dataset = ds.dataset(
+            input_location,
+            format="parquet",
+            partitioning="hive"
+        )
+        columns = [col for col in COLUMNS if col in dataset.schema.names]
+        batches = iter_batches(dataset, columns, args.read_batch_size, start=start)
+        total   = dataset.count_rows()
+        print("Streaming", total, "records for embedding")
+
+    # Embed in concurrent batches, rate limited adaptively to Bedrock's throttling
+    backend = make_backend(args.embedding_backend, model_id=args.model_id, dimensions=args.dimensions,
+                           region=region, workers=args.embed_workers)
+    embedder = Embedder(
+        backend,
+        batch_size=args.embed_batch_size,
+        workers=args.embed_workers,
+        limiter=AdaptiveRateLimiter(rate=args.embed_rate)
+    )
 
     # Sign requests for OpenSearch Serverless
     session = boto3.Session()
@@ -92,11 +163,110 @@ def main():
         connection_class=RequestsHttpConnection
     )
 
-    BATCH_SIZE = 500
-    for i in tqdm(range(0, len(docs), BATCH_SIZE), desc="Uploading batches"):
-        batch = docs[i:i + BATCH_SIZE]
-        success, _ = bulk(client, batch, request_timeout=60)
-        print(f"Uploaded {success} documents")
+    # Only new or changed texts are embedded, and only new or changed
+    # documents re-sent to OpenSearch
+    cache_location = args.embedding_cache
+    if cache_location is None:
+        cache_location = f"s3://{bucket_name}/embedding_cache/{collection_name}.sqlite"
+    cache = EmbeddingCache(cache_location, backend.model_id, args.dimensions) if cache_location else None
+    if cache is None and checkpoint is not None:
+        print("Embedding cache disabled: checkpoints record only the position reached, "
+              "with no manifest of indexed documents")
+
+    # Batches carry their position (fragment, rows read of it) through the
+    # pipeline; one that fails is dead-lettered and the rest carry on
+    def prepare(item):
+        fragment, rows, record_batch = item
+        return fragment, rows, prepare_batch(record_batch)
+
+    def embed(item):
+        fragment, rows, df = item
+        texts = [text[:1000] for text in df["doc_text"]]
+        try:
+            vectors = embedder.embed(texts) if cache is None else cache.embed(texts, embedder.embed)
+        except Exception as e:
+            dead_letter.add("embed", e, dead_letter_rows(df), collection=collection_name, fragment=fragment)
+            vectors = None
+        return fragment, rows, df, vectors
+
+    def index(item):
+        fragment, rows, df, vectors = item
+        if vectors is None:
+            return fragment, rows, len(df), 0, len(df)
+        docs = make_actions(df, vectors, collection_name)
+        hashes = {}
+        if cache is not None:
+            changed, hashes = cache.changed(collection_name, docs)
+            if not args.reindex_all:
+                docs = changed
+        failed = {}
+        success = 0
+        if docs:
+            try:
+                success, errors = bulk(client, docs, request_timeout=60, raise_on_error=False, raise_on_exception=False)
+            except Exception as e:
+                errors = [{"index": {"_id": doc["_id"], "error": str(e)}} for doc in docs]
+            for error in errors:
+                info = next(iter(error.values()))
+                failed[str(info.get("_id"))] = str(info.get("error") or info.get("exception"))
+        if failed:
+            reasons = "; ".join(sorted(set(failed.values())))
+            dead_letter.add("index", reasons[:1000], dead_letter_rows(df[df["id"].astype(str).isin(failed)]),
+                            collection=collection_name, fragment=fragment)
+        if cache is not None:
+            cache.mark_indexed(collection_name, {doc_id: h for doc_id, h in hashes.items() if doc_id not in failed})
+        return fragment, rows, len(df), success, len(failed)
+
+    indexed = 0
+    failed  = 0
+    done    = checkpoint.state["total_rows"] if start is not None else 0
+    pending = {"batches": 0, "rows": 0, "indexed": 0, "failed": 0}
+
+    def commit():
+        # The checkpoint only moves past batches whose vectors and indexed-document
+        # manifest (both in the cache) and dead letters are already saved: a Glue
+        # timeout or OOM kill ends the job without running any cleanup
+        if cache is not None:
+            cache.save()
+        dead_letter.flush()
+        if pending["failed"]:
+            checkpoint.add_dead_letter(dead_letter_location)
+        checkpoint.commit(pending["fragment"], pending["end"], pending["rows"], pending["indexed"], pending["failed"])
+        pending.update(batches=0, rows=0, indexed=0, failed=0)
+
+    try:
+        with tqdm(total=total, initial=done, desc="Embedding and indexing") as progress:
+            for fragment, rows, batch_rows, success, batch_failed in stream(
+                    batches, prepare, embed, index, queue_size=args.queue_size):
+                indexed += success
+                failed  += batch_failed
+                dead_letter.flush()
+                if checkpoint is not None:
+                    pending.update(fragment=fragment, end=rows)
+                    pending["batches"] += 1
+                    pending["rows"]    += batch_rows
+                    pending["indexed"] += success
+                    pending["failed"]  += batch_failed
+                    if pending["batches"] >= args.checkpoint_every:
+                        commit()
+                progress.update(batch_rows)
+        if checkpoint is not None:
+            if pending["batches"]:
+                commit()
+            checkpoint.finish()
+    finally:
+        # Keep what was embedded even if the run failed part way
+        embedder.close()
+        dead_letter.flush()
+        if cache is not None:
+            cache.close()
+    print("Embedded", embedder.report())
+    if cache is not None:
+        print("Cache:", cache.report())
+    print(f"Uploaded {indexed} documents")
+    if failed:
+        print(f"{failed} records failed and were written to {dead_letter_location}; "
+              f"replay them with --replay_dead_letter {dead_letter_location}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,70 @@
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pytest
+
+from checkpoint import Checkpoint, DeadLetter, iter_batches, read_dead_letter
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    # Two fragments of 5 rows; ids 0-9 in path order
+    (tmp_path / "products").mkdir()
+    for part, ids in (("part-0", range(5)), ("part-1", range(5, 10))):
+        pq.write_table(pa.table({"id": list(ids), "name": [f"item {i}" for i in ids]}),
+                       tmp_path / "products" / f"{part}.parquet")
+    return ds.dataset(str(tmp_path / "products"), format="parquet")
+
+
+def ids(batches):
+    return [i for _, _, batch in batches for i in batch.column("id").to_pylist()]
+
+
+def test_batches_cover_every_row_in_fragment_order(dataset):
+    batches = list(iter_batches(dataset, ["id"], batch_size=2))
+    assert ids(batches) == list(range(10))
+    assert [rows for _, rows, _ in batches] == [2, 4, 5, 2, 4, 5]
+
+
+@pytest.mark.parametrize("rows", [0, 2, 3, 5])
+def test_resuming_skips_exactly_the_committed_rows(dataset, rows):
+    second = sorted(f.path for f in dataset.get_fragments())[1]
+    assert ids(iter_batches(dataset, ["id"], batch_size=2, start=(second, rows))) == list(range(5 + rows, 10))
+
+
+def test_a_job_that_dies_resumes_where_it_committed(dataset, tmp_path):
+    location = str(tmp_path / "checkpoint.json")
+    checkpoint = Checkpoint(location, "s3://bucket/products/")
+    for n, (fragment, rows, batch) in enumerate(iter_batches(dataset, ["id"], batch_size=2)):
+        if n == 4:
+            break                                    # crash before committing this batch
+        checkpoint.commit(fragment, rows, batch.num_rows, indexed=batch.num_rows)
+
+    resumed = Checkpoint(location, "s3://bucket/products/")
+    assert resumed.load() and not resumed.complete
+    assert resumed.state["total_rows"] == resumed.state["indexed"] == 7
+    assert ids(iter_batches(dataset, ["id"], batch_size=2, start=resumed.position)) == [7, 8, 9]
+
+
+def test_a_checkpoint_for_another_input_is_refused(tmp_path):
+    location = str(tmp_path / "checkpoint.json")
+    Checkpoint(location, "s3://bucket/products/").finish()
+    assert not Checkpoint(str(tmp_path / "none.json"), "s3://bucket/products/").load()
+    with pytest.raises(ValueError, match="without --resume"):
+        Checkpoint(location, "s3://bucket/other/").load()
+
+
+def test_dead_letters_are_appended_as_json_lines(tmp_path):
+    location = str(tmp_path / "dead_letter.jsonl")
+    dead = DeadLetter(location)
+    dead.add("embed", RuntimeError("throttled"), [{"id": 1}, {"id": 2}], fragment="part-0")
+    dead.add("index", "mapping error", [{"id": 3}])
+    dead.flush()
+    records = read_dead_letter(location)
+    assert [(r["stage"], r["error"], r["rows"]) for r in records] == [
+        ("embed", "throttled", [{"id": 1}, {"id": 2}]), ("index", "mapping error", [{"id": 3}])
+    ]
+    assert records[0]["fragment"] == "part-0"
+    assert (dead.batches, dead.rows) == (2, 3)
+    with pytest.raises(FileNotFoundError):
+        read_dead_letter(str(tmp_path / "missing.jsonl"))
@@ -19,6 +19,8 @@ from opensearchpy import OpenSearch, RequestsHttpConnection, helpers
 
 from langchain_aws import BedrockEmbeddings
 
+from embedding_cache import EmbeddingCache
+
 # -------------------------------------------------------------
 # 0.  Config
 # -------------------------------------------------------------
@@ -31,6 +33,8 @@ OPENSEARCH_ENDPOINT= os.getenv("OPENSEARCH_ENDPOINT")
 INDEX_NAME         = os.getenv("INDEX_NAME", "products-embeddings")
 ROWS               = int(os.getenv("ROWS", "1000"))
 BATCH_SIZE         = int(os.getenv("BATCH_SIZE", "100"))
+MODEL_ID           = os.getenv("MODEL_ID", "amazon.titan-embed-text-v2:0")
+EMBED_CACHE        = os.getenv("EMBED_CACHE", "embedding_cache.sqlite")   # local path or s3:// URI
 
 assert BUCKET_NAME and OPENSEARCH_ENDPOINT, "BUCKET_NAME & OPENSEARCH_ENDPOINT required"
 
@@ -115,26 +119,40 @@ def safe_embed(emb, text: str, retries=5, backoff=4) -> List[float]:
 def main():
     df   = load_dataframe(ROWS)
 
-    embeddings = BedrockEmbeddings(model_id="amazon.titan-embed-text-v2:0")
+    embeddings = BedrockEmbeddings(model_id=MODEL_ID)
     client     = init_opensearch()
     ensure_index(client)
 
-    actions = []
-    for _, row in tqdm(df.iterrows(), total=len(df), desc="Embedding"):
-        vec = safe_embed(embeddings, row["text"])
-        actions.append({
-            "_index": INDEX_NAME,
-            "_source":{
-               "id":   str(row["id"]),
-               "text": row["text"],
-               "vector": vec
-            }
-        })
-
-    # Bulk upload
-    success, _ = helpers.bulk(client, actions, chunk_size=BATCH_SIZE, request_timeout=90)
-    failed = len(actions) - success
-    print(f"✅ Upload results: {success} succeeded, {failed} failed")
+    # Only texts not embedded by an earlier run go to Bedrock, and only
+    # documents that changed since they were last indexed are re-sent
+    cache = EmbeddingCache(EMBED_CACHE, MODEL_ID, 1024)
+    try:
+        vectors = cache.embed(
+            list(df["text"]),
+            lambda texts: [safe_embed(embeddings, text) for text in tqdm(texts, desc="Embedding")]
+        )
+
+        actions = []
+        for (_, row), vec in zip(df.iterrows(), vectors):
+            actions.append({
+                "_index": INDEX_NAME,
+                "_id":    str(row["id"]),
+                "id":     str(row["id"]),
+                "text":   row["text"],
+                "vector": vec
+            })
+        changed, hashes = cache.changed(INDEX_NAME, actions)
+        print(f"{len(changed)} of {len(actions)} documents new or changed")
+
+        # Bulk upload
+        success, errors = helpers.bulk(client, changed, chunk_size=BATCH_SIZE, request_timeout=90,
+                                       raise_on_error=False) if changed else (0, [])
+        rejected = {str(next(iter(error.values())).get("_id")) for error in errors}
+        cache.mark_indexed(INDEX_NAME, {doc_id: h for doc_id, h in hashes.items() if doc_id not in rejected})
+    finally:
+        cache.close()
+    print(cache.report())
+    print(f"✅ Upload results: {success} succeeded, {len(rejected)} failed")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
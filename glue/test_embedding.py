@@ -0,0 +1,107 @@
+import pytest
+
+from embedding import AdaptiveRateLimiter, Embedder, StandInBackend, Throttled, make_backend
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        pass
+
+
+def limiter(clock=None, **kwargs):
+    clock = clock or Clock()
+    return AdaptiveRateLimiter(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_slots_are_evenly_spaced_at_the_current_rate():
+    rates = limiter(rate=4.0)
+    assert [rates.acquire() for _ in range(3)] == pytest.approx([0, 0.25, 0.5])
+
+
+def test_success_adds_about_increase_per_second_up_to_the_cap():
+    rates = limiter(rate=5.0, increase=1.0, max_rate=6.0)
+    for _ in range(5):                 # about a second's worth at 5/s
+        rates.on_success()
+    assert 5.9 < rates.rate <= 6.0
+    for _ in range(100):
+        rates.on_success()
+    assert rates.rate == 6.0
+
+
+def test_a_throttle_cuts_the_rate_once_per_cooldown():
+    clock = Clock()
+    rates = limiter(clock, rate=8.0, decrease=0.5, cooldown=1.0, min_rate=1.5)
+    rates.on_throttle()
+    rates.on_throttle()                # same burst, already accounted for
+    assert rates.rate == 4.0
+    assert rates.next_slot == pytest.approx(clock.now + 0.25)
+
+    clock.now += 1.0
+    rates.on_throttle()
+    clock.now += 1.0
+    rates.on_throttle()
+    assert rates.rate == 1.5           # never below min_rate
+
+
+class FlakyBackend(StandInBackend):
+    """Throttles, then fails, a set number of times before answering."""
+
+    def __init__(self, throttles=0, errors=0, **kwargs):
+        super().__init__(dimensions=4, **kwargs)
+        self.throttles, self.errors = throttles, errors
+
+    def embed_batch(self, texts):
+        if self.throttles:
+            self.throttles -= 1
+            raise Throttled("slow down")
+        if self.errors:
+            self.errors -= 1
+            raise ConnectionError("reset")
+        return super().embed_batch(texts)
+
+
+def embedder(backend, **kwargs):
+    return Embedder(backend, limiter=limiter(rate=100.0), **kwargs)
+
+
+def test_vectors_come_back_in_input_order():
+    backend = StandInBackend(dimensions=4, max_batch=3)
+    texts = [f"product {i}" for i in range(10)]
+    embeddings = embedder(backend, batch_size=16, workers=4)
+    assert embeddings.batch_size == 3
+    assert embeddings.embed(texts) == [backend.vector(text) for text in texts]
+    assert embeddings.stats["requests"] == 4 and embeddings.stats["embedded"] == 10
+    embeddings.close()
+
+
+def test_throttles_back_off_and_retry_on_their_own_budget():
+    embeddings = embedder(FlakyBackend(throttles=3, errors=1), workers=1, max_retries=2)
+    assert len(embeddings.embed(["a"])) == 1
+    assert embeddings.stats["throttled"] == 3 and embeddings.stats["errors"] == 1
+    assert embeddings.limiter.rate < 100.0
+    embeddings.close()
+
+
+def test_running_out_of_retries_raises():
+    with pytest.raises(ConnectionError):
+        embedder(FlakyBackend(errors=2), workers=1, max_retries=2).embed(["a"])
+    with pytest.raises(RuntimeError, match="still throttled"):
+        embedder(FlakyBackend(throttles=3), workers=1, max_throttles=3).embed(["a"])
+
+
+def test_stand_in_vectors_are_deterministic_unit_vectors():
+    backend = StandInBackend(dimensions=8)
+    vector = backend.vector("milk")
+    assert vector == StandInBackend(dimensions=8).vector("milk") != backend.vector("bread")
+    assert sum(v * v for v in vector) == pytest.approx(1.0)
+
+
+def test_unknown_backends_are_rejected():
+    with pytest.raises(ValueError, match="Unknown embedding backend"):
+        make_backend("openai")
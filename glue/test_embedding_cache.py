@@ -0,0 +1,84 @@
+import pytest
+
+from embedding_cache import MAX_PARAMS, EmbeddingCache, doc_hash
+
+
+def fake_vector(text):
+    return [float(len(text)), 0.5, -0.25]
+
+
+class Embedder:
+    """embed_missing that records which texts it was asked for."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return [fake_vector(text) for text in texts]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), "titan", 3)
+    yield cache
+    cache.close()
+
+
+def test_each_distinct_text_is_embedded_once(cache):
+    embed = Embedder()
+    texts = ["milk", "bread", "milk", "eggs"]
+    assert cache.embed(texts, embed) == [fake_vector(text) for text in texts]
+    assert embed.calls == [["milk", "bread", "eggs"]]
+    assert cache.stats["misses"] == 3 and cache.stats["hits"] == 1
+
+    assert cache.embed(["eggs", "Milk", "bread"], embed) == [fake_vector("eggs"), fake_vector("Milk"), fake_vector("bread")]
+    assert embed.calls[1:] == [["Milk"]]     # case matters, unlike whitespace
+    assert cache.stats["hits"] == 3
+
+
+def test_keys_cover_model_dimensions_and_normalized_text(cache, tmp_path):
+    assert cache.key("whole  milk\n") == cache.key("whole milk")
+    assert cache.key("caf\u00e9") == cache.key("cafe\u0301")   # NFC and NFD forms
+    assert cache.key("milk") != EmbeddingCache(str(tmp_path / "other.sqlite"), "cohere", 3).key("milk")
+    assert cache.key("milk") != EmbeddingCache(str(tmp_path / "other.sqlite"), "titan", 1024).key("milk")
+
+
+def test_vectors_survive_reopening_the_file(tmp_path):
+    location = str(tmp_path / "cache.sqlite")
+    first = EmbeddingCache(location, "titan", 3)
+    first.embed(["milk"], Embedder())
+    first.close()
+
+    embed = Embedder()
+    again = EmbeddingCache(location, "titan", 3)
+    assert again.embed(["milk"], embed) == [fake_vector("milk")]
+    assert embed.calls == []
+    again.close()
+
+
+def test_lookups_larger_than_sqlites_parameter_limit(cache):
+    texts = [f"product {i}" for i in range(MAX_PARAMS + 50)]
+    cache.embed(texts, Embedder())
+    embed = Embedder()
+    assert cache.embed(texts, embed) == [fake_vector(text) for text in texts]
+    assert embed.calls == []
+
+
+def test_only_changed_documents_are_reindexed(cache):
+    docs = [{"_id": "1", "name": "milk", "vector": [1.0]}, {"_id": "2", "name": "bread", "vector": [2.0]}]
+    changed, hashes = cache.changed("products", docs)
+    assert changed == docs
+    cache.mark_indexed("products", hashes)
+
+    edited = [dict(docs[0], vector=[9.0]), dict(docs[1], name="rye bread")]
+    changed, hashes = cache.changed("products", edited)
+    assert changed == [edited[1]]            # a new vector alone is no change
+    assert cache.changed("products-v2", docs)[0] == docs
+    assert cache.stats["skipped_docs"] == 1
+
+
+def test_doc_hash_ignores_metadata_and_the_vector():
+    doc = {"_id": "1", "_index": "products", "name": "milk", "vector": [1.0]}
+    assert doc_hash(doc) == doc_hash({"name": "milk"})
+    assert doc_hash(doc, "titan") != doc_hash(doc, "cohere")
@@ -0,0 +1,51 @@
+import itertools
+import threading
+import time
+
+import pytest
+
+from pipeline import stream
+
+
+def test_stages_run_in_order_on_every_item():
+    assert list(stream(range(5), lambda x: x + 1, lambda x: x * 10)) == [10, 20, 30, 40, 50]
+    assert list(stream([], lambda x: x)) == []
+
+
+def test_a_slow_consumer_holds_back_the_source():
+    produced = itertools.count()
+
+    def source():
+        for i in itertools.count():
+            next(produced)
+            yield i
+
+    items = stream(source(), lambda x: x, queue_size=1)
+    assert next(items) == 0
+    time.sleep(0.3)
+    # One item in each of the two queues, one in the stage, one held by the
+    # blocked source, and the one handed out
+    assert next(produced) <= 5
+    items.close()
+
+
+@pytest.mark.parametrize("where", ["source", "stage"])
+def test_a_failure_anywhere_is_raised_and_stops_the_threads(where):
+    def source():
+        yield from range(3)
+        if where == "source":
+            raise OSError("read failed")
+        yield from range(3, 10)
+
+    def stage(x):
+        if where == "stage" and x == 3:
+            raise ValueError("bad batch")
+        return x
+
+    before = threading.active_count()
+    got = []
+    with pytest.raises(OSError if where == "source" else ValueError):
+        for item in stream(source(), stage, stage):
+            got.append(item)
+    assert got == [0, 1, 2]
+    assert threading.active_count() == before
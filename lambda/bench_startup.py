@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Measure cold-start cost of the receipt Lambdas.
+
+Each run starts a fresh interpreter (as a new Lambda execution environment
+would) and times importing the handler module, creating its first AWS
+client, and a first and second invocation with a representative request:
+a history page, an upload-URL request, and an S3 event for one receipt.
+AWS calls are answered by botocore Stubbers, so the invocations run the
+real request building and response parsing but no network round trips;
+those come on top in a deployed Lambda. Reports the median over --runs.
+
+Usage: python bench_startup.py [--runs N] [lambda ...]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+USER_ID = "bench_user"
+
+
+def stub(client, responses):
+    """Activates a Stubber on client answering each (operation, response) in turn."""
+    from botocore.stub import Stubber
+
+    stubber = Stubber(client)
+    for operation, response in responses:
+        # Copied, since resource clients deserialize responses in place
+        stubber.add_response(operation, json.loads(json.dumps(response)))
+    stubber.activate()
+    return stubber
+
+
+def history_event(module, calls):
+    """GET of a user's first page: the ETag's version GetItem, then the index Query."""
+    receipt = {
+        "id":           {"S": "0f6c1e5e-6c57-5b8f-9a53-3d8a4b2f1c11"},
+        "user_id":      {"S": USER_ID},
+        "shop":         {"S": "Sainsbury's"},
+        "receipt_ts":   {"S": "2024-05-12T14:02:00"},
+        "upload_time":  {"S": "2024-05-12T14:05:31+00:00"},
+        "total":        {"N": "56.03"},
+        "item_count":   {"N": "34"},
+    }
+    stub(module.get_table().meta.client, [
+        ("get_item", {"Item": {"version": {"N": "7"}, "updated_at": {"N": "0"}}}),
+        ("query", {"Items": [receipt] * 20, "Count": 20, "ScannedCount": 20}),
+    ] * calls)
+    return {
+        "httpMethod":            "GET",
+        "resource":              "/receipt_history",
+        "queryStringParameters": {"user_id": USER_ID, "limit": "20", "fields": "id,shop,receipt_ts,total"},
+        "headers":               {"Accept-Encoding": "gzip"},
+    }
+
+
+def uploader_event(module, calls):
+    """Presigned PUT URL request; presigning signs locally and sends nothing."""
+    return {
+        "httpMethod": "POST",
+        "resource":   module.UPLOAD_URL_PATH,
+        "headers":    {"user-id": USER_ID},
+        "body":       json.dumps({"content_type": "image/jpeg", "content_length": 245760}),
+    }
+
+
+def scanner_event(module, calls):
+    """S3 event for one JPEG: AnalyzeExpense, parse, one BatchWriteItem."""
+    from bench_parser import synthetic_response
+
+    stub(module.get_textract(), [("analyze_expense", synthetic_response(40))] * calls)
+    stub(module.get_dynamodb().meta.client, [("batch_write_item", {"UnprocessedItems": {}})] * calls)
+    return {"Records": [{
+        "eventSource": "aws:s3",
+        "s3": {"bucket": {"name": "bench-bucket"}, "object": {"key": f"{USER_ID}/receipt.jpg"}}
+    }]}
+
+
+# folder -> (module, client factory, event factory)
+LAMBDAS = {
+    "receipt_scanner":  ("receipt_processor", "get_textract", scanner_event),
+    "receipt_uploader": ("receipt_uploader", "get_s3", uploader_event),
+    "receipt_history":  ("receipt_history", "get_table", history_event),
+}
+
+PHASES = ("import_ms", "client_ms", "first_call_ms", "second_call_ms")
+
+
+def child(name):
+    """Runs in the fresh interpreter; prints one JSON line of timings."""
+    module_name, factory, make_event = LAMBDAS[name]
+    folder = os.path.join(HERE, name)
+    sys.path.insert(0, folder)
+    os.chdir(folder)
+
+    start = time.perf_counter()
+    module = __import__(module_name)
+    imported = time.perf_counter()
+    getattr(module, factory)()
+    client_ready = time.perf_counter()
+    event = make_event(module, calls=2)
+    responses = []
+
+    first_start = time.perf_counter()
+    responses.append(module.lambda_handler(json.loads(json.dumps(event)), None))
+    first = time.perf_counter()
+    responses.append(module.lambda_handler(json.loads(json.dumps(event)), None))
+    second = time.perf_counter()
+    for response in responses:
+        if response.get("statusCode", 200) != 200 or response.get("failed"):
+            raise SystemExit(f"{name} did not handle the benchmark event: {response}")
+
+    print(json.dumps({
+        "import_ms":      (imported - start) * 1000,
+        "client_ms":      (client_ready - imported) * 1000,
+        "first_call_ms":  (first - first_start) * 1000,
+        "second_call_ms": (second - first) * 1000,
+    }))
+
+
+def measure(name, runs):
+    env = dict(os.environ)
+    env.setdefault("AWS_DEFAULT_REGION", "eu-west-2")
+    env.setdefault("RECEIPTS_BUCKET", "bench-bucket")
+    # Presigning needs credentials, though nothing is sent; the scanner must
+    # not reach for the parse cache or aggregates tables, which aren't stubbed
+    if not any(k in env for k in ("AWS_ACCESS_KEY_ID", "AWS_PROFILE")):
+        env.update(AWS_ACCESS_KEY_ID="bench", AWS_SECRET_ACCESS_KEY="bench")
+    for var in ("PARSE_CACHE_TABLE", "AGGREGATES_TABLE"):
+        env.pop(var, None)
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", name],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        timings = json.loads(out.strip().splitlines()[-1])
+        timings["process_ms"] = (time.perf_counter() - start) * 1000
+        samples.append(timings)
+    return {k: statistics.median(s[k] for s in samples) for k in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("lambdas", nargs="*", help=f"any of {', '.join(LAMBDAS)} (default: all)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    unknown = set(args.lambdas) - set(LAMBDAS)
+    if unknown:
+        parser.error(f"unknown lambda(s): {', '.join(sorted(unknown))}")
+
+    columns = PHASES + ("process_ms",)
+    print(f"{'lambda':<18} | " + " | ".join(f"{c:>14}" for c in columns))
+    print("-" * (21 + 17 * len(columns)))
+    for name in args.lambdas or LAMBDAS:
+        result = measure(name, args.runs)
+        print(f"{name:<18} | " + " | ".join(f"{result[c]:>14.1f}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,45 @@
 import json
-import urllib.parse
-import urllib.request
 import logging
+import os
 
-NCBI_BASE_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+from ncbi_client import get_client
+from page_prefetch import PagePrefetcher
+from pubmed_xml import iter_articles, parse_fields
+
+ESEARCH = "esearch.fcgi"
+EFETCH  = "efetch.fcgi"
+
+# fetch=true pages through the NCBI history server (WebEnv + query_key);
+# clients request the next page with the returned next_retstart. Setting
+# this to "true" also starts loading that page in the container, but Lambda
+# freezes it when the handler returns, so the load runs during the
+# container's next invocation (on its rate budget and connections), and is
+# wasted whenever the next page request lands on another container.
+PREFETCH_NEXT_PAGE = os.getenv("PREFETCH_NEXT_PAGE", "false").lower() == "true"
+MAX_PAGE_SIZE      = 500
+MAX_SEARCH_IDS     = 10000
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Only kept when prefetching is on; otherwise every page is fetched directly
+_prefetcher = PagePrefetcher() if PREFETCH_NEXT_PAGE else None
+
+
+def fetch_page(db, webenv, query_key, retstart, retmax, fields):
+    """One page of a history-server result set, as compact article dicts."""
+    efetch_params = {
+        "db": db,
+        "WebEnv": webenv,
+        "query_key": query_key,
+        "retstart": retstart,
+        "retmax": retmax,
+        "retmode": "xml"
+    }
+    with get_client().stream(EFETCH, efetch_params) as xml_stream:
+        return list(iter_articles(xml_stream, fields))
+
+
 def lambda_handler(event, context):
     cors_headers = {
         "Access-Control-Allow-Origin": "*",
@@ -20,6 +52,9 @@ def lambda_handler(event, context):
     logger.info("Parsed query parameters: %s", json.dumps(query_params))
     term = query_params.get("term", "")
     retmax = query_params.get("retmax", "10")
+    retstart = query_params.get("retstart", "0")
+    webenv = query_params.get("webenv")
+    query_key = query_params.get("query_key") or query_params.get("querykey")
     db = "pubmed"
 
     year_from = query_params.get("yearFrom")
@@ -27,14 +62,31 @@ def lambda_handler(event, context):
     journal_type = query_params.get("journalType")
     full_text_only = query_params.get("fullTextOnly", "").lower() == "true"
     sort_by = query_params.get("sortBy", "").lower()
+    fetch = query_params.get("fetch", "false").lower() == "true"
 
-    if not term:
+    # A later page of an earlier search needs only its WebEnv and query_key
+    paging = fetch and bool(webenv and query_key)
+
+    if not term and not paging:
         return {
             "statusCode": 400,
             "body": json.dumps({"error": "Missing search term"}),
             "headers": cors_headers
         }
 
+    try:
+        fields = parse_fields(query_params.get("fields"))
+        retstart, retmax = int(retstart), int(retmax)
+        low, high = (1, MAX_PAGE_SIZE) if fetch else (0, MAX_SEARCH_IDS)
+        if retstart < 0 or not low <= retmax <= high:
+            raise ValueError(f"retstart must be >= 0 and retmax between {low} and {high}")
+    except ValueError as e:
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"error": str(e)}),
+            "headers": cors_headers
+        }
+
     term_clauses = [term]
     if year_from and year_to:
         term_clauses.append(f"{year_from}:{year_to}[pdat]")
@@ -54,52 +106,47 @@ def lambda_handler(event, context):
         "term": "".join(term_clauses),
         "retmode": "json",
         "retmax": retmax,
+        "retstart": retstart,
         "usehistory": "y"
     }
 
     if sort_by == "most recent":
         params["sort"] = "pub+date"
 
-    url = f"{NCBI_BASE_URL}?{urllib.parse.urlencode(params)}"
-    try:
-        with urllib.request.urlopen(url) as response:
-            data = json.loads(response.read().decode())
-    except Exception as e:
-        return {
-            "statusCode": 500,
-            "body": json.dumps({"error": str(e)}),
-            "headers": cors_headers
-        }
-
-    # EFetch support
-    if query_params.get("fetch", "false").lower() == "true":
-        ids = data.get("esearchresult", {}).get("idlist", [])
-        if not ids:
+    count = None
+    if not paging:
+        # With fetch=true the search only has to post its results to the
+        # history server; the articles come from EFetch
+        if fetch:
+            params["retmax"] = 0
+        try:
+            data = json.loads(get_client().get(ESEARCH, params))
+        except Exception as e:
+            return {
+                "statusCode": 500,
+                "body": json.dumps({"error": str(e)}),
+                "headers": cors_headers
+            }
+        esearch_result = data.get("esearchresult", {})
+        count = esearch_result.get("count")
+        webenv, query_key = esearch_result.get("webenv"), esearch_result.get("querykey")
+
+    # EFetch support: one page of articles, as compact JSON with only the
+    # requested fields, read from the history server rather than by ID
+    if fetch:
+        if count is not None and int(count) == 0:
             return {
                 "statusCode": 404,
                 "body": json.dumps({"error": "No IDs found to fetch"}),
                 "headers": cors_headers
             }
 
-        efetch_base = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
-        efetch_params = {
-            "db": db,
-            "id": ",".join(ids),
-            "retmode": "xml"
-        }
-
-        efetch_url = f"{efetch_base}?{urllib.parse.urlencode(efetch_params)}"
+        page_key = (db, webenv, query_key, retstart, retmax, fields)
         try:
-            with urllib.request.urlopen(efetch_url) as efetch_response:
-                efetch_data = efetch_response.read().decode()
-                return {
-                    "statusCode": 200,
-                    "body": efetch_data,
-                    "headers": {
-                        "Content-Type": "application/xml",
-                        **cors_headers
-                    }
-                }
+            if _prefetcher is not None:
+                articles = _prefetcher.get(page_key, lambda: fetch_page(*page_key))
+            else:
+                articles = fetch_page(*page_key)
         except Exception as e:
             return {
                 "statusCode": 500,
@@ -107,12 +154,39 @@ def lambda_handler(event, context):
                 "headers": cors_headers
             }
 
+        # A full page means there may be another
+        next_retstart = retstart + retmax if len(articles) == retmax else None
+        if count is not None and next_retstart is not None and next_retstart >= int(count):
+            next_retstart = None
+        if _prefetcher is not None and next_retstart is not None:
+            next_key = (db, webenv, query_key, next_retstart, retmax, fields)
+            _prefetcher.prefetch(next_key, lambda: fetch_page(*next_key))
+
+        page = {
+            "query": params["term"] if not paging else None,
+            "count": count,
+            "webenv": webenv,
+            "querykey": query_key,
+            "retstart": retstart,
+            "retmax": retmax,
+            "next_retstart": next_retstart,
+            "articles": articles
+        }
+        return {
+            "statusCode": 200,
+            "body": json.dumps(page, separators=(",", ":")),
+            "headers": {
+                "Content-Type": "application/json",
+                **cors_headers
+            }
+        }
+
     result = {
         "query": params["term"],
-        "count": data.get("esearchresult", {}).get("count"),
-        "ids": data.get("esearchresult", {}).get("idlist", []),
-        "webenv": data.get("esearchresult", {}).get("webenv"),
-        "querykey": data.get("esearchresult", {}).get("querykey"),
+        "count": count,
+        "ids": esearch_result.get("idlist", []),
+        "webenv": webenv,
+        "querykey": query_key,
     }
 
     return {
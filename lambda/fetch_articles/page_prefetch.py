@@ -0,0 +1,67 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger()
+
+# Prefetched pages kept per container, and how long one stays usable
+PREFETCH_SLOTS = int(os.getenv("PREFETCH_SLOTS", "8"))
+PREFETCH_TTL   = int(os.getenv("PREFETCH_TTL", "300"))
+
+
+class PagePrefetcher:
+    """
+    Loads the next page of a paged result in the background, so the
+    client's next request finds it ready. prefetch(key, load) starts load()
+    on a worker thread; get(key, load) takes the prefetched result (waiting
+    if it is still in flight) or calls load() itself. Each prefetched page
+    is handed out once.
+
+    Lambda freezes threads between invocations, so a prefetch started at the
+    end of one request only runs during the next one in that container, and
+    is duplicated if the next page is requested from another container;
+    fetch_articles therefore only prefetches with PREFETCH_NEXT_PAGE=true.
+    The worker threads are started by the first prefetch(), not before.
+    """
+
+    def __init__(self, slots=PREFETCH_SLOTS, ttl=PREFETCH_TTL, workers=2, clock=time.monotonic):
+        self.slots    = slots
+        self.ttl      = ttl
+        self.clock    = clock
+        self.pending  = OrderedDict()
+        self.stats    = {"hits": 0, "misses": 0, "prefetched": 0, "failed": 0}
+        self.lock     = threading.Lock()
+        self.workers  = workers
+        self.executor = None
+
+    def _count(self, counter):
+        with self.lock:
+            self.stats[counter] += 1
+
+    def prefetch(self, key, load):
+        with self.lock:
+            if key in self.pending:
+                return
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prefetch")
+            self.pending[key] = (self.executor.submit(load), self.clock())
+            self.stats["prefetched"] += 1
+            while len(self.pending) > self.slots:
+                self.pending.popitem(last=False)[1][0].cancel()
+
+    def get(self, key, load):
+        with self.lock:
+            future, started = self.pending.pop(key, (None, 0))
+        if future is not None and self.clock() - started <= self.ttl:
+            try:
+                result = future.result()
+                self._count("hits")
+                return result
+            except Exception as e:
+                self._count("failed")
+                logger.warning("Prefetch of %s failed, loading again: %s", key, e)
+        self._count("misses")
+        return load()
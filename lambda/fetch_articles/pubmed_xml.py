@@ -0,0 +1,119 @@
+import xml.etree.ElementTree as ET
+
+# Fields fetch=true can return; `id` (the PMID) is always included
+FIELDS = ("title", "abstract", "authors", "journal", "date", "doi")
+
+MONTHS = {
+    "jan": "01", "feb": "02", "mar": "03", "apr": "04", "may": "05", "jun": "06",
+    "jul": "07", "aug": "08", "sep": "09", "oct": "10", "nov": "11", "dec": "12"
+}
+
+
+def parse_fields(raw):
+    """
+    Requested fields from a comma-separated `fields` parameter (all when
+    empty). Raises ValueError naming any unknown field.
+    """
+    if not raw:
+        return FIELDS
+    fields = tuple(dict.fromkeys(f.strip().lower() for f in raw.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}; expected any of {', '.join(FIELDS)}")
+    return fields
+
+
+def _text(elem):
+    """All text inside elem (titles carry inline <i>, <sup>, ...), whitespace-collapsed."""
+    return " ".join("".join(elem.itertext()).split()) if elem is not None else None
+
+
+def _authors(article):
+    authors = []
+    for author in article.iterfind("AuthorList/Author"):
+        collective = author.findtext("CollectiveName")
+        if collective:
+            authors.append(collective)
+        else:
+            name = " ".join(filter(None, (author.findtext("LastName"), author.findtext("Initials"))))
+            if name:
+                authors.append(name)
+    return authors
+
+
+def _abstract(article):
+    parts = []
+    for section in article.iterfind("Abstract/AbstractText"):
+        text, label = _text(section), section.get("Label")
+        if text:
+            parts.append(f"{label}: {text}" if label else text)
+    return "\n".join(parts) or None
+
+
+def _date(article):
+    """Publication date as "YYYY", "YYYY-MM" or "YYYY-MM-DD", or the raw MedlineDate."""
+    pub_date = article.find("Journal/JournalIssue/PubDate")
+    if pub_date is None:
+        return None
+    year = pub_date.findtext("Year")
+    if not year:
+        return pub_date.findtext("MedlineDate")
+    parts = [year]
+    month = (pub_date.findtext("Month") or "").strip()
+    if month:
+        parts.append(MONTHS.get(month[:3].lower(), month.zfill(2)))
+        day = pub_date.findtext("Day")
+        if day:
+            parts.append(day.zfill(2))
+    return "-".join(parts)
+
+
+def _doi(citation_article, pubmed_data):
+    if pubmed_data is not None:
+        for article_id in pubmed_data.iterfind("ArticleIdList/ArticleId"):
+            if article_id.get("IdType") == "doi":
+                return article_id.text
+    for location in citation_article.iterfind("ELocationID"):
+        if location.get("EIdType") == "doi":
+            return location.text
+    return None
+
+
+def compact_article(elem, fields=FIELDS):
+    """Compact dict of the requested fields from one <PubmedArticle>."""
+    citation = elem.find("MedlineCitation")
+    article = citation.find("Article")
+    record = {"id": citation.findtext("PMID")}
+    if "title" in fields:
+        record["title"] = _text(article.find("ArticleTitle"))
+    if "abstract" in fields:
+        record["abstract"] = _abstract(article)
+    if "authors" in fields:
+        record["authors"] = _authors(article)
+    if "journal" in fields:
+        record["journal"] = article.findtext("Journal/Title")
+    if "date" in fields:
+        record["date"] = _date(article)
+    if "doi" in fields:
+        record["doi"] = _doi(article, elem.find("PubmedData"))
+    return record
+
+
+def iter_articles(stream, fields=FIELDS):
+    """
+    Yields a compact dict per <PubmedArticle> in an EFetch XML stream.
+    Parses incrementally and frees each article once converted, so memory
+    stays flat however many articles the response holds. Book records
+    (<PubmedBookArticle>) are skipped.
+    """
+    root = None
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if root is None:
+            root = elem
+        if event != "end" or elem.tag not in ("PubmedArticle", "PubmedBookArticle"):
+            continue
+        if elem.tag == "PubmedArticle":
+            yield compact_article(elem, fields)
+        # Drop the finished article from the tree as well as its contents
+        elem.clear()
+        root.clear()
@@ -0,0 +1,23 @@
+import threading
+
+from page_prefetch import PagePrefetcher
+
+
+def prefetch_threads():
+    return [t for t in threading.enumerate() if t.name.startswith("prefetch")]
+
+
+def test_no_worker_threads_until_something_is_prefetched():
+    before = len(prefetch_threads())
+    prefetcher = PagePrefetcher()
+    assert prefetcher.get("page 1", lambda: "loaded") == "loaded"
+    assert prefetcher.executor is None
+    assert len(prefetch_threads()) == before
+
+
+def test_a_prefetched_page_is_handed_out_once():
+    prefetcher = PagePrefetcher()
+    prefetcher.prefetch("page 2", lambda: "prefetched")
+    assert prefetcher.get("page 2", lambda: "loaded") == "prefetched"
+    assert prefetcher.get("page 2", lambda: "loaded") == "loaded"
+    assert prefetcher.stats == {"hits": 1, "misses": 1, "prefetched": 1, "failed": 0}
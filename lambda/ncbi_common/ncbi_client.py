@@ -0,0 +1,340 @@
+import gzip
+import hashlib
+import http.client
+import logging
+import math
+import os
+import queue
+import threading
+import time
+import urllib.parse
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+logger = logging.getLogger()
+
+# Shared by the NCBI Lambdas (copied into each image from the ncbi_common
+# build context). Point NCBI_EUTILS_URL at a local HTTP stand-in to test.
+EUTILS_URL = os.getenv("NCBI_EUTILS_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils")
+
+# NCBI allows 3 requests/second per IP address, or 10 per API key. That
+# budget is shared by every container of every Lambda using the key, so
+# with NCBI_RATE_TABLE set they all draw from one DynamoDB-held bucket (see
+# SharedRateLimiter); without it each container only limits itself.
+NCBI_API_KEY    = os.getenv("NCBI_API_KEY")
+NCBI_RATE       = float(os.getenv("NCBI_RATE", "10" if NCBI_API_KEY else "3"))
+NCBI_RATE_TABLE = os.getenv("NCBI_RATE_TABLE")
+
+CONNECT_TIMEOUT = float(os.getenv("NCBI_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT    = float(os.getenv("NCBI_READ_TIMEOUT", "20"))
+POOL_SIZE       = int(os.getenv("NCBI_POOL_SIZE", "4"))
+MAX_RETRIES     = 3
+
+REQUEST_HEADERS = {"Accept-Encoding": "gzip", "Connection": "keep-alive"}
+
+# What a kept-alive connection raises when the server closed it while idle
+STALE_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+class NCBIError(Exception):
+    """Non-200 response from eutils; `code` is the HTTP status."""
+
+    def __init__(self, code, reason, body=""):
+        super().__init__(f"HTTP {code}: {reason}")
+        self.code = code
+        self.body = body
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, at most `capacity`
+    saved up. acquire() reserves a token and sleeps until it is due, so
+    concurrent callers are spaced out rather than all retrying at once.
+    The default capacity of 1 allows no burst: any one-second window holds
+    at most `rate` requests. It only sees this process's requests, while
+    NCBI counts per API key or IP; see SharedRateLimiter.
+    """
+
+    def __init__(self, rate=NCBI_RATE, capacity=1.0, clock=time.monotonic, sleep=time.sleep):
+        self.rate     = rate
+        self.capacity = capacity
+        self.clock    = clock
+        self.sleep    = sleep
+        self.tokens   = self.capacity
+        self.updated  = clock()
+        self.lock     = threading.Lock()
+
+    def acquire(self):
+        """Takes one token, waiting for it if needed. Returns the seconds waited."""
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            self.sleep(wait)
+        return wait
+
+
+class SharedRateLimiter:
+    """
+    Rate limiter shared by every container that uses the same DynamoDB item,
+    so concurrent Lambdas (fetch_articles, research_feed and its harvester)
+    stay under NCBI's limit together. The item holds the time the next
+    request may start; acquire() moves it on by 1/rate with a conditional
+    update (optimistic: a lost race re-reads the current value from the
+    failed update and tries again) and sleeps until its reserved slot, so
+    like TokenBucket with capacity 1 it allows no burst.
+    Falls back to a per-container TokenBucket if DynamoDB fails, rather than
+    failing the request.
+    """
+
+    ATTEMPTS = 10
+
+    def __init__(self, table, rate=NCBI_RATE, key=None, api_key=NCBI_API_KEY,
+                 clock=time.time, sleep=time.sleep):
+        # One item per API key (hashed, so the key isn't stored), or one
+        # for all keyless callers
+        if key is None:
+            key = "ncbi#" + (hashlib.sha256(api_key.encode()).hexdigest()[:16] if api_key else "no-key")
+        self.table    = table
+        self.key      = {"limiter": key}
+        self.interval = math.ceil(1000 / rate)   # ms between requests
+        self.clock    = clock
+        self.sleep    = sleep
+        self.next_at  = None                     # last value seen in the item, ms
+        self.lock     = threading.Lock()
+        self.fallback = TokenBucket(rate, clock=time.monotonic, sleep=sleep)
+
+    def acquire(self):
+        """Reserves the next slot, waiting for it if needed. Returns the seconds waited."""
+        try:
+            slot = self._reserve()
+        except Exception as e:
+            logger.warning("Shared NCBI rate limiter unavailable, limiting this container only: %s", e)
+            return self.fallback.acquire()
+        wait = max(0.0, slot / 1000 - self.clock())
+        if wait:
+            self.sleep(wait)
+        return wait
+
+    def _reserve(self):
+        """Start time (ms) of a slot claimed in the shared item."""
+        from botocore.exceptions import ClientError
+
+        with self.lock:
+            for _ in range(self.ATTEMPTS):
+                now = int(self.clock() * 1000)
+                expected = self.next_at
+                slot = max(now, expected or 0)
+                update = {
+                    "Key": self.key,
+                    "UpdateExpression": "SET next_at = :next",
+                    "ExpressionAttributeValues": {":next": slot + self.interval},
+                    "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+                }
+                if expected is None:
+                    # Nothing seen yet: only claim "now" if no one holds a later slot
+                    update["ConditionExpression"] = "attribute_not_exists(next_at) OR next_at <= :now"
+                    update["ExpressionAttributeValues"][":now"] = now
+                else:
+                    update["ConditionExpression"] = "next_at = :seen"
+                    update["ExpressionAttributeValues"][":seen"] = expected
+                try:
+                    self.table.update_item(**update)
+                except ClientError as e:
+                    if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                        raise
+                    # The failed update's ALL_OLD item comes back in wire format
+                    seen = e.response.get("Item", {}).get("next_at")
+                    if seen is None:
+                        self.next_at = None
+                    else:
+                        self.next_at = int(seen["N"] if isinstance(seen, dict) else seen)
+                    continue
+                self.next_at = slot + self.interval
+                return slot
+        raise RuntimeError(f"No NCBI rate slot after {self.ATTEMPTS} attempts")
+
+
+class NCBIClient:
+    """
+    eutils client over a small pool of keep-alive connections, so a warm
+    Lambda reuses its TCP/TLS session instead of handshaking per request.
+    Asks for gzip, applies separate connect and read timeouts, rate limits
+    every upstream request, retries 429s, and coalesces identical requests
+    that are in flight at the same time into a single upstream call.
+    """
+
+    def __init__(self, base_url=EUTILS_URL, api_key=NCBI_API_KEY, limiter=None, pool_size=POOL_SIZE,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, sleep=time.sleep):
+        url = urllib.parse.urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        self.host            = url.hostname
+        self.port            = url.port
+        self.path            = url.path.rstrip("/")
+        self.api_key         = api_key
+        self.limiter         = limiter
+        self.connect_timeout = connect_timeout
+        self.read_timeout    = read_timeout
+        self.sleep           = sleep
+        self.idle            = queue.LifoQueue(maxsize=pool_size)
+        self.in_flight       = {}
+        self.stats           = {"requests": 0, "connections": 0, "stale": 0, "coalesced": 0, "throttled": 0}
+        self.lock            = threading.Lock()
+
+    def _count(self, counter):
+        with self.lock:
+            self.stats[counter] += 1
+
+    def get(self, endpoint, params):
+        """
+        Decoded body of GET <base>/<endpoint>?<params>, e.g.
+        get("esearch.fcgi", {"db": "pubmed", "term": "..."}). Raises
+        NCBIError for non-200 responses and socket errors as they come.
+        """
+        key = f"{endpoint}?{urllib.parse.urlencode(params)}"
+        with self.lock:
+            future = self.in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self.in_flight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(self._fetch(key))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+        return future.result()
+
+    @contextmanager
+    def stream(self, endpoint, params):
+        """
+        Binary file-like body of GET <base>/<endpoint>?<params>, decompressed
+        as it is read, for parsing large responses (EFetch XML) without
+        holding them in memory. Not coalesced. The connection goes back to
+        the pool if the body was read to the end, and is closed otherwise.
+        """
+        conn, response = self._open_ok(f"{endpoint}?{urllib.parse.urlencode(params)}")
+        try:
+            if (response.getheader("Content-Encoding") or "").lower() == "gzip":
+                yield gzip.GzipFile(fileobj=response)
+            else:
+                yield response
+        finally:
+            self._release(conn, response)
+
+    def _fetch(self, key):
+        conn, response = self._open_ok(key)
+        return self._read(conn, response).decode("utf-8")
+
+    def _open_ok(self, key):
+        """
+        (connection, response) for a 200 response to key, rate limited and
+        retrying 429s; the body is left unread.
+        """
+        # The API key is added here so it never affects coalescing (or callers' cache keys)
+        path = f"{self.path}/{key}"
+        if self.api_key:
+            path += "&" + urllib.parse.urlencode({"api_key": self.api_key})
+        for attempt in range(1, MAX_RETRIES + 1):
+            if self.limiter is not None:
+                self.limiter.acquire()
+            conn, response = self._open(path)
+            if response.status == 200:
+                return conn, response
+            body = self._read(conn, response).decode("utf-8", "replace")
+            if response.status != 429 or attempt == MAX_RETRIES:
+                raise NCBIError(response.status, response.reason, body)
+            self._count("throttled")
+            logger.warning("NCBI throttled %s, retry %d", key.split("?", 1)[0], attempt)
+            self.sleep(attempt)
+
+    def _open(self, path):
+        """(connection, response) over an idle pooled connection, or a new one."""
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = None
+        if conn is not None:
+            try:
+                return conn, self._send(conn, path)
+            except STALE_ERRORS:
+                # Closed by the server while idle: safe to resend, it's a GET
+                self._count("stale")
+        conn = self._connect()
+        return conn, self._send(conn, path)
+
+    def _connect(self):
+        conn = self.connection_class(self.host, self.port, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.read_timeout)
+        self._count("connections")
+        return conn
+
+    def _send(self, conn, path):
+        try:
+            conn.request("GET", path, headers=REQUEST_HEADERS)
+            response = conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+        self._count("requests")
+        return response
+
+    def _read(self, conn, response):
+        """Whole (decompressed) body; the connection is released either way."""
+        try:
+            body = response.read()
+        finally:
+            self._release(conn, response)
+        if (response.getheader("Content-Encoding") or "").lower() == "gzip":
+            body = gzip.decompress(body)
+        return body
+
+    def _release(self, conn, response):
+        """Back to the pool if the response was read to the end and the connection stays open."""
+        if response.will_close or not response.isclosed():
+            conn.close()
+            return
+        try:
+            self.idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_client      = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    The process-wide client, created on first use and kept for warm
+    invocations, so its connections and rate limiter are shared by every
+    request the container handles.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            if NCBI_RATE_TABLE:
+                import boto3
+
+                limiter = SharedRateLimiter(boto3.resource("dynamodb").Table(NCBI_RATE_TABLE))
+            else:
+                limiter = TokenBucket()
+            _client = NCBIClient(limiter=limiter)
+        return _client
@@ -0,0 +1,85 @@
+import pytest
+from botocore.exceptions import ClientError
+
+from ncbi_client import SharedRateLimiter, TokenBucket
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+
+
+class FakeTable:
+    """The conditional update_item SharedRateLimiter sends, on one item per key."""
+
+    def __init__(self):
+        self.items = {}
+        self.updates = 0
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression, ExpressionAttributeValues,
+                    ReturnValuesOnConditionCheckFailure):
+        self.updates += 1
+        item = self.items.get(Key["limiter"])
+        values = ExpressionAttributeValues
+        if ConditionExpression.startswith("attribute_not_exists"):
+            ok = item is None or item["next_at"] <= values[":now"]
+        else:
+            ok = item is not None and item["next_at"] == values[":seen"]
+        if not ok:
+            old = {"next_at": {"N": str(item["next_at"])}} if item else {}
+            raise ClientError({"Error": {"Code": "ConditionalCheckFailedException"}, "Item": old}, "UpdateItem")
+        self.items[Key["limiter"]] = {"next_at": values[":next"]}
+
+
+def test_token_bucket_spaces_requests_by_the_rate():
+    clock = Clock()
+    bucket = TokenBucket(rate=4, clock=clock, sleep=clock.sleep)
+    waits = [bucket.acquire() for _ in range(3)]
+    assert waits == pytest.approx([0, 0.25, 0.5])
+
+
+def test_limiters_sharing_a_table_share_one_budget():
+    # Two containers at the same instant: between them, one request per 100 ms
+    clock = Clock()
+    table = FakeTable()
+    first, second = (SharedRateLimiter(table, rate=10, key="ncbi#test", clock=clock, sleep=clock.sleep)
+                     for _ in range(2))
+    waits = [limiter.acquire() for limiter in (first, second, first, second)]
+    assert waits == pytest.approx([0, 0.1, 0.2, 0.3])
+    assert table.items["ncbi#test"]["next_at"] == 1000 * 1000 + 400
+
+
+def test_a_slot_in_the_past_is_not_reused():
+    clock = Clock()
+    table = FakeTable()
+    limiter = SharedRateLimiter(table, rate=10, key="ncbi#test", clock=clock, sleep=clock.sleep)
+    limiter.acquire()
+    clock.now += 5
+    assert limiter.acquire() == 0
+    assert table.items["ncbi#test"]["next_at"] == 1005 * 1000 + 100
+
+
+def test_keys_are_per_api_key_and_do_not_store_it():
+    table = FakeTable()
+    assert SharedRateLimiter(table, api_key=None).key == {"limiter": "ncbi#no-key"}
+    key = SharedRateLimiter(table, api_key="secret").key["limiter"]
+    assert key.startswith("ncbi#") and "secret" not in key
+    assert key != SharedRateLimiter(table, api_key="other").key["limiter"]
+
+
+def test_falls_back_to_this_container_when_dynamodb_fails():
+    class BrokenTable:
+        def update_item(self, **kwargs):
+            raise ClientError({"Error": {"Code": "AccessDeniedException"}}, "UpdateItem")
+
+    clock = Clock()
+    limiter = SharedRateLimiter(BrokenTable(), rate=10, key="ncbi#test", clock=clock, sleep=clock.sleep)
+    limiter.fallback = TokenBucket(rate=10, clock=clock, sleep=clock.sleep)
+    assert [limiter.acquire() for _ in range(2)] == pytest.approx([0, 0.1])
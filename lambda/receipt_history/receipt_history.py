@@ -1,25 +1,416 @@
 import os
 import json
+import re
+import gzip
+import time
+import base64
+import hashlib
+import logging
+import binascii
+from decimal import Decimal
 import boto3
+from botocore.config import Config
 from boto3.dynamodb.conditions import Key
 
+try:
+    import brotli
+except ImportError:  # responses are gzip-compressed only
+    brotli = None
+
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*',
     'Access-Control-Allow-Methods': 'GET,OPTIONS',
-    'Access-Control-Allow-Headers': 'Content-Type,Authorization'
+    'Access-Control-Allow-Headers': 'Content-Type,Authorization,If-None-Match',
+    'Access-Control-Expose-Headers': 'ETag'
 }
 
 # DynamoDB table and index names from environment
 TABLE_NAME = os.environ.get('DDB_TABLE', 'ReceiptsTable')
 USER_INDEX = os.environ.get('USER_INDEX', 'user_id-index')
 
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(TABLE_NAME)
+# user_id + receipt_ts (ISO receipt date), used for `from` / `to` range queries
+TIME_INDEX = os.environ.get('TIME_INDEX', 'user_id-receipt_ts-index')
+TIME_RE    = re.compile(r'^\d{4}-\d{2}-\d{2}(T\d{2}:\d{2}(:\d{2})?)?$')
+
+# Per-user, per-month, per-shop spend kept up to date by the scanner, served
+# on SUMMARY_PATH: user_id (hash), period_shop = "YYYY-MM#Shop" (range)
+AGGREGATES_TABLE = os.environ.get('AGGREGATES_TABLE', 'ReceiptSpendAggregates')
+SUMMARY_PATH     = os.environ.get('SUMMARY_PATH', '/receipt-summary')
+MONTH_RE         = re.compile(r'^\d{4}-\d{2}$')
+
+# Conditional GETs: the scanner bumps a per-user version item in the
+# aggregates table whenever it saves receipts, and ETags are built from it,
+# so an unchanged poll costs one GetItem and returns 304. Right after a
+# change no ETag is given for INDEX_SETTLE_SECONDS, since the GSIs may not
+# show the new receipts yet and a 304 would then pin the stale page.
+VERSION_KEY          = '#version'
+INDEX_SETTLE_SECONDS = int(os.environ.get('INDEX_SETTLE_SECONDS', '10'))
+CACHE_CONTROL        = 'private, no-cache'
+
+# Bodies at least this large are compressed when the client accepts it
+MIN_COMPRESS_BYTES = int(os.environ.get('MIN_COMPRESS_BYTES', '1024'))
+
+# Page size: `limit` query parameter, capped at MAX_LIMIT
+DEFAULT_LIMIT = int(os.environ.get('HISTORY_DEFAULT_LIMIT', '50'))
+MAX_LIMIT     = int(os.environ.get('HISTORY_MAX_LIMIT', '200'))
+
+# Line items of receipts the scanner saved with its "normalized" layout:
+# one item per line, keyed by receipt_id + line_no, instead of `contents`
+ITEMS_TABLE = os.environ.get('ITEMS_TABLE', 'ReceiptItemsTable')
+LINE_KEYS   = ('receipt_id', 'line_no', 'user_id')
+
+# Lines of a page's normalized receipts are read together with
+# BatchGetItem, LINE_BATCH_SIZE keys per call (DynamoDB's maximum), and
+# unprocessed keys are asked for again up to LINE_ATTEMPTS times in all
+LINE_BATCH_SIZE = 100
+LINE_ATTEMPTS   = 5
+
+# Attributes a client may ask for with `fields=`; list views typically want
+# the summary ones and leave out `contents` (every line item)
+FIELDS = (
+    'id', 'user_id', 'shop', 'receipt_time', 'receipt_ts', 'upload_time',
+    'total', 'item_count', 'source', 'layout', 'contents'
+)
+
+# Created on first use and kept for warm invocations, with the connection
+# held open between them
+CLIENT_CONFIG = Config(tcp_keepalive=True, connect_timeout=5, read_timeout=30)
+_dynamodb = None
+_tables = {}
+
+def get_dynamodb():
+    global _dynamodb
+    if _dynamodb is None:
+        _dynamodb = boto3.resource('dynamodb', config=CLIENT_CONFIG)
+    return _dynamodb
+
+def get_table(name=TABLE_NAME):
+    if name not in _tables:
+        _tables[name] = get_dynamodb().Table(name)
+    return _tables[name]
+
+def error(status, message):
+    return {
+        'statusCode': status,
+        'headers': CORS_HEADERS,
+        'body': json.dumps({'error': message})
+    }
+
+def encode_cursor(last_key, index):
+    """
+    Opaque continuation token for a query's LastEvaluatedKey, tagged with
+    the index it came from: the key of one index is no start key for another.
+    """
+    if not last_key:
+        return None
+    cursor = {'index': index, 'key': last_key}
+    raw = json.dumps(cursor, default=str, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, user_id, index):
+    """
+    ExclusiveStartKey for a token from encode_cursor. Raises ValueError for
+    anything that is not a cursor of this user's own query on index.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise ValueError('Invalid cursor')
+    last_key = cursor.get('key') if isinstance(cursor, dict) else None
+    if not isinstance(last_key, dict) or last_key.get('user_id') != user_id \
+            or not all(isinstance(v, str) for v in last_key.values()):
+        raise ValueError('Invalid cursor')
+    if cursor.get('index') != index:
+        raise ValueError('Cursor is for a different query; pass the same from / to as for the first page')
+    return last_key
+
+def parse_limit(raw):
+    if raw is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be at least 1')
+    return min(limit, MAX_LIMIT)
+
+def parse_fields(raw):
+    """Validated list of requested attributes, or None for all of them."""
+    if not raw:
+        return None
+    fields = list(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}; allowed: {', '.join(FIELDS)}")
+    return fields or None
+
+def time_range(params):
+    """
+    Key condition on receipt_ts for the `from` / `to` parameters (dates or
+    ISO date-times, both inclusive), or None when neither is given.
+    """
+    start, end = params.get('from'), params.get('to')
+    for value in (start, end):
+        if value and not TIME_RE.match(value):
+            raise ValueError('from and to must be ISO dates, e.g. 2024-05-12 or 2024-05-12T14:00')
+    # A bare `to` date covers the whole day: "2024-05-12\uffff" sorts after
+    # every "2024-05-12T..." timestamp
+    end = end + '\uffff' if end else None
+    if start and end:
+        return Key('receipt_ts').between(start, end)
+    if start:
+        return Key('receipt_ts').gte(start)
+    if end:
+        return Key('receipt_ts').lte(end)
+    return None
+
+def spend_summary(user_id, params):
+    """
+    Monthly spend for a user, per shop and in total, read from the
+    aggregates table: one item per month and shop, however many receipts.
+    Optional `from` / `to` (YYYY-MM) limit the months returned.
+    """
+    from_month = params.get('from') or '0000-00'
+    to_month = params.get('to') or '9999-99'
+    for month in (from_month, to_month):
+        if not MONTH_RE.match(month):
+            raise ValueError('from and to must be months, e.g. 2024-03')
+
+    condition = Key('user_id').eq(user_id) & \
+        Key('period_shop').between(from_month, to_month + '#\uffff')
+    items, start_key = [], None
+    while True:
+        query = {'KeyConditionExpression': condition}
+        if start_key:
+            query['ExclusiveStartKey'] = start_key
+        resp = get_table(AGGREGATES_TABLE).query(**query)
+        items.extend(resp.get('Items', []))
+        start_key = resp.get('LastEvaluatedKey')
+        if not start_key:
+            break
+
+    months = {}
+    for item in items:
+        # Left empty when a re-parsed receipt moved to another month or shop
+        if not item['receipt_count']:
+            continue
+        month = months.setdefault(item['month'], {
+            'month': item['month'],
+            'total': Decimal('0'),
+            'item_count': 0,
+            'receipt_count': 0,
+            'shops': []
+        })
+        shop = {
+            'shop': item['shop'],
+            'total': item['total'],
+            'item_count': int(item['item_count']),
+            'receipt_count': int(item['receipt_count'])
+        }
+        month['shops'].append(shop)
+        for field in ('total', 'item_count', 'receipt_count'):
+            month[field] += shop[field]
+
+    return {'user_id': user_id, 'months': list(months.values())}
+
+def line_items(receipt_id):
+    """A normalized receipt's line items in order, shaped like `contents` entries."""
+    items, start_key = [], None
+    while True:
+        query = {'KeyConditionExpression': Key('receipt_id').eq(receipt_id)}
+        if start_key:
+            query['ExclusiveStartKey'] = start_key
+        resp = get_table(ITEMS_TABLE).query(**query)
+        items.extend(resp.get('Items', []))
+        start_key = resp.get('LastEvaluatedKey')
+        if not start_key:
+            break
+    return [{k: v for k, v in item.items() if k not in LINE_KEYS} for item in items]
+
+def batch_line_items(receipts, attempts=LINE_ATTEMPTS, sleep=time.sleep):
+    """
+    {receipt id: line items} for normalized receipts, read with BatchGetItem
+    rather than a query per receipt. Their keys are known from the header's
+    item_count: line_no runs from 0 to item_count - 1.
+    """
+    keys = [
+        {'receipt_id': receipt['id'], 'line_no': line_no}
+        for receipt in receipts for line_no in range(int(receipt['item_count']))
+    ]
+    found = []
+    for i in range(0, len(keys), LINE_BATCH_SIZE):
+        pending = keys[i:i + LINE_BATCH_SIZE]
+        for attempt in range(attempts):
+            resp = get_dynamodb().batch_get_item(RequestItems={ITEMS_TABLE: {'Keys': pending}})
+            found.extend(resp.get('Responses', {}).get(ITEMS_TABLE, []))
+            pending = resp.get('UnprocessedKeys', {}).get(ITEMS_TABLE, {}).get('Keys', [])
+            if not pending:
+                break
+            sleep(min(0.05 * 2 ** attempt, 1.0))
+        if pending:
+            raise RuntimeError(f'{len(pending)} line items still unprocessed after retries')
+
+    lines = {receipt['id']: [] for receipt in receipts}
+    for item in sorted(found, key=lambda item: int(item['line_no'])):
+        lines[item['receipt_id']].append({k: v for k, v in item.items() if k not in LINE_KEYS})
+    return lines
+
+def receipt_page(user_id, params):
+    """
+    One page of the user's receipts (see lambda_handler for the parameters).
+    Raises ValueError for invalid parameters.
+    """
+    limit = parse_limit(params.get('limit'))
+    fields = parse_fields(params.get('fields'))
+    date_range = time_range(params)
+    index = USER_INDEX if date_range is None else TIME_INDEX
+    start_key = decode_cursor(params['cursor'], user_id, index) if params.get('cursor') else None
+
+    query = {
+        'IndexName': index,
+        'KeyConditionExpression': Key('user_id').eq(user_id),
+        'Limit': limit
+    }
+    if date_range is not None:
+        query.update({
+            'KeyConditionExpression': Key('user_id').eq(user_id) & date_range,
+            'ScanIndexForward': False
+        })
+    # Normalized receipts keep their lines in ITEMS_TABLE, found by id
+    want_contents = not fields or 'contents' in fields
+    helpers = [f for f in ('id', 'layout', 'item_count') if want_contents and fields and f not in fields]
+    if fields:
+        # Placeholders, since several attribute names are DynamoDB reserved words
+        names = {f'#f{i}': field for i, field in enumerate(fields + helpers)}
+        query['ProjectionExpression'] = ', '.join(names)
+        query['ExpressionAttributeNames'] = names
+    if start_key:
+        query['ExclusiveStartKey'] = start_key
+
+    # Query the GSI on user_id, one page at a time
+    resp = get_table().query(**query)
+    receipts = resp.get('Items', [])
+    if want_contents:
+        normalized = [r for r in receipts if r.get('layout') == 'normalized']
+        # Headers written without item_count can only be found by query
+        counted = [r for r in normalized if 'item_count' in r]
+        lines = batch_line_items(counted) if counted else {}
+        for receipt in receipts:
+            if receipt.get('id') in lines:
+                receipt['contents'] = lines[receipt['id']]
+            elif receipt.get('layout') == 'normalized':
+                receipt['contents'] = line_items(receipt['id'])
+            for field in helpers:
+                receipt.pop(field, None)
+    return {
+        'receipts': receipts,
+        'next_cursor': encode_cursor(resp.get('LastEvaluatedKey'), index)
+    }
+
+def header(event, name):
+    """Request header value by case-insensitive name, or ''."""
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value or ''
+    return ''
+
+def current_etag(event, user_id, params):
+    """
+    Weak ETag for this request: the user's receipts version plus the request
+    itself. None while a change is settling, or if there is no version to
+    build it from (it can't be read, or the scanner has never written one).
+    """
+    try:
+        item = get_table(AGGREGATES_TABLE).get_item(
+            Key={'user_id': user_id, 'period_shop': VERSION_KEY},
+            ProjectionExpression='#version, updated_at',
+            ExpressionAttributeNames={'#version': 'version'}
+        ).get('Item')
+    except Exception as e:
+        logging.warning('Could not read receipts version for %s: %s', user_id, e)
+        return None
+    if not item or 'version' not in item:
+        return None
+    if time.time() - int(item.get('updated_at', 0)) < INDEX_SETTLE_SECONDS:
+        return None
+    request = json.dumps([event.get('resource'), sorted(params.items())])
+    digest = hashlib.sha256(f"{item['version']}:{request}".encode('utf-8')).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match check, using weak comparison as RFC 9110 requires."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = lambda tag: tag.strip()[2:] if tag.strip().startswith('W/') else tag.strip()
+    return opaque(etag) in {opaque(tag) for tag in if_none_match.split(',')}
+
+def accepted_encodings(event):
+    accepted = set()
+    for part in header(event, 'accept-encoding').split(','):
+        coding, _, quality = part.partition(';')
+        quality = quality.strip()
+        try:
+            if quality.startswith('q=') and float(quality[2:]) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+def ok(event, payload, etag=None):
+    """
+    200 response for payload; large bodies are compressed with br (when the
+    brotli module is installed) or gzip if the client accepts it.
+    """
+    headers = dict(CORS_HEADERS, Vary='Accept-Encoding')
+    if etag:
+        headers.update({'ETag': etag, 'Cache-Control': CACHE_CONTROL})
+    body = json.dumps(payload, default=str)
+
+    encoding = None
+    if len(body) >= MIN_COMPRESS_BYTES:
+        accepted = accepted_encodings(event)
+        if brotli is not None and 'br' in accepted:
+            encoding = 'br'
+        elif 'gzip' in accepted or '*' in accepted:
+            encoding = 'gzip'
+    if encoding is None:
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': body
+        }
+
+    raw = body.encode('utf-8')
+    if encoding == 'br':
+        compressed = brotli.compress(raw, quality=5)
+    else:
+        compressed = gzip.compress(raw, compresslevel=6, mtime=0)
+    headers['Content-Encoding'] = encoding
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
 
 def lambda_handler(event, context):
     """
     Expects a GET request with a query string parameter 'user_id'.
-    Returns all receipts saved for that user.
+    Returns one page of that user's receipts and a `next_cursor` to pass
+    back as `cursor` for the next page (null on the last page).
+    Optional parameters:
+      limit  - receipts per page (default DEFAULT_LIMIT, at most MAX_LIMIT)
+      cursor - continuation token from the previous page
+      fields - comma-separated attributes to return, e.g. shop,receipt_time,total
+      from / to - receipt date range (YYYY-MM-DD or YYYY-MM-DDTHH:MM), read
+               from the user_id + receipt_ts index, newest first
+    On SUMMARY_PATH, returns the user's monthly spend instead (see spend_summary).
+    Responses carry an ETag; a matching If-None-Match gets 304 (see current_etag).
     """
     # Handle CORS preflight
     if event.get('httpMethod') == 'OPTIONS':
@@ -30,30 +421,28 @@ def lambda_handler(event, context):
         }
 
     # Extract user_id from query parameters
-    user_id = event.get('queryStringParameters', {}).get('user_id')
+    params = event.get('queryStringParameters') or {}
+    user_id = params.get('user_id')
     if not user_id:
+        return error(400, 'Missing required parameter user_id')
+
+    # Conditional GET: an unchanged user needs no receipts read at all
+    etag = current_etag(event, user_id, params)
+    if etag and etag_matches(header(event, 'if-none-match'), etag):
         return {
-            'statusCode': 400,
-            'headers': CORS_HEADERS,
-            'body': json.dumps({'error': 'Missing required parameter user_id'})
+            'statusCode': 304,
+            'headers': {**CORS_HEADERS, 'ETag': etag, 'Cache-Control': CACHE_CONTROL},
+            'body': ''
         }
 
-    # Query the GSI on user_id
     try:
-        resp = table.query(
-            IndexName=USER_INDEX,
-            KeyConditionExpression=Key('user_id').eq(user_id)
-        )
-        items = resp.get('Items', [])
+        if event.get('resource') == SUMMARY_PATH:
+            payload = spend_summary(user_id, params)
+        else:
+            payload = receipt_page(user_id, params)
+    except ValueError as e:
+        return error(400, str(e))
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': CORS_HEADERS,
-            'body': json.dumps({'error': str(e)})
-        }
+        return error(500, str(e))
 
-    return {
-        'statusCode': 200,
-        'headers': CORS_HEADERS,
-        'body': json.dumps({'receipts': items}, default=str)
-    }
\ No newline at end of file
+    return ok(event, payload, etag)
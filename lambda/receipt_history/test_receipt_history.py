@@ -0,0 +1,193 @@
+import base64
+import gzip
+import json
+import time
+
+import pytest
+
+import receipt_history
+from receipt_history import TIME_INDEX, USER_INDEX, decode_cursor, encode_cursor
+
+
+class FakeTable:
+    """Records the queries it is sent and answers each with one page."""
+
+    def __init__(self, items=(), last_key=None, version=None):
+        self.items    = list(items)
+        self.last_key = last_key
+        self.version  = version
+        self.queries  = []
+
+    def query(self, **query):
+        self.queries.append(query)
+        resp = {'Items': [dict(item) for item in self.items]}
+        if self.last_key:
+            resp['LastEvaluatedKey'] = self.last_key
+        return resp
+
+    def get_item(self, **kwargs):
+        return {'Item': dict(self.version)} if self.version else {}
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    tables = {}
+    monkeypatch.setattr(receipt_history, 'get_table',
+                        lambda name=receipt_history.TABLE_NAME: tables.setdefault(name, FakeTable()))
+    return tables
+
+
+def get(params, resource='/receipt-history', headers=None):
+    event = {'resource': resource, 'httpMethod': 'GET', 'queryStringParameters': params,
+             'headers': headers or {}}
+    response = receipt_history.lambda_handler(event, None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def respond(params, headers=None, resource='/receipt-history'):
+    event = {'resource': resource, 'httpMethod': 'GET', 'queryStringParameters': params,
+             'headers': headers or {}}
+    return receipt_history.lambda_handler(event, None)
+
+
+def test_a_cursor_round_trips_for_its_own_index():
+    key = {'id': 'r1', 'user_id': 'alice', 'receipt_ts': '2024-05-12'}
+    assert decode_cursor(encode_cursor(key, TIME_INDEX), 'alice', TIME_INDEX) == key
+
+
+def test_no_cursor_on_the_last_page():
+    assert encode_cursor(None, USER_INDEX) is None
+
+
+@pytest.mark.parametrize('cursor', ['!!!', 'bm90IGpzb24', encode_cursor({'id': 'r1', 'user_id': 'bob'}, USER_INDEX)])
+def test_anything_but_this_users_cursor_is_invalid(cursor):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        decode_cursor(cursor, 'alice', USER_INDEX)
+
+
+def test_a_cursor_is_passed_back_as_the_start_key(tables):
+    key = {'id': 'r1', 'user_id': 'alice'}
+    tables[receipt_history.TABLE_NAME] = FakeTable(items=[{'id': 'r1', 'user_id': 'alice'}], last_key=key)
+    status, page = get({'user_id': 'alice', 'limit': '1'})
+    assert status == 200
+
+    status, _ = get({'user_id': 'alice', 'limit': '1', 'cursor': page['next_cursor']})
+    assert status == 200
+    query = tables[receipt_history.TABLE_NAME].queries[-1]
+    assert query['IndexName'] == USER_INDEX
+    assert query['ExclusiveStartKey'] == key
+
+
+def test_a_cursor_reused_with_a_date_range_is_a_400(tables):
+    tables[receipt_history.TABLE_NAME] = FakeTable(last_key={'id': 'r1', 'user_id': 'alice'})
+    _, page = get({'user_id': 'alice'})
+
+    status, response = get({'user_id': 'alice', 'from': '2024-05-01', 'cursor': page['next_cursor']})
+    assert status == 400
+    assert 'different query' in response['error']
+    assert len(tables[receipt_history.TABLE_NAME].queries) == 1
+
+
+class FakeDynamoDB:
+    """batch_get_item over line items, leaving the last key unprocessed once."""
+
+    def __init__(self, lines):
+        self.lines = {(line['receipt_id'], line['line_no']): line for line in lines}
+        self.calls = []
+
+    def batch_get_item(self, RequestItems):
+        keys = RequestItems[receipt_history.ITEMS_TABLE]['Keys']
+        self.calls.append(keys)
+        served, unprocessed = (keys[:-1], keys[-1:]) if len(self.calls) == 1 else (keys, [])
+        resp = {'Responses': {receipt_history.ITEMS_TABLE: [
+            dict(self.lines[(k['receipt_id'], k['line_no'])]) for k in served
+        ]}}
+        if unprocessed:
+            resp['UnprocessedKeys'] = {receipt_history.ITEMS_TABLE: {'Keys': unprocessed}}
+        return resp
+
+
+def test_normalized_lines_are_read_in_one_batch_not_a_query_per_receipt(tables, monkeypatch):
+    headers = [
+        {'id': 'r1', 'user_id': 'alice', 'layout': 'normalized', 'item_count': 2},
+        {'id': 'r2', 'user_id': 'alice', 'contents': [{'name': 'tea'}]},
+        {'id': 'r3', 'user_id': 'alice', 'layout': 'normalized', 'item_count': 1},
+    ]
+    lines = [
+        {'receipt_id': 'r1', 'line_no': 1, 'user_id': 'alice', 'name': 'milk'},
+        {'receipt_id': 'r1', 'line_no': 0, 'user_id': 'alice', 'name': 'bread'},
+        {'receipt_id': 'r3', 'line_no': 0, 'user_id': 'alice', 'name': 'eggs'},
+    ]
+    dynamodb = FakeDynamoDB(lines)
+    monkeypatch.setattr(receipt_history, 'get_dynamodb', lambda: dynamodb)
+    monkeypatch.setattr(receipt_history.time, 'sleep', lambda seconds: None)
+    tables[receipt_history.TABLE_NAME] = FakeTable(items=headers)
+
+    status, page = get({'user_id': 'alice', 'fields': 'shop,contents'})
+    assert status == 200
+    assert [r['contents'] for r in page['receipts']] == [
+        [{'name': 'bread'}, {'name': 'milk'}], [{'name': 'tea'}], [{'name': 'eggs'}]
+    ]
+    # Attributes projected only for the lookup are not returned
+    assert not any({'id', 'layout', 'item_count'} & set(r) for r in page['receipts'])
+    assert len(dynamodb.calls) == 2 and dynamodb.calls[1] == [{'receipt_id': 'r3', 'line_no': 0}]
+    assert receipt_history.ITEMS_TABLE not in tables
+
+
+def versioned(tables, version, age=60):
+    tables[receipt_history.AGGREGATES_TABLE] = FakeTable(
+        version={'version': version, 'updated_at': int(time.time()) - age})
+
+
+@pytest.mark.parametrize('if_none_match, etag, expected', [
+    ('W/"abc"', 'W/"abc"', True),
+    ('"abc"', 'W/"abc"', True),               # weak comparison
+    ('W/"old", W/"abc"', 'W/"abc"', True),
+    ('*', 'W/"abc"', True),
+    ('W/"old"', 'W/"abc"', False),
+    ('', 'W/"abc"', False),
+])
+def test_etag_matches(if_none_match, etag, expected):
+    assert receipt_history.etag_matches(if_none_match, etag) is expected
+
+
+def test_an_unchanged_user_gets_a_304_without_reading_receipts(tables):
+    versioned(tables, 7)
+    first = respond({'user_id': 'alice'})
+    etag = first['headers']['ETag']
+    assert first['statusCode'] == 200 and etag.startswith('W/"')
+
+    second = respond({'user_id': 'alice'}, headers={'If-None-Match': etag})
+    assert second['statusCode'] == 304 and second['body'] == ''
+    assert len(tables[receipt_history.TABLE_NAME].queries) == 1
+
+
+def test_the_etag_changes_with_the_version_and_the_request(tables):
+    versioned(tables, 7)
+    etag = respond({'user_id': 'alice'})['headers']['ETag']
+    assert respond({'user_id': 'alice', 'limit': '5'})['headers']['ETag'] != etag
+    assert respond({'user_id': 'alice'}, resource=receipt_history.SUMMARY_PATH)['headers']['ETag'] != etag
+
+    versioned(tables, 8)
+    response = respond({'user_id': 'alice'}, headers={'If-None-Match': etag})
+    assert response['statusCode'] == 200 and response['headers']['ETag'] != etag
+
+
+@pytest.mark.parametrize('state', ['never written', 'settling'])
+def test_no_etag_without_a_settled_version(tables, state):
+    if state == 'settling':
+        versioned(tables, 7, age=0)   # just changed: the indexes may lag
+    response = respond({'user_id': 'alice'}, headers={'If-None-Match': '*'})
+    assert response['statusCode'] == 200 and 'ETag' not in response['headers']
+
+
+def test_large_pages_are_gzipped_for_clients_that_accept_it(tables, monkeypatch):
+    monkeypatch.setattr(receipt_history, 'brotli', None)
+    receipts = [{'id': f'r{i}', 'user_id': 'alice', 'shop': 'Tesco'} for i in range(100)]
+    tables[receipt_history.TABLE_NAME] = FakeTable(items=receipts)
+    response = respond({'user_id': 'alice'}, headers={'Accept-Encoding': 'gzip, br'})
+    assert response['headers']['Content-Encoding'] == 'gzip' and response['isBase64Encoded']
+    assert json.loads(gzip.decompress(base64.b64decode(response['body'])))['receipts'] == receipts
+
+    plain = respond({'user_id': 'alice'}, headers={'Accept-Encoding': 'gzip;q=0'})
+    assert 'Content-Encoding' not in plain['headers']
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: compiled MerchantMatcher vs the old one-substring-scan-per-key
+loop, at 10, 100 and 1000 aliases.
+
+Usage: python bench_merchant.py [receipts_per_run]
+"""
+import random
+import string
+import sys
+import timeit
+
+from merchant_matcher import SUPERMARKETS, MerchantMatcher
+
+SIZES = (10, 100, 1000)
+
+
+def loop_detect(aliases, raw_text):
+    """The original detect_supermarket: one substring scan per alias."""
+    txt = (raw_text or "").lower()
+    for key, display in aliases.items():
+        if key in txt:
+            return display
+    return None
+
+
+def make_aliases(n, rng):
+    aliases = dict(list(SUPERMARKETS.items())[:n])
+    while len(aliases) < n:
+        word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 12)))
+        aliases[word] = word.title()
+    return aliases
+
+
+def make_receipts(aliases, count, rng):
+    """Summary-field text similar to what Textract returns; half contain no known chain."""
+    filler = ["store", "no", "vat", "reg", "gb", "tel", "0800", "high", "street", "london", "thank", "you"]
+    names  = list(aliases)
+    texts  = []
+    for i in range(count):
+        words = [rng.choice(filler) for _ in range(rng.randint(15, 40))]
+        if i % 2 == 0:
+            words.insert(rng.randrange(len(words)), rng.choice(names).upper())
+        texts.append(" ".join(words))
+    return texts
+
+
+def main():
+    per_run = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rng = random.Random(42)
+
+    print(f"{'aliases':>8} | {'loop (us/receipt)':>18} | {'matcher (us/receipt)':>20} | {'speed-up':>8}")
+    print("-" * 64)
+    for n in SIZES:
+        aliases  = make_aliases(n, rng)
+        receipts = make_receipts(aliases, per_run, rng)
+        matcher  = MerchantMatcher(aliases)
+
+        # Both must agree whenever the loop finds a whole-word alias
+        for text in receipts:
+            found, confidence = matcher.match(text)
+            if confidence == 1.0 and loop_detect(aliases, text) is None:
+                raise AssertionError(f"matcher/loop disagree on: {text!r}")
+
+        loop_t    = min(timeit.repeat(lambda: [loop_detect(aliases, t) for t in receipts], number=1, repeat=5))
+        matcher_t = min(timeit.repeat(lambda: [matcher.match(t) for t in receipts], number=1, repeat=5))
+        print(f"{n:>8} | {loop_t / per_run * 1e6:>18.2f} | {matcher_t / per_run * 1e6:>20.2f} | {loop_t / matcher_t:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
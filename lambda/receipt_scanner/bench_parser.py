@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Offline parser benchmark: replays AnalyzeExpense responses through
+parse_expense without calling AWS.
+
+Corpus: every fixtures/*.json plus a generated 500-line receipt. Responses
+recorded with record_fixture.py are named after their image; synthetic_*
+ones were written by hand (see record_fixture.py).
+Reports receipts/second and per-receipt allocations (tracemalloc).
+
+Usage:
+    python bench_parser.py            # benchmark
+    python bench_parser.py --check    # compare output with fixtures/expected/
+    python bench_parser.py --update   # (re)write fixtures/expected/
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import time
+import tracemalloc
+
+from receipt_processor import parse_expense
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+EXPECTED_DIR = os.path.join(FIXTURES_DIR, "expected")
+
+PRODUCTS = [
+    "JS WHOLE MILK 2.272L", "TTD SOURDOUGH LOAF", "HEINZ BAKED BEANS", "*COCA COLA 1.75L",
+    "JS FREE RANGE EGGS X6", "ANCHOR BUTTER 250G", "JS BANANAS LOOSE", "WALKERS CRISPS X6",
+    "JS CHICKEN BREAST 300G", "BIRDS EYE PEAS 800G", "JS BASMATI RICE 1KG", "YEO VALLEY YOG 450G",
+]
+NOISE = [
+    ("Nectar Price Saving", "-£0.50"), ("PRICE REDUCTION", None), ("ORIGINAL PRICE £1.00", None),
+    ("2 @ £1.25", "£2.50"), ("ITEM CANCELLED", None), ("Multibuy Saving", "-£1.00"),
+]
+
+
+def _field(fld_type, value):
+    return {
+        "Type":           {"Text": fld_type, "Confidence": 99.0},
+        "ValueDetection": {"Text": value, "Confidence": 99.0},
+        "PageNumber":     1
+    }
+
+
+def synthetic_response(n_lines=500, seed=0):
+    """A Textract-shaped response for a long receipt with realistic noise lines."""
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(n_lines):
+        if rng.random() < 0.2:
+            name, price = rng.choice(NOISE)
+        else:
+            name, price = rng.choice(PRODUCTS), f"£{rng.randint(20, 999) / 100:.2f}"
+        fields = [_field("ITEM", name)]
+        if price:
+            fields.append(_field("PRICE", price))
+        fields.append(_field("EXPENSE_ROW", f"{name} {price or ''}".strip()))
+        lines.append({"LineItemExpenseFields": fields})
+
+    return {
+        "DocumentMetadata": {"Pages": 1},
+        "ExpenseDocuments": [{
+            "ExpenseIndex":   1,
+            "SummaryFields":  [
+                _field("VENDOR_NAME", "Sainsbury's"),
+                _field("TRANSACTION_DATE", "19/04/2025 11:40"),
+            ],
+            "LineItemGroups": [{"LineItemGroupIndex": 1, "LineItems": lines}]
+        }]
+    }
+
+
+def load_corpus():
+    corpus = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            corpus[os.path.basename(path)[:-5]] = json.load(f)
+    corpus["synthetic_500"] = synthetic_response(500)
+    return corpus
+
+
+def bench(response, min_seconds=1.0):
+    """Returns (receipts/second, peak KiB per receipt, blocks allocated per receipt)."""
+    parse_expense(response, "bench")  # warm up
+
+    runs, start = 0, time.perf_counter()
+    while True:
+        parse_expense(response, "bench")
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            break
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    result = parse_expense(response, "bench")
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    del result
+
+    return runs / elapsed, peak / 1024, blocks
+
+
+def render(result):
+    return json.loads(json.dumps(result, default=str))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--check", action="store_true", help="compare parse output with fixtures/expected/")
+    parser.add_argument("--update", action="store_true", help="write parse output to fixtures/expected/")
+    parser.add_argument("--seconds", type=float, default=1.0, help="minimum timing window per receipt")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+
+    if args.check or args.update:
+        os.makedirs(EXPECTED_DIR, exist_ok=True)
+        failed = 0
+        for name, response in corpus.items():
+            path = os.path.join(EXPECTED_DIR, f"{name}.json")
+            got  = render(parse_expense(response, name))
+            if args.update:
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(got, f, indent=1)
+                print(f"updated  {name}")
+            elif not os.path.exists(path):
+                print(f"missing  {name} (run with --update)")
+                failed += 1
+            else:
+                with open(path, encoding="utf-8") as f:
+                    ok = json.load(f) == got
+                print(f"{'ok      ' if ok else 'CHANGED '} {name}")
+                failed += not ok
+        raise SystemExit(1 if failed else 0)
+
+    print(f"{'receipt':<16} | {'lines':>5} | {'receipts/s':>10} | {'peak KiB':>8} | {'blocks':>7}")
+    print("-" * 60)
+    for name, response in corpus.items():
+        lines = sum(
+            len(group.get("LineItems", []))
+            for doc in response["ExpenseDocuments"]
+            for group in doc.get("LineItemGroups", [])
+        )
+        rate, peak_kib, blocks = bench(response, args.seconds)
+        print(f"{name:<16} | {lines:>5} | {rate:>10.1f} | {peak_kib:>8.1f} | {blocks:>7}")
+
+
+if __name__ == "__main__":
+    main()
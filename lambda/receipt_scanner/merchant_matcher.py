@@ -0,0 +1,94 @@
+import json
+import os
+import re
+
+# Alias table lives next to this module; override with SUPERMARKETS_FILE
+SUPERMARKETS_FILE = os.getenv(
+    "SUPERMARKETS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "supermarkets.json")
+)
+
+# Confidence reported for a match
+CONFIDENCE_WORD    = 1.0   # alias stands on word boundaries, e.g. "tesco stores"
+CONFIDENCE_PARTIAL = 0.5   # alias only found inside a longer token, e.g. "tescostores"
+
+
+def load_aliases(path=SUPERMARKETS_FILE):
+    """
+    Read the alias table, stored as { "Display Name": ["alias", ...], ... }.
+    Returns a flat { "alias (lowercase)": "Display Name" } dict.
+    """
+    with open(path, encoding="utf-8") as f:
+        chains = json.load(f)
+    return {
+        alias.lower(): display
+        for display, aliases in chains.items()
+        for alias in aliases
+        if alias
+    }
+
+
+def trie_pattern(words):
+    """
+    Build a regex from a character trie of the given words, so the regex
+    engine branches on one character at a time instead of trying every alias
+    at every position. Optional groups are greedy, so the longest alias
+    starting at a position wins.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def _node(node):
+        branches = [re.escape(ch) + _node(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            body = "(?:" + body + ")?"
+        return body
+
+    return _node(trie)
+
+
+class MerchantMatcher:
+    """
+    Single-pass matcher over a table of merchant aliases.
+
+    The whole table is compiled into one trie-shaped regex, so each receipt
+    text is scanned once regardless of how many aliases are configured.
+    """
+
+    def __init__(self, aliases):
+        self.aliases = {alias.lower(): display for alias, display in aliases.items() if alias}
+        self._regex = re.compile(trie_pattern(self.aliases)) if self.aliases else None
+
+    def match(self, raw_text):
+        """
+        Returns (display_name, confidence) for the leftmost whole-word alias
+        match, falling back to the leftmost partial match, or (None, 0.0).
+        At any position the longest alias wins.
+        """
+        if not raw_text or self._regex is None:
+            return None, 0.0
+
+        txt = raw_text.lower()
+        partial = None
+        for m in self._regex.finditer(txt):
+            start, end = m.span()
+            if (start == 0 or not txt[start - 1].isalnum()) and \
+               (end == len(txt) or not txt[end].isalnum()):
+                return self.aliases[m.group(0)], CONFIDENCE_WORD
+            if partial is None:
+                partial = self.aliases[m.group(0)]
+
+        if partial is not None:
+            return partial, CONFIDENCE_PARTIAL
+        return None, 0.0
+
+
+SUPERMARKETS = load_aliases()
+MATCHER      = MerchantMatcher(SUPERMARKETS)
@@ -0,0 +1,79 @@
+import hashlib
+import os
+import time
+
+# DynamoDB table holding parsed receipts by content hash; unset disables caching
+PARSE_CACHE_TABLE = os.getenv("PARSE_CACHE_TABLE")
+PARSE_CACHE_TTL   = int(os.getenv("PARSE_CACHE_TTL", str(30 * 24 * 3600)))
+
+# Bump whenever the parser's output changes so older cached parses are ignored
+PARSER_VERSION = "2"
+
+
+def bytes_hash(data: bytes) -> str:
+    """Content hash for image bytes we already hold in memory."""
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+def s3_object_hash(s3_client, bucket, key) -> str:
+    """
+    Content hash for an S3 object without downloading it.
+    Single-part uploads (what receipt_uploader does) have the MD5 of the
+    body as ETag, so identical images share a hash.
+    """
+    head = s3_client.head_object(Bucket=bucket, Key=key)
+    return "etag:" + head["ETag"].strip('"')
+
+
+def cache_key(content_hash: str) -> str:
+    return f"v{PARSER_VERSION}:{content_hash}"
+
+
+class InMemoryParseCache:
+    """
+    Local stand-in for the DynamoDB cache, with the same get/put interface.
+    """
+
+    def __init__(self, ttl=PARSE_CACHE_TTL, clock=time.time):
+        self.ttl   = ttl
+        self.clock = clock
+        self.items = {}
+
+    def get(self, content_hash):
+        entry = self.items.get(cache_key(content_hash))
+        if not entry or entry["expires_at"] <= self.clock():
+            return None
+        return entry["parsed"]
+
+    def put(self, content_hash, parsed):
+        self.items[cache_key(content_hash)] = {
+            "parsed":     parsed,
+            "expires_at": int(self.clock() + self.ttl)
+        }
+
+
+class DynamoParseCache:
+    """
+    Parsed receipts keyed by content hash. `expires_at` doubles as the
+    table's TTL attribute; it is also checked on read because DynamoDB
+    removes expired items lazily.
+    """
+
+    def __init__(self, table, ttl=PARSE_CACHE_TTL, clock=time.time):
+        self.table = table
+        self.ttl   = ttl
+        self.clock = clock
+
+    def get(self, content_hash):
+        resp = self.table.get_item(Key={"content_hash": cache_key(content_hash)})
+        entry = resp.get("Item")
+        if not entry or int(entry.get("expires_at", 0)) <= self.clock():
+            return None
+        return entry["parsed"]
+
+    def put(self, content_hash, parsed):
+        self.table.put_item(Item={
+            "content_hash": cache_key(content_hash),
+            "parsed":       parsed,
+            "expires_at":   int(self.clock() + self.ttl)
+        })
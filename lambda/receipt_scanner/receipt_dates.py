@@ -0,0 +1,110 @@
+import re
+from datetime import datetime
+
+# Receipt dates arrive as whatever Textract read for TRANSACTION_DATE, e.g.
+# "12/05/24", "12-05-2024 14:02", "12 May 2024 2:02 PM" or "2024-05-12".
+# Numeric dates are read day-first (UK) unless that is impossible.
+MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12
+}
+MONTH_NAME = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?"
+
+NUMERIC_DATE_RE = re.compile(r"(?<!\d)(\d{1,4})[/\-.](\d{1,2})[/\-.](\d{2,4})(?!\d)")
+DAY_MONTH_RE    = re.compile(r"(?<!\d)(\d{1,2})(?:st|nd|rd|th)?[\s\-/.]*" + MONTH_NAME + r"[\s\-/.,]*(\d{4}|\d{2})(?!\d)", re.IGNORECASE)
+MONTH_DAY_RE    = re.compile(MONTH_NAME + r"\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4}|\d{2})(?!\d)", re.IGNORECASE)
+TIME_RE         = re.compile(r"(?<!\d)(\d{1,2}):(\d{2})(?::(\d{2}))?\s*([ap])?\.?m?\.?", re.IGNORECASE)
+
+# Anything outside this range is a misread, not a receipt date
+MIN_YEAR, MAX_YEAR = 2000, 2099
+
+
+def _year(raw):
+    year = int(raw)
+    return year + 2000 if year < 100 else year
+
+
+def _date(raw):
+    """(year, month, day) from the first date found in raw, or None."""
+    match = NUMERIC_DATE_RE.search(raw)
+    if match:
+        a, b, c = match.groups()
+        if len(a) == 4:                        # 2024-05-12
+            return int(a), int(b), int(c)
+        day, month = int(a), int(b)
+        if month > 12 and day <= 12:           # 05/13/24 can only be month-first
+            day, month = month, day
+        return _year(c), month, day
+
+    match = DAY_MONTH_RE.search(raw)
+    if match:
+        day, month, year = match.groups()
+        return _year(year), MONTHS[month[:3].lower()], int(day)
+
+    match = MONTH_DAY_RE.search(raw)
+    if match:
+        month, day, year = match.groups()
+        return _year(year), MONTHS[month[:3].lower()], int(day)
+    return None
+
+
+def _time(raw):
+    """(hour, minute, second) from the first time found in raw, or midnight."""
+    match = TIME_RE.search(raw)
+    if not match:
+        return 0, 0, 0
+    hour, minute, second, meridiem = match.groups()
+    hour = int(hour)
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem.lower() == "p" else 0)
+    return hour, int(minute), int(second or 0)
+
+
+def normalize_receipt_time(raw):
+    """
+    ISO 8601 "YYYY-MM-DDTHH:MM:SS" (local time as printed) for a raw receipt
+    date, or None if no valid date can be read from it.
+    """
+    if not raw:
+        return None
+    date = _date(raw)
+    if date is None or not MIN_YEAR <= date[0] <= MAX_YEAR:
+        return None
+    try:
+        return datetime(*date, *_time(raw)).isoformat()
+    except ValueError:
+        try:
+            return datetime(*date).isoformat()   # readable date, garbled time
+        except ValueError:
+            return None
+
+
+def receipt_ts(record):
+    """
+    Sort key for a receipt: its normalized printed date, or the upload time
+    when the date is missing or unreadable, so every receipt is indexed.
+    """
+    return normalize_receipt_time(record.get("receipt_time")) or (record.get("upload_time") or "")[:19]
+
+
+if __name__ == "__main__":
+    # Backfill receipt_ts on receipts saved before it existed
+    import os
+    import boto3
+
+    table = boto3.resource("dynamodb").Table(os.getenv("DDB_TABLE", "ReceiptsTable"))
+    params, updated = {"ProjectionExpression": "id, receipt_time, upload_time, receipt_ts"}, 0
+    while True:
+        resp = table.scan(**params)
+        for item in resp.get("Items", []):
+            if "receipt_ts" not in item and receipt_ts(item):
+                table.update_item(
+                    Key={"id": item["id"]},
+                    UpdateExpression="SET receipt_ts = :ts",
+                    ExpressionAttributeValues={":ts": receipt_ts(item)}
+                )
+                updated += 1
+        if "LastEvaluatedKey" not in resp:
+            break
+        params["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+    print(f"Set receipt_ts on {updated} receipts")
@@ -7,209 +7,685 @@ import uuid
 import json
 from datetime import datetime, timezone
 import sys
-
-# ── Only the main UK supermarket chains (all keys in lowercase) ────────────────
-SUPERMARKETS = {
-    "tesco":     "Tesco",
-    "sainsbury": "Sainsbury",
-    "asda":      "Asda",
-    "morrisons": "Morrisons",
-    "aldi":      "Aldi",
-    "lidl":      "Lidl",
-    "waitrose":  "Waitrose",
-    "co-op":     "Co-op",
-    "co op":     "Co-op",
-    "coop":      "Co-op",
-    "Doritos":   "Doritos"
-}
+import time
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from botocore.config import Config
+
+from merchant_matcher import MATCHER, trie_pattern
+from parse_cache import PARSE_CACHE_TABLE, DynamoParseCache, bytes_hash, s3_object_hash
+from receipt_dates import receipt_ts
+from spend_aggregates import AGGREGATES_TABLE, DynamoAggregateStore
+from textract_async import (
+    MAX_WAIT_SECONDS, get_expense_results, notifications_enabled, parse_job_notification,
+    start_expense_job, wait_for_expense_job
+)
 
 # DynamoDB table name from environment
-dynamodb   = boto3.resource("dynamodb")
 TABLE_NAME = os.getenv("DDB_TABLE", "ReceiptsTable")
 
+# "embedded": line items stored in the receipt's `contents` attribute.
+# "normalized": receipt header in TABLE_NAME, one item per line in ITEMS_TABLE
+# under the receipt's id, which keeps big receipts clear of the 400 KB limit.
+RECEIPT_LAYOUT = os.getenv("RECEIPT_LAYOUT", "embedded")
+ITEMS_TABLE    = os.getenv("ITEMS_TABLE", "ReceiptItemsTable")
+
+# BatchWriteItem takes at most 25 puts; items DynamoDB leaves unprocessed
+# are resent up to WRITE_ATTEMPTS times in all, with backoff
+WRITE_BATCH_SIZE = 25
+WRITE_ATTEMPTS   = 5
+
+# Max records analysed in parallel per invocation. Keep this at or below the
+# account's Textract AnalyzeExpense TPS quota; adaptive retries back off
+# client-side if Textract still throttles.
+MAX_WORKERS     = int(os.getenv("SCANNER_MAX_WORKERS", "4"))
+
+# Every client keeps its connections alive between warm invocations and pools
+# enough of them for the worker threads
+CLIENT_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=max(10, 2 * MAX_WORKERS),
+    connect_timeout=5,
+    read_timeout=60
+)
+TEXTRACT_CONFIG = CLIENT_CONFIG.merge(Config(retries={"max_attempts": 8, "mode": "adaptive"}))
+
+# "sync":  AnalyzeExpense for every object.
+# "async": StartExpenseAnalysis for every object (see textract_async.py).
+# "auto":  async for multi-page formats such as PDF invoices, sync otherwise.
+TEXTRACT_MODE  = os.getenv("TEXTRACT_MODE", "auto")
+ASYNC_SUFFIXES = (".pdf", ".tif", ".tiff")
+
+# Time kept back from a polled Textract job to parse and save its result
+# before the invocation runs out
+SAVE_MARGIN_SECONDS = 5
+
+# Untouched phone photos kept by the uploader next to the optimised copy
+ORIGINALS_PREFIX = os.getenv("ORIGINALS_PREFIX", "originals/")
+
+_clients      = {}
+_clients_lock = threading.Lock()
+_parse_cache  = None
+_aggregates   = None
+
+
+def _shared(name, factory):
+    """
+    Creates a boto3 client/resource on first use rather than at import, then
+    reuses it across warm invocations. Creation is locked because boto3's
+    default session is not thread-safe; the clients themselves are.
+    """
+    obj = _clients.get(name)
+    if obj is None:
+        with _clients_lock:
+            obj = _clients.get(name)
+            if obj is None:
+                obj = _clients[name] = factory()
+    return obj
+
+
+def get_textract():
+    return _shared("textract", lambda: boto3.client("textract", config=TEXTRACT_CONFIG))
+
+
+def get_s3():
+    return _shared("s3", lambda: boto3.client("s3", config=CLIENT_CONFIG))
+
+
+def get_dynamodb():
+    return _shared("dynamodb", lambda: boto3.resource("dynamodb", config=CLIENT_CONFIG))
+
+
+def get_parse_cache():
+    """
+    Returns the DynamoDB-backed parse cache, or None if PARSE_CACHE_TABLE is unset.
+    """
+    global _parse_cache
+    if _parse_cache is None and PARSE_CACHE_TABLE:
+        _parse_cache = DynamoParseCache(get_dynamodb().Table(PARSE_CACHE_TABLE))
+    return _parse_cache
+
+
+def get_aggregate_store():
+    """
+    Returns the per-user spend aggregates store, or None if AGGREGATES_TABLE is unset.
+    """
+    global _aggregates
+    if _aggregates is None and AGGREGATES_TABLE:
+        _aggregates = DynamoAggregateStore(get_dynamodb().Table(AGGREGATES_TABLE))
+    return _aggregates
+
+
+def match_supermarket(raw_text: str):
+    """
+    Scan raw receipt text once for any alias in the supermarket table.
+    Returns (chain display name, confidence), or (None, 0.0) if none found.
+    """
+    return MATCHER.match(raw_text)
+
 
 def detect_supermarket(raw_text: str) -> str:
     """
     Scan raw receipt text for known UK supermarket names.
     Returns the matching chain display name, or None if none found.
     """
-    txt = (raw_text or "").lower()
-    for key, display in SUPERMARKETS.items():
-        if key in txt:
-            return display
-    return None
+    merchant, _ = match_supermarket(raw_text)
+    return merchant
 
 
 
 
-def process_image(bucket, key, mode="default"):
+def fetch_expense(bucket, key, mode="default", client=None, img_bytes=None):
     """
-    1) Calls Textract AnalyzeExpense (or local) to extract a structured ExpenseDocument.
-    2) Detects the supermarket (merchant) from the SummaryFields.
-    3) Iterates each LineItem in all ExpenseDocuments → only if it contains
-       a field with Type.Text == 'ITEM' and another with Type.Text == 'PRICE' (or 'TOTAL').
-    4) Skips any line whose raw price ≤ 0 or whose item text contains certain keywords
-       (e.g. "price saving", "balance", "change", "express", etc.).
-    5) Cleans up the PRICE string to Decimal.
-    6) Uses extract_brand_and_name(...) to assign brand + clean item_name.
-    7) Returns a dict:
-       {
-         "shop": merchant,
-         "items": [ { "item": "...", "brand": "...", "price": Decimal(...) }, ... ],
-         "source": key,
-         "receipt_time": "...ISO..." or None
-       }
+    Calls Textract AnalyzeExpense on the S3 object (or the local file / bytes
+    in "local" mode) and returns the raw response.
+    """
+    if client is None:
+        client = get_textract()
+
+    if mode == "local":
+        if img_bytes is None:
+            with open(key, "rb") as f:
+                img_bytes = f.read()
+        return client.analyze_expense(
+            Document={"Bytes": img_bytes}
+        )
+    return client.analyze_expense(
+        Document={"S3Object": {"Bucket": bucket, "Name": key}}
+    )
+
+
+def fetch_expense_async(bucket, key, mode="default", client=None, img_bytes=None,
+                        max_wait=MAX_WAIT_SECONDS):
     """
+    Same as fetch_expense, but through StartExpenseAnalysis and paged
+    GetExpenseAnalysis results, so multi-page documents are supported.
+    Polls until the job completes, for at most max_wait seconds.
+    """
+    if mode == "local":
+        raise ValueError("Asynchronous expense analysis needs an S3 object")
+    if client is None:
+        client = get_textract()
+    job_id = start_expense_job(client, bucket, key)
+    return wait_for_expense_job(client, job_id, max_wait=max_wait)
 
-    client = boto3.client("textract")
 
-    # 1) Fetch the expense response from Textract (S3 or local)
+def use_async(key):
+    if TEXTRACT_MODE == "async":
+        return True
+    if TEXTRACT_MODE == "sync":
+        return False
+    return key.lower().endswith(ASYNC_SUFFIXES)
+
+
+def lookup_cached_parse(bucket, key, cache, s3=None, img_bytes=None, force_reparse=False):
+    """
+    Returns (content hash, cached parse or None). Lookup errors are logged
+    and treated as a miss.
+    """
+    content_hash, cached = None, None
+    try:
+        if img_bytes is not None:
+            content_hash = bytes_hash(img_bytes)
+        else:
+            content_hash = s3_object_hash(s3 or get_s3(), bucket, key)
+        if not force_reparse:
+            cached = cache.get(content_hash)
+    except Exception as e:
+        logging.warning("Parse cache lookup failed for %s: %s", key, e)
+    if cached is not None:
+        logging.info("Parse cache hit for %s (%s)", key, content_hash)
+        cached = dict(cached, source=key)
+    return content_hash, cached
+
+
+def process_image(bucket, key, mode="default", client=None, cache=None, s3=None,
+                  force_reparse=False, fetch=fetch_expense):
+    """
+    Fetches the AnalyzeExpense response for an image (see fetch_expense, or
+    pass fetch_expense_async / another fetcher) and parses it into our
+    receipt record (see parse_expense).
+    Pass `client` to share one Textract client across threads.
+
+    With a `cache` (see parse_cache.py), the image's content hash is looked
+    up first and a stored parse is returned without calling Textract, unless
+    `force_reparse` is set. Fresh parses are written back to the cache.
+    """
+
+    img_bytes = None
     if mode == "local":
         with open(key, "rb") as f:
             img_bytes = f.read()
-        response = client.analyze_expense(
-            Document={"Bytes": img_bytes}
-        )
-    else:
-        response = client.analyze_expense(
-            Document={"S3Object": {"Bucket": bucket, "Name": key}}
-        )
 
-    # 2) Combine all SummaryFields text for a quick supermarket detection
-    all_summary = " ".join(
-        f.get("ValueDetection", {}).get("Text", "")
-        for f in response["ExpenseDocuments"][0].get("SummaryFields", [])
-    )
+    # Reuse the parse of an identical image seen before
+    content_hash = None
+    if cache is not None:
+        content_hash, cached = lookup_cached_parse(bucket, key, cache, s3, img_bytes, force_reparse)
+        if cached is not None:
+            return cached
+
+    response = fetch(bucket, key, mode=mode, client=client, img_bytes=img_bytes)
+    result   = parse_expense(response, key)
+
+    if content_hash is not None:
+        try:
+            cache.put(content_hash, result)
+        except Exception as e:
+            logging.warning("Parse cache write failed for %s: %s", key, e)
+
+    return result
+
+
+# ── Line-item parsing rules, compiled once at import ─────────────────────────
+# Keywords to filter out entirely “nonsense” lines
+SKIP_KEYWORDS = [
+    "price saving",
+    "balance",
+    "change",
+    "express",
+    "price laut",   # e.g. "Price Lauting"
+    "price sant",   # e.g. "Price Santing"
+    "price sav",    # catch partial
+]
+SKIP_RE        = re.compile(trie_pattern(SKIP_KEYWORDS))  # matched against lowercased text
+
+# Priceless annotation lines that are never the product a quantity line belongs to
+NOTE_KEYWORDS = [
+    "price reduction",
+    "original price",
+    "item cancelled",
+]
+NOTE_RE        = re.compile(trie_pattern(NOTE_KEYWORDS))  # matched against lowercased text
+PRICE_CLEAN_RE = re.compile(r"[^\d\.\-]")
+
+# "2 @ £1.25" / "0.658 kg @ £0.90/kg": completes the priceless line above it
+QTY_LINE_RE   = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(?:kg|g|lb)?\s*(?:@\s*£?|[x×]\s*£)(\d+(?:\.\d+)?)", re.IGNORECASE)
+# "2 x HEINZ BEANS": quantity prefixed to the item name
+QTY_PREFIX_RE = re.compile(r"^\s*(\d+)\s*[x×]\s+(.+)$", re.IGNORECASE)
+
+# Which slot each LineItemExpenseField type fills; other types (EXPENSE_ROW
+# etc.) are ignored without reading their value. A later field of the same
+# slot overwrites an earlier one.
+NAME, AMOUNT, QUANTITY, UNIT_PRICE = range(4)
+LINE_FIELD_SLOTS = {
+    "ITEM":       NAME,
+    "PRICE":      AMOUNT,
+    "TOTAL":      AMOUNT,
+    "QUANTITY":   QUANTITY,
+    "UNIT_PRICE": UNIT_PRICE,
+}
+SUMMARY_FIELD_SLOTS = {
+    "VENDOR_NAME":      "vendor",
+    "TRANSACTION_DATE": "receipt_time",
+}
+ZERO  = Decimal("0.0")
+EMPTY = {}
 
-    merchant = detect_supermarket(all_summary)
+
+def to_decimal(raw):
+    """Strip currency symbols etc. and convert to Decimal; 0.0 if unparseable."""
+    cleaned = PRICE_CLEAN_RE.sub("", raw) if raw else ""
+    try:
+        return Decimal(cleaned) if cleaned else ZERO
+    except Exception:
+        return ZERO
+
+
+def parse_expense(response, key=None):
+    """
+    Parses an already-fetched AnalyzeExpense response; no AWS calls.
+    1) Detects the supermarket (merchant) from the SummaryFields.
+    2) Iterates each LineItem in all ExpenseDocuments → only if it contains
+       a field with Type.Text == 'ITEM' and another with Type.Text == 'PRICE' (or 'TOTAL').
+    3) Skips any line whose raw price ≤ 0 or whose item text contains certain keywords
+       (e.g. "price saving", "balance", "change", "express", etc.).
+    4) Cleans up the PRICE string to Decimal.
+    5) Adds "quantity" / "unit_price" for quantity lines: a Textract QUANTITY
+       field, a "2 x ITEM" prefix, or a "2 @ £1.25" line under a priceless item.
+    6) Returns a dict:
+       {
+         "shop": merchant,
+         "items": [ { "item": "...", "shop": "...", "first": "...", "price": Decimal(...) }, ... ],
+         "source": key,
+         "receipt_time": "..." or None
+       }
+    """
+    docs = response["ExpenseDocuments"]
+
+    # 1) One pass over the first document's SummaryFields
+    summary_texts = []
+    summary = {}
+    for field in (docs[0] if docs else EMPTY).get("SummaryFields", []):
+        text = field.get("ValueDetection", EMPTY).get("Text", "")
+        summary_texts.append(text)
+        slot = SUMMARY_FIELD_SLOTS.get(field.get("Type", EMPTY).get("Text"))
+        if slot is not None and slot not in summary:
+            summary[slot] = text
+
+    merchant, confidence = match_supermarket(" ".join(summary_texts))
+    logging.debug("Supermarket match %r (confidence %.2f)", merchant, confidence)
     if not merchant:
         # Fallback to VENDOR_NAME if no known supermarket found
-        for field in response["ExpenseDocuments"][0].get("SummaryFields", []):
-            if field.get("Type", {}).get("Text") == "VENDOR_NAME":
-                merchant = field.get("ValueDetection", {}).get("Text")
-                break
-        else:
-            merchant = "Unknown"
-
-    # 3) Extract transaction date (if present)
-    receipt_time = None
-    for field in response["ExpenseDocuments"][0].get("SummaryFields", []):
-        if field.get("Type", {}).get("Text") == "TRANSACTION_DATE":
-            receipt_time = field["ValueDetection"]["Text"]
-            break
-
-    # 4) Build the list of real line-items
-    items = []
-    # Keywords to filter out entirely “nonsense” lines
-    SKIP_KEYWORDS = [
-        "price saving",
-        "balance",
-        "change",
-        "express",
-        "price laut",   # e.g. "Price Lauting"
-        "price sant",   # e.g. "Price Santing"
-        "price sav",    # catch partial
-    ]
+        merchant = summary["vendor"] if "vendor" in summary else "Unknown"
 
-    for doc in response["ExpenseDocuments"]:
+    # 2) Build the list of real line-items
+    items   = []
+    slot_of = LINE_FIELD_SLOTS.get
+    skip    = SKIP_RE.search
+    for doc in docs:
         for group in doc.get("LineItemGroups", []):
-            for item in group.get("LineItems", []):
-                fields = item.get("LineItemExpenseFields", [])
-
-                raw_name   = None
-                raw_amount = None
-                for f in fields:
-                    fld_type  = f.get("Type", {}).get("Text", "")
-                    fld_value = f.get("ValueDetection", {}).get("Text", "")
-                    if fld_type == "ITEM":
-                        raw_name = fld_value
-                    elif fld_type in ("PRICE", "TOTAL"):
-                        raw_amount = fld_value
-
-                # Skip if we didn’t find both an ITEM and a PRICE/TOTAL
-                if not raw_name or not raw_amount:
+            pending = None  # priceless ITEM line a following quantity line may complete
+            for line in group.get("LineItems", []):
+                # Dispatch each field on its Type; [name, amount, quantity, unit_price]
+                slots = [None, None, None, None]
+                for f in line.get("LineItemExpenseFields", ()):
+                    slot = slot_of(f.get("Type", EMPTY).get("Text"))
+                    if slot is not None:
+                        slots[slot] = f.get("ValueDetection", EMPTY).get("Text", "")
+                raw_name, raw_amount, quantity, unit_price = slots
+                if not raw_name:
+                    pending = None
+                    continue
+                if not raw_amount:
+                    pending = None if NOTE_RE.search(raw_name.lower()) else raw_name
                     continue
 
-                # 5) Clean up amount → Decimal
-                cleaned = re.sub(r"[^\d\.\-]", "", raw_amount)
-                try:
-                    amount = Decimal(cleaned) if cleaned else Decimal("0.0")
-                except Exception:
-                    amount = Decimal("0.0")
+                # "2 @ £1.25  £2.50" under "HEINZ BEANS": one item, bought twice
+                qty_line = QTY_LINE_RE.match(raw_name) if pending is not None else None
+                if qty_line:
+                    raw_name, quantity, unit_price = pending, qty_line.group(1), qty_line.group(2)
+                pending = None
 
-                # 6) Discard any non-positive prices
+                # 3) Reject before doing any more work
+                if skip(raw_name.lower()):
+                    continue
+                amount = to_decimal(raw_amount)
                 if amount <= 0:
                     continue
 
-                # 7) Prepare item_name, brand, and first field
                 item_name = raw_name.strip()
-                brand = merchant
-                tokens = item_name.split()
-                if tokens:
-                    first = tokens[0]
-                else:
-                    first = merchant
-
-                # 8) Skip if item_name lowercased contains any of our “skip keywords”
-                low = item_name.lower()
-                if any(kw in low for kw in SKIP_KEYWORDS):
-                    continue
+                if quantity is None:
+                    prefixed = QTY_PREFIX_RE.match(item_name)
+                    if prefixed:
+                        quantity, item_name = prefixed.group(1), prefixed.group(2).strip()
 
-                # 9) Everything OK → keep it
-                items.append({
+                tokens = item_name.split(None, 1)
+                entry = {
                     "item":  item_name,
-                    "shop": merchant,
-                    "first": first,
+                    "shop":  merchant,
+                    "first": tokens[0] if tokens else merchant,
                     "price": amount
-                })
+                }
+                if quantity is not None:
+                    qty = to_decimal(quantity)
+                    if qty > 0:
+                        entry["quantity"]   = qty
+                        entry["unit_price"] = to_decimal(unit_price) if unit_price else \
+                            (amount / qty).quantize(Decimal("0.01"))
+                items.append(entry)
 
     return {
         "shop":         merchant,
         "items":        items,
         "source":       key,
-        "receipt_time": receipt_time
+        "receipt_time": summary.get("receipt_time")
     }
 
 
+def receipt_items(record, layout=RECEIPT_LAYOUT):
+    """
+    Yields the (table name, item) pairs that store one receipt record.
+    """
+    if layout != "normalized":
+        yield TABLE_NAME, record
+        return
+
+    contents = record["contents"]
+    header = {k: v for k, v in record.items() if k != "contents"}
+    header.update({"layout": "normalized", "item_count": len(contents)})
+    yield TABLE_NAME, header
+    for line_no, line in enumerate(contents):
+        yield ITEMS_TABLE, dict(line, receipt_id=record["id"], line_no=line_no,
+                                user_id=record["user_id"])
+
+
+def item_key(table_name, item):
+    """Identifies a put in BatchWriteItem requests and UnprocessedItems."""
+    return table_name, json.dumps(item, sort_keys=True, default=str)
+
+
+def write_items(entries, attempts=WRITE_ATTEMPTS, sleep=time.sleep):
+    """
+    Puts (table name, item, record id) entries with BatchWriteItem,
+    WRITE_BATCH_SIZE per call, resending whatever DynamoDB leaves
+    unprocessed. Returns {record id: error} for records with an item that
+    could not be written, so the rest can be reported as saved.
+    """
+    failed = {}
+    for i in range(0, len(entries), WRITE_BATCH_SIZE):
+        pending = entries[i:i + WRITE_BATCH_SIZE]
+        for attempt in range(attempts):
+            request = {}
+            for table_name, item, _ in pending:
+                request.setdefault(table_name, []).append({"PutRequest": {"Item": item}})
+            try:
+                resp = get_dynamodb().batch_write_item(RequestItems=request)
+            except Exception as e:
+                logging.error("BatchWriteItem of %d items failed: %s", len(pending), e)
+                failed.update((record_id, str(e)) for _, _, record_id in pending)
+                pending = []
+                break
+            unprocessed = {
+                item_key(table_name, put["PutRequest"]["Item"])
+                for table_name, puts in resp.get("UnprocessedItems", {}).items() for put in puts
+            }
+            pending = [entry for entry in pending if item_key(entry[0], entry[1]) in unprocessed]
+            if not pending:
+                break
+            sleep(min(0.05 * 2 ** attempt, 1.0))
+        failed.update((record_id, "still unprocessed after retries") for _, _, record_id in pending)
+    return failed
+
+
+def save_records(records, layout=RECEIPT_LAYOUT, aggregates=None):
+    """
+    Writes all records with batched puts (see write_items) and returns
+    {record id: error} for the ones that could not be saved. Ids come from
+    the S3 object (see build_record), so saving a record again, e.g. when
+    a message is redelivered, overwrites it rather than adding a copy.
+    Then bumps the version of each user with saved records, which the
+    history endpoint's ETags are built from, and counts the records in the
+    per-user monthly spend aggregates. Aggregates hold one contribution per
+    receipt id (see spend_aggregates), so a record saved again replaces
+    what it added rather than adding to it.
+    """
+    # BatchWriteItem rejects a call that puts the same key twice
+    records = list({record["id"]: record for record in records}.values())
+    entries = [
+        (table_name, item, record["id"])
+        for record in records for table_name, item in receipt_items(record, layout)
+    ]
+    failed = write_items(entries)
+    saved = [record for record in records if record["id"] not in failed]
+
+    aggregates = aggregates or get_aggregate_store()
+    if aggregates is None or not saved:
+        return failed
+    # Part of saving: if it fails the records are reported as failed and
+    # retried, or clients could be served 304s for the old receipts. The
+    # history endpoint gives no ETag for a few seconds after a bump, which
+    # covers the aggregate updates below.
+    try:
+        aggregates.bump_versions(record["user_id"] for record in saved)
+    except Exception as e:
+        logging.error("Failed to bump receipt versions: %s", e, exc_info=True)
+        return dict(failed, **{record["id"]: str(e) for record in saved})
+    # Records that could not be aggregated are reported as failed too; the
+    # retry saves them again and counts them once
+    try:
+        failed.update(aggregates.apply_receipts(saved))
+    except Exception as e:
+        logging.error("Failed to update spend aggregates for %d records: %s",
+                      len(saved), e, exc_info=True)
+        failed.update((record["id"], str(e)) for record in saved)
+    return failed
+
+
 def save_to_dynamodb(record):
-    table = dynamodb.Table(TABLE_NAME)
-    table.put_item(Item=record)
+    failed = save_records([record])
+    if failed:
+        raise RuntimeError(f"Could not save receipt {record['id']}: {failed[record['id']]}")
+
+
+def receipt_id(bucket, key):
+    """
+    Stable id for the receipt parsed from s3://bucket/key, so reprocessing
+    the same object (a redelivered message, a Textract job notification
+    sent twice) overwrites its receipt instead of duplicating it.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"s3://{bucket}/{key}"))
+
+
+def build_record(data, bucket, key):
+    """
+    Turns a parse into the DynamoDB item for the object at s3://bucket/key. `total`
+    and `item_count` are stored alongside the line items so history list
+    views can project just the summary attributes. `receipt_ts` is the
+    receipt date in ISO form (see receipt_dates), the sort key of the
+    history's date-range index.
+    """
+    data = dict(data)
+    contents = data.pop("items")
+    data.update({
+        "id":           receipt_id(bucket, key),
+        "user_id":      key.split("/")[0],
+        "upload_time":  datetime.now(timezone.utc).isoformat(),
+        "total":        sum((item["price"] for item in contents), ZERO),
+        "item_count":   len(contents),
+        "contents":     contents
+    })
+    data["receipt_ts"] = receipt_ts(data)
+    return data
+
+
+def record_key(rec):
+    """The S3 key an event record refers to, for logging and reporting."""
+    if "Sns" in rec:
+        try:
+            return parse_job_notification(json.loads(rec["Sns"]["Message"]))[3]
+        except Exception:
+            return None
+    return rec.get("s3", {}).get("object", {}).get("key")
+
+
+def process_record(rec, client, cache=None, s3=None, force_reparse=False, max_wait=MAX_WAIT_SECONDS):
+    """
+    Handles one event record and returns (DynamoDB item or None, Textract job id or None).
+    - S3 record, sync mode: analyse now.
+    - S3 record, async mode with an SNS topic configured: start the job and
+      return (None, job_id); its completion notification arrives later.
+    - S3 record, async mode without a topic: start the job and poll it for
+      at most max_wait seconds.
+    - SNS record: a finished job; page through its results and parse them.
+    - Originals kept by the uploader are skipped: returns (None, None).
+    """
+    if "Sns" in rec:
+        job_id, status, bucket, key = parse_job_notification(json.loads(rec["Sns"]["Message"]))
+        logging.info("Textract job %s for %s finished with %s", job_id, key, status)
+
+        def fetch_job(*args, client=None, **kwargs):
+            response = get_expense_results(client, job_id)
+            if response is None:
+                raise RuntimeError(f"Textract job {job_id} is still running")
+            return response
+
+        data = process_image(bucket, key, client=client, cache=cache, s3=s3,
+                             force_reparse=True, fetch=fetch_job)
+        return build_record(data, bucket, key), job_id
+
+    bucket = rec["s3"]["bucket"]["name"]
+    key    = rec["s3"]["object"]["key"]
+
+    if key.startswith(ORIGINALS_PREFIX):
+        return None, None
+
+    if use_async(key):
+        if cache is not None and not force_reparse:
+            _, cached = lookup_cached_parse(bucket, key, cache, s3)
+            if cached is not None:
+                return build_record(cached, bucket, key), None
+        if notifications_enabled():
+            job_id = start_expense_job(client, bucket, key)
+            logging.info("Started Textract job %s for %s", job_id, key)
+            return None, job_id
+        data = process_image(bucket, key, client=client, cache=cache, s3=s3,
+                             force_reparse=True, fetch=partial(fetch_expense_async, max_wait=max_wait))
+        return build_record(data, bucket, key), None
+
+    data = process_image(bucket, key, client=client, cache=cache, s3=s3,
+                         force_reparse=force_reparse)
+    return build_record(data, bucket, key), None
+
+
+def unwrap_records(records):
+    """
+    Returns [(record, SQS message id or None)]. Upload notifications arrive
+    through an SQS queue so one invocation receives a batch window's worth
+    of receipts; each message body is an S3 event with its own Records
+    (none for the s3:TestEvent sent when the notification is configured).
+    S3 and SNS records invoked directly pass through unchanged.
+    """
+    unwrapped = []
+    for rec in records:
+        if rec.get("eventSource") == "aws:sqs":
+            body = json.loads(rec["body"])
+            unwrapped.extend((inner, rec["messageId"]) for inner in body.get("Records", []))
+        else:
+            unwrapped.append((rec, None))
+    return unwrapped
 
 
 def lambda_handler(event, context):
-    
+    """
+    Analyses every record in the event on a bounded thread pool, then
+    saves all parsed receipts in one batched write. A record that fails to
+    parse or to save is logged and reported in the response without failing
+    the rest of the batch.
+    Set "force_reparse": true on a manually invoked event to bypass the
+    parse cache. SNS records are completion notifications of asynchronous
+    Textract jobs (see process_record). For SQS batches, messages with a
+    failed record are listed in "batchItemFailures" so only they are retried.
+    """
     logging.debug("Lambda invoked with event: %s", json.dumps(event, default=str))
-    for rec in event.get("Records", []):
-        bucket    = rec["s3"]["bucket"]["name"]
-        key       = rec["s3"]["object"]["key"]
-        user_id   = key.split("/")[0]
-        upload_ts = datetime.now(timezone.utc).isoformat()
-
-        data = process_image(bucket, key)
-        data.update({
-            "id":           str(uuid.uuid4()),
-            "user_id":      user_id,
-            "upload_time":  upload_ts,
-            "contents":     data.pop("items")
-        })
-        save_to_dynamodb(data)
-        logging.debug("Record saved to DynamoDB for id=%s", data["id"])
-    return {"status": "processed"}
+    records = unwrap_records(event.get("Records", []))
+    if not records:
+        return {"status": "processed", "records": [], "batchItemFailures": []}
+
+    client  = get_textract()
+    s3      = get_s3()
+    cache   = get_parse_cache()
+    force   = bool(event.get("force_reparse", False))
+    workers = max(1, min(MAX_WORKERS, len(records)))
+    # Polled Textract jobs must finish in time to be parsed and saved
+    max_wait = MAX_WAIT_SECONDS
+    if hasattr(context, "get_remaining_time_in_millis"):
+        max_wait = max(0, min(max_wait, context.get_remaining_time_in_millis() / 1000 - SAVE_MARGIN_SECONDS))
+    results = []
+    parsed  = []
+    failed_messages = set()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_record, rec, client, cache, s3, force, max_wait): (rec, message_id)
+                   for rec, message_id in records}
+        for future in as_completed(futures):
+            rec, message_id = futures[future]
+            key = record_key(rec)
+            try:
+                data, job_id = future.result()
+            except Exception as e:
+                logging.error("Failed to process %s: %s", key, e, exc_info=True)
+                results.append({"key": key, "status": "error", "error": str(e)})
+                failed_messages.add(message_id)
+                continue
+            if data is None and job_id is None:
+                results.append({"key": key, "status": "skipped"})
+            elif data is None:
+                results.append({"key": key, "status": "started", "job_id": job_id})
+            else:
+                parsed.append((key, data, message_id))
+
+    if parsed:
+        try:
+            save_failures = save_records([data for _, data, _ in parsed])
+        except Exception as e:
+            logging.error("Failed to save %d records: %s", len(parsed), e, exc_info=True)
+            save_failures = {data["id"]: str(e) for _, data, _ in parsed}
+        for key, data, message_id in parsed:
+            if data["id"] in save_failures:
+                results.append({"key": key, "status": "error", "error": save_failures[data["id"]]})
+                failed_messages.add(message_id)
+            else:
+                results.append({"key": key, "status": "ok", "id": data["id"]})
+        logging.debug("Saved %d of %d records to DynamoDB", len(parsed) - len(save_failures), len(parsed))
+
+    failed = sum(1 for r in results if r["status"] == "error")
+    failed_messages.discard(None)
+    return {
+        "status":  "processed" if not failed else "partial_failure",
+        "failed":  failed,
+        "records": results,
+        "batchItemFailures": [{"itemIdentifier": m} for m in sorted(failed_messages)]
+    }
 
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     path = sys.argv[1] if len(sys.argv) > 1 else "images/receipt2.png"
-    user_id = path.split("/")[0]
-    upload_ts = datetime.now(timezone.utc).isoformat()
 
-    data = process_image(None, path, mode="local")
-    data.update({
-        "id":          str(uuid.uuid4()),
-        "user_id":     user_id,
-        "upload_time": upload_ts,
-        "contents":    data.pop("items")
-    })
+    # Keyed like an upload of the file to a bucket called "local", so
+    # running this again on the same file overwrites its record
+    data = build_record(process_image(None, path, mode="local"), "local", path)
 
     print(json.dumps(data, default=str, indent=2))
     logging.debug("Generated record for DynamoDB: %s", json.dumps(data, default=str, indent=2))
@@ -217,4 +693,4 @@ if __name__ == "__main__":
         save_to_dynamodb(data)
         logging.debug("Successfully saved record to DynamoDB")
     except Exception as e:
-        logging.error("Failed to save to DynamoDB: %s", e, exc_info=True)
\ No newline at end of file
+        logging.error("Failed to save to DynamoDB: %s", e, exc_info=True)
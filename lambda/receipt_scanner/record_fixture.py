@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Record a live AnalyzeExpense response as a replay fixture for bench_parser.py.
+
+Usage: python record_fixture.py <path/to/receipt.jpg> [fixtures/<name>.json]
+
+fixtures/synthetic_*.json were typed in by hand from images/receipt.jpg
+and images/receipt.png, with every Confidence set to 99.0, so they are not
+real Textract output. receipt.jpg shows the middle of the receipt only, so
+its fixture has no VENDOR_NAME and parses as shop "Unknown". Record
+responses for those images with this script (which names them
+receipt_jpg.json / receipt_png.json), then delete the synthetic ones and
+run bench_parser.py --update.
+"""
+import json
+import os
+import sys
+
+from receipt_processor import fetch_expense
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python record_fixture.py <path/to/receipt.jpg> [fixtures/<name>.json]")
+        sys.exit(1)
+
+    image_path = sys.argv[1]
+    if len(sys.argv) > 2:
+        out_path = sys.argv[2]
+    else:
+        name = os.path.basename(image_path).replace(".", "_")
+        out_path = os.path.join(FIXTURES_DIR, f"{name}.json")
+
+    response = fetch_expense(None, image_path, mode="local")
+    response.pop("ResponseMetadata", None)
+
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(response, f, indent=1)
+    print(f"Recorded {image_path} → {out_path}")
+
+
+if __name__ == "__main__":
+    main()
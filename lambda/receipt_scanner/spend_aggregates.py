@@ -0,0 +1,251 @@
+import logging
+import os
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from receipt_dates import receipt_ts
+
+# DynamoDB table of per-user, per-month, per-shop spend; unset disables aggregation
+# (and the version items, so the history endpoint then gives no ETags).
+# Items: user_id (hash), period_shop = "YYYY-MM#Shop" (range), month, shop,
+#        total, item_count, receipt_count
+# plus one period_shop = VERSION_KEY item per user, whose `version` goes up
+# whenever the user's receipts are saved (the history endpoint's ETag) and
+# `updated_at` records when, and one period_shop = CONTRIBUTION_PREFIX +
+# receipt id item per receipt recording what it added: `bucket` (the
+# "YYYY-MM#Shop" it was counted under), total, item_count and a `revision`.
+# "#" sorts before any month, so month range queries never see either.
+AGGREGATES_TABLE    = os.getenv("AGGREGATES_TABLE")
+VERSION_KEY         = "#version"
+CONTRIBUTION_PREFIX = "#receipt#"
+
+# A receipt whose contribution another invocation replaced between our read
+# and our write is re-read and retried this many times in all
+CONTRIBUTION_ATTEMPTS = 3
+
+UNKNOWN_SHOP = "Unknown"
+ZERO         = Decimal("0")
+
+
+def receipt_month(record):
+    """
+    "YYYY-MM" the receipt belongs to: its printed date when one can be read,
+    otherwise the month it was uploaded.
+    """
+    return (record.get("receipt_ts") or receipt_ts(record))[:7] or "unknown"
+
+
+def receipt_total(record):
+    """(total spend, item count) of a record, preferring the stored summary."""
+    if "total" in record and "item_count" in record:
+        return Decimal(record["total"]), int(record["item_count"])
+    contents = record.get("contents", [])
+    return sum((Decimal(item["price"]) for item in contents), ZERO), len(contents)
+
+
+def contribution(record):
+    """What a receipt adds to its user's aggregates: {"bucket", "total", "item_count"}."""
+    shop = record.get("shop") or UNKNOWN_SHOP
+    total, item_count = receipt_total(record)
+    return {"bucket": f"{receipt_month(record)}#{shop}", "total": total, "item_count": item_count}
+
+
+def contribution_deltas(old, new):
+    """
+    {"YYYY-MM#Shop": increment} that turns aggregates counting contribution
+    old (None for a receipt not counted yet) into ones counting new instead.
+    Saving an unchanged receipt again gives {}, so redelivered and
+    reprocessed receipts are never counted twice; a re-parse that moves a
+    receipt to another month or shop takes it out of the old bucket.
+    """
+    deltas = defaultdict(lambda: {"total": ZERO, "item_count": 0, "receipt_count": 0})
+    for sign, entry in ((-1, old), (1, new)):
+        if entry is None:
+            continue
+        delta = deltas[entry["bucket"]]
+        delta["total"]         += sign * Decimal(entry["total"])
+        delta["item_count"]    += sign * int(entry["item_count"])
+        delta["receipt_count"] += sign
+    return {bucket: delta for bucket, delta in deltas.items() if any(delta.values())}
+
+
+def same_contribution(old, new):
+    return old is not None and old["bucket"] == new["bucket"] and \
+        Decimal(old["total"]) == new["total"] and int(old["item_count"]) == new["item_count"]
+
+
+class InMemoryAggregateStore:
+    """
+    Local stand-in for the DynamoDB aggregates table, with the same
+    apply_receipts/bump_versions/query interface.
+    """
+
+    def __init__(self, clock=time.time):
+        self.items = {}
+        self.clock = clock
+
+    def apply_receipts(self, records):
+        for record in records:
+            key = (record["user_id"], CONTRIBUTION_PREFIX + record["id"])
+            old = self.items.get(key)
+            new = contribution(record)
+            if same_contribution(old, new):
+                continue
+            for bucket, delta in contribution_deltas(old, new).items():
+                month, shop = bucket.split("#", 1)
+                item = self.items.setdefault((record["user_id"], bucket), {
+                    "user_id": record["user_id"], "period_shop": bucket, "month": month, "shop": shop,
+                    "total": ZERO, "item_count": 0, "receipt_count": 0
+                })
+                for field, value in delta.items():
+                    item[field] += value
+            self.items[key] = dict(new, user_id=record["user_id"], period_shop=key[1],
+                                   revision=(old or {}).get("revision", 0) + 1)
+        return {}
+
+    def bump_versions(self, user_ids):
+        for user_id in set(user_ids):
+            item = self.items.setdefault((user_id, VERSION_KEY), {
+                "user_id": user_id, "period_shop": VERSION_KEY, "version": 0
+            })
+            item["version"] += 1
+            item["updated_at"] = int(self.clock())
+
+    def version(self, user_id):
+        return self.items.get((user_id, VERSION_KEY), {}).get("version", 0)
+
+    def query(self, user_id, from_month="0000-00", to_month="9999-99"):
+        return [
+            item for (user, period_shop), item in sorted(self.items.items())
+            if user == user_id and from_month <= period_shop[:7] <= to_month
+        ]
+
+
+class DynamoAggregateStore:
+    """
+    Aggregates in DynamoDB. Each receipt's contribution item is replaced
+    in the same transaction as the ADDs that move the aggregates from its
+    old contribution to its new one, conditional on the contribution not
+    having changed since it was read. So saving a receipt any number of
+    times counts it once, and concurrent scanner invocations can update
+    the same month and shop without a read-modify-write race.
+    """
+
+    def __init__(self, table, clock=time.time):
+        self.table = table
+        self.clock = clock
+
+    def apply_receipts(self, records):
+        """Counts each record in the aggregates once. Returns {record id: error} for failures."""
+        failed = {}
+        for record in records:
+            try:
+                self._apply_receipt(record)
+            except Exception as e:
+                logging.error("Failed to aggregate receipt %s: %s", record["id"], e)
+                failed[record["id"]] = str(e)
+        return failed
+
+    def _apply_receipt(self, record):
+        from botocore.exceptions import ClientError
+
+        key = {"user_id": record["user_id"], "period_shop": CONTRIBUTION_PREFIX + record["id"]}
+        new = contribution(record)
+        for attempt in range(CONTRIBUTION_ATTEMPTS):
+            old = self.table.get_item(Key=key, ConsistentRead=True).get("Item")
+            if same_contribution(old, new):
+                return
+            put = {"Put": {
+                "TableName": self.table.name,
+                "Item": dict(new, **key, revision=int(old["revision"]) + 1 if old else 1)
+            }}
+            if old is None:
+                put["Put"]["ConditionExpression"] = "attribute_not_exists(period_shop)"
+            else:
+                put["Put"].update(ConditionExpression="revision = :revision",
+                                  ExpressionAttributeValues={":revision": old["revision"]})
+            updates = [
+                {"Update": self._update(record["user_id"], bucket, delta)}
+                for bucket, delta in contribution_deltas(old, new).items()
+            ]
+            try:
+                self.table.meta.client.transact_write_items(TransactItems=[put] + updates)
+                return
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") != "TransactionCanceledException" or \
+                        attempt == CONTRIBUTION_ATTEMPTS - 1:
+                    raise
+
+    def _update(self, user_id, bucket, delta):
+        month, shop = bucket.split("#", 1)
+        return {
+            "TableName": self.table.name,
+            "Key": {"user_id": user_id, "period_shop": bucket},
+            "UpdateExpression": "ADD #total :total, item_count :items, receipt_count :receipts "
+                                "SET #month = :month, shop = :shop",
+            "ExpressionAttributeNames": {"#total": "total", "#month": "month"},
+            "ExpressionAttributeValues": {
+                ":total":    delta["total"],
+                ":items":    delta["item_count"],
+                ":receipts": delta["receipt_count"],
+                ":month":    month,
+                ":shop":     shop
+            }
+        }
+
+    def bump_versions(self, user_ids):
+        """Marks each user's receipts as changed, invalidating their ETags."""
+        for user_id in set(user_ids):
+            self.table.update_item(
+                Key={"user_id": user_id, "period_shop": VERSION_KEY},
+                UpdateExpression="ADD #version :one SET updated_at = :now",
+                ExpressionAttributeNames={"#version": "version"},
+                ExpressionAttributeValues={":one": 1, ":now": int(self.clock())}
+            )
+
+    def query(self, user_id, from_month="0000-00", to_month="9999-99"):
+        from boto3.dynamodb.conditions import Key
+
+        condition = Key("user_id").eq(user_id) & Key("period_shop").between(from_month, to_month + "#\uffff")
+        items, start_key = [], None
+        while True:
+            params = {"KeyConditionExpression": condition}
+            if start_key:
+                params["ExclusiveStartKey"] = start_key
+            resp = self.table.query(**params)
+            items.extend(resp.get("Items", []))
+            start_key = resp.get("LastEvaluatedKey")
+            if not start_key:
+                return items
+
+
+def backfill(receipts_table, store):
+    """
+    Builds aggregates from every receipt already in the receipts table.
+    Receipts are counted through their contribution items like any other
+    save, so it is safe to rerun. Returns (receipts read, {receipt id: error}
+    for the ones that could not be aggregated).
+    """
+    start_key, count, failed = None, 0, {}
+    while True:
+        params = {"ExclusiveStartKey": start_key} if start_key else {}
+        resp = receipts_table.scan(**params)
+        records = resp.get("Items", [])
+        failed.update(store.apply_receipts(records))
+        store.bump_versions(record["user_id"] for record in records)
+        count += len(records)
+        start_key = resp.get("LastEvaluatedKey")
+        if not start_key:
+            return count, failed
+
+
+if __name__ == "__main__":
+    import boto3
+
+    dynamodb = boto3.resource("dynamodb")
+    receipts = dynamodb.Table(os.getenv("DDB_TABLE", "ReceiptsTable"))
+    n, failed = backfill(receipts, DynamoAggregateStore(dynamodb.Table(AGGREGATES_TABLE or "ReceiptSpendAggregates")))
+    print(f"Aggregated {n - len(failed)} of {n} receipts")
+    for receipt_id, error in failed.items():
+        print(f"  {receipt_id}: {error}")
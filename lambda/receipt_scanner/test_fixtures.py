@@ -0,0 +1,36 @@
+import json
+import os
+
+import pytest
+
+from bench_parser import EXPECTED_DIR, load_corpus, render
+from receipt_processor import parse_expense
+
+CORPUS = load_corpus()
+
+
+@pytest.mark.parametrize("name", sorted(CORPUS))
+def test_parse_output_matches_the_expected_fixture(name):
+    # The same comparison as `python bench_parser.py --check`
+    with open(os.path.join(EXPECTED_DIR, f"{name}.json"), encoding="utf-8") as f:
+        assert render(parse_expense(CORPUS[name], name)) == json.load(f)
+
+
+def confidences(node):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "Confidence":
+                yield value
+            else:
+                yield from confidences(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from confidences(value)
+
+
+@pytest.mark.parametrize("name", [name for name in sorted(CORPUS) if name.startswith("synthetic_")])
+def test_hand_typed_fixtures_do_not_pass_for_recorded_output(name):
+    # Recorded fixtures are named after their image (record_fixture.py);
+    # typed ones carry a flat Confidence rather than made-up readings
+    assert set(confidences(CORPUS[name])) <= {99.0}
+    assert "ResponseMetadata" not in CORPUS[name]
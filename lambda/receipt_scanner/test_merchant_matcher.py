@@ -0,0 +1,53 @@
+import re
+
+import pytest
+
+from merchant_matcher import (
+    CONFIDENCE_PARTIAL, CONFIDENCE_WORD, MATCHER, MerchantMatcher, load_aliases, trie_pattern
+)
+
+
+def test_trie_pattern_matches_exactly_its_words():
+    words = ["co", "co-op", "coop", "tesco", "tesco express"]
+    regex = re.compile(trie_pattern(words))
+    assert all(regex.fullmatch(word) for word in words)
+    assert not any(regex.fullmatch(word) for word in ["c", "co-", "tesc", "tesco expres", "coopx"])
+
+
+def test_trie_pattern_escapes_regex_characters():
+    regex = re.compile(trie_pattern(["m&s", "b.q", "a+b"]))
+    assert regex.fullmatch("b.q") and not regex.fullmatch("bxq")
+    assert regex.fullmatch("a+b") and not regex.fullmatch("aab")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("TESCO STORES LTD\nClub card", ("Tesco", CONFIDENCE_WORD)),
+    ("Thank you for shopping at Co-op", ("Co-op", CONFIDENCE_WORD)),
+    ("tescostores.com", ("Tesco", CONFIDENCE_PARTIAL)),
+    ("Corner shop", (None, 0.0)),
+    ("", (None, 0.0)),
+    (None, (None, 0.0)),
+])
+def test_match_against_the_shipped_aliases(text, expected):
+    assert MATCHER.match(text) == expected
+
+
+def test_a_whole_word_match_beats_an_earlier_partial_one():
+    # "aldi" inside "waldie" comes first, but "lidl" stands on its own
+    assert MATCHER.match("Waldie Road LIDL GB") == ("Lidl", CONFIDENCE_WORD)
+
+
+def test_the_longest_alias_at_a_position_wins():
+    matcher = MerchantMatcher({"tesco": "Tesco", "tesco express": "Tesco Express"})
+    assert matcher.match("TESCO EXPRESS 1234") == ("Tesco Express", CONFIDENCE_WORD)
+    assert matcher.match("TESCO METRO") == ("Tesco", CONFIDENCE_WORD)
+
+
+def test_an_empty_table_matches_nothing():
+    assert MerchantMatcher({"": "Nobody"}).match("anything") == (None, 0.0)
+
+
+def test_load_aliases_lowercases_and_flattens(tmp_path):
+    path = tmp_path / "aliases.json"
+    path.write_text('{"Marks & Spencer": ["M&S", "marks and spencer", ""]}')
+    assert load_aliases(str(path)) == {"m&s": "Marks & Spencer", "marks and spencer": "Marks & Spencer"}
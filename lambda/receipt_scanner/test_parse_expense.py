@@ -0,0 +1,92 @@
+from decimal import Decimal
+
+import pytest
+
+from receipt_processor import QTY_LINE_RE, QTY_PREFIX_RE, parse_expense
+
+
+def field(fld_type, value):
+    return {"Type": {"Text": fld_type}, "ValueDetection": {"Text": value}}
+
+
+def response(*lines, vendor="Sainsbury's"):
+    """An AnalyzeExpense response with one line per (name, price[, extra fields]) tuple."""
+    items = []
+    for name, price, *extra in lines:
+        fields = [field("ITEM", name)] + ([field("PRICE", price)] if price else []) + list(extra)
+        items.append({"LineItemExpenseFields": fields})
+    return {"ExpenseDocuments": [{
+        "SummaryFields":  [field("VENDOR_NAME", vendor), field("TRANSACTION_DATE", "19/04/2025")],
+        "LineItemGroups": [{"LineItems": items}]
+    }]}
+
+
+def items(*lines):
+    return [
+        {k: v for k, v in item.items() if k in ("item", "price", "quantity", "unit_price")}
+        for item in parse_expense(response(*lines))["items"]
+    ]
+
+
+@pytest.mark.parametrize("text, quantity, unit_price", [
+    ("2 @ £1.25", "2", "1.25"),
+    ("0.658 kg @ £0.90/kg", "0.658", "0.90"),
+    ("1.2KG @ 2.50", "1.2", "2.50"),
+    ("3 x £0.50", "3", "0.50"),
+    ("3 × £0.50", "3", "0.50"),
+])
+def test_quantity_lines(text, quantity, unit_price):
+    assert QTY_LINE_RE.match(text).groups() == (quantity, unit_price)
+
+
+@pytest.mark.parametrize("text", ["HEINZ BEANS", "2 x HEINZ BEANS", "X6 EGGS", "£2.50"])
+def test_not_quantity_lines(text):
+    assert QTY_LINE_RE.match(text) is None
+
+
+@pytest.mark.parametrize("text, quantity, name", [
+    ("2 x HEINZ BEANS", "2", "HEINZ BEANS"),
+    ("2X WALKERS CRISPS", "2", "WALKERS CRISPS"),
+    ("12 × EGGS", "12", "EGGS"),
+    ("JS EGGS X6", None, None),
+])
+def test_quantity_prefixes(text, quantity, name):
+    match = QTY_PREFIX_RE.match(text)
+    assert (match.groups() if match else (None, None)) == (quantity, name)
+
+
+def test_a_quantity_line_completes_the_priceless_item_above_it():
+    assert items(("HEINZ BEANS", None), ("2 @ £1.25", "£2.50"), ("JS BANANAS", None),
+                 ("0.658 kg @ £0.90/kg", "£0.59")) == [
+        {"item": "HEINZ BEANS", "price": Decimal("2.50"), "quantity": Decimal("2"), "unit_price": Decimal("1.25")},
+        {"item": "JS BANANAS", "price": Decimal("0.59"), "quantity": Decimal("0.658"), "unit_price": Decimal("0.90")},
+    ]
+
+
+def test_a_quantity_line_is_not_attached_to_a_price_note():
+    parsed = items(("HEINZ BEANS", "£1.25"), ("PRICE REDUCTION", None), ("2 @ £1.25", "£2.50"))
+    assert [item["item"] for item in parsed] == ["HEINZ BEANS", "2 @ £1.25"]
+    assert "quantity" not in parsed[1]
+
+
+def test_a_prefixed_quantity_gives_the_unit_price():
+    assert items(("2 x HEINZ BEANS", "£2.50")) == [
+        {"item": "HEINZ BEANS", "price": Decimal("2.50"), "quantity": Decimal("2"), "unit_price": Decimal("1.25")}
+    ]
+
+
+def test_a_textract_quantity_field_wins_over_the_name():
+    assert items(("2 x COLA", "£3.00", field("QUANTITY", "3"))) == [
+        {"item": "2 x COLA", "price": Decimal("3.00"), "quantity": Decimal("3"), "unit_price": Decimal("1.00")}
+    ]
+
+
+def test_savings_and_unpriced_lines_are_skipped():
+    assert items(("Nectar Price Saving", "-£0.50"), ("CHANGE", "£5.00"), ("FREE BAG", "£0.00"),
+                 ("JS MILK", "£1.45")) == [{"item": "JS MILK", "price": Decimal("1.45")}]
+
+
+def test_merchant_and_date_come_from_the_summary_fields():
+    parsed = parse_expense(response(("JS MILK", "£1.45")), "alice/r1.jpg")
+    assert (parsed["shop"], parsed["receipt_time"], parsed["source"]) == ("Sainsbury", "19/04/2025", "alice/r1.jpg")
+    assert parse_expense(response(vendor="Corner Shop"))["shop"] == "Corner Shop"
@@ -0,0 +1,31 @@
+import pytest
+
+from receipt_dates import normalize_receipt_time, receipt_ts
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("12/05/24", "2024-05-12T00:00:00"),
+    ("12-05-2024 14:02", "2024-05-12T14:02:00"),
+    ("19/04/2025 11:40", "2025-04-19T11:40:00"),
+    ("12.05.2024", "2024-05-12T00:00:00"),
+    ("2024-05-12", "2024-05-12T00:00:00"),
+    ("05/13/24", "2024-05-13T00:00:00"),          # only possible month-first
+    ("12 May 2024 2:02 PM", "2024-05-12T14:02:00"),
+    ("1st Jan 24", "2024-01-01T00:00:00"),
+    ("May 12, 2024", "2024-05-12T00:00:00"),
+    ("12:30 AM 01/02/2024", "2024-02-01T00:30:00"),
+    ("12/05/2024 25:61", "2024-05-12T00:00:00"),  # garbled time, date kept
+])
+def test_dates_are_read_day_first(raw, expected):
+    assert normalize_receipt_time(raw) == expected
+
+
+@pytest.mark.parametrize("raw", [None, "", "TOTAL 12.50", "31/02/2024", "12/05/1999", "13/13/2024"])
+def test_unreadable_dates_are_none(raw):
+    assert normalize_receipt_time(raw) is None
+
+
+def test_receipt_ts_falls_back_to_the_upload_time():
+    assert receipt_ts({"receipt_time": "12/05/24"}) == "2024-05-12T00:00:00"
+    assert receipt_ts({"receipt_time": "??", "upload_time": "2024-06-01T09:15:42.123456"}) == "2024-06-01T09:15:42"
+    assert receipt_ts({}) == ""
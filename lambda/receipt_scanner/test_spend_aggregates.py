@@ -0,0 +1,163 @@
+from decimal import Decimal
+
+import pytest
+from botocore.exceptions import ClientError
+
+import receipt_processor
+from spend_aggregates import (
+    CONTRIBUTION_PREFIX, VERSION_KEY, DynamoAggregateStore, InMemoryAggregateStore,
+    contribution, contribution_deltas
+)
+
+
+def parse(shop="Tesco", date="12/05/2024", prices=("1.50", "2.25")):
+    return {
+        "shop":         shop,
+        "receipt_time": date,
+        "items":        [{"name": f"item {i}", "price": Decimal(p)} for i, p in enumerate(prices)]
+    }
+
+
+class FakeTable:
+    """
+    Just enough of a boto3 DynamoDB Table for DynamoAggregateStore: items
+    by key, get_item, query, and update_item/transact_write_items for the
+    expressions the store sends, including the contribution put's condition.
+    """
+
+    name = "ReceiptSpendAggregates"
+
+    def __init__(self):
+        self.items = {}
+        self.meta  = type("Meta", (), {"client": self})()
+
+    def get_item(self, Key, ConsistentRead=False):
+        item = self.items.get((Key["user_id"], Key["period_shop"]))
+        return {"Item": dict(item)} if item else {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+        item = self.items.setdefault((Key["user_id"], Key["period_shop"]), dict(Key))
+        values = ExpressionAttributeValues
+        if UpdateExpression.startswith("ADD #version"):
+            item["version"] = item.get("version", 0) + values[":one"]
+            item["updated_at"] = values[":now"]
+            return
+        for field, value in (("total", ":total"), ("item_count", ":items"), ("receipt_count", ":receipts")):
+            item[field] = item.get(field, 0) + values[value]
+        item.update(month=values[":month"], shop=values[":shop"])
+
+    def transact_write_items(self, TransactItems):
+        put = TransactItems[0]["Put"]
+        item = put["Item"]
+        current = self.items.get((item["user_id"], item["period_shop"]))
+        if put["ConditionExpression"] == "attribute_not_exists(period_shop)":
+            ok = current is None
+        else:
+            ok = current is not None and current["revision"] == put["ExpressionAttributeValues"][":revision"]
+        if not ok:
+            raise ClientError({"Error": {"Code": "TransactionCanceledException"}}, "TransactWriteItems")
+        self.items[(item["user_id"], item["period_shop"])] = dict(item)
+        for update in TransactItems[1:]:
+            update = dict(update["Update"])
+            update.pop("TableName")
+            self.update_item(**update)
+
+    def query(self, KeyConditionExpression):
+        # Every test uses a single user and the full month range
+        return {"Items": [item for key, item in sorted(self.items.items()) if not key[1].startswith("#")]}
+
+    def buckets(self, user_id):
+        return {
+            period_shop: item for (user, period_shop), item in self.items.items()
+            if user == user_id and not period_shop.startswith("#")
+        }
+
+
+def test_contribution_deltas_are_empty_for_an_unchanged_receipt():
+    record = receipt_processor.build_record(parse(), "bucket", "alice/r1.jpg")
+    assert contribution_deltas(contribution(record), contribution(record)) == {}
+
+
+def test_contribution_deltas_move_a_receipt_between_buckets():
+    old = {"bucket": "2024-05#Tesco", "total": Decimal("3.75"), "item_count": 2}
+    new = {"bucket": "2024-06#Aldi", "total": Decimal("4.00"), "item_count": 3}
+    assert contribution_deltas(old, new) == {
+        "2024-05#Tesco": {"total": Decimal("-3.75"), "item_count": -2, "receipt_count": -1},
+        "2024-06#Aldi":  {"total": Decimal("4.00"),  "item_count": 3,  "receipt_count": 1},
+    }
+
+
+@pytest.mark.parametrize("store_factory", [InMemoryAggregateStore, lambda: DynamoAggregateStore(FakeTable())])
+def test_applying_the_same_receipt_twice_counts_it_once(store_factory):
+    store = store_factory()
+    records = [
+        receipt_processor.build_record(parse(prices=prices), "bucket", f"alice/r{i}.jpg")
+        for i, prices in enumerate([("1.50", "2.25"), ("10.00",), ("0.99", "0.99", "0.99")])
+    ]
+    assert store.apply_receipts(records) == {}
+    assert store.apply_receipts(records[:1]) == {}
+
+    buckets = store.query("alice")
+    assert [(b["period_shop"], b["total"], b["item_count"], b["receipt_count"]) for b in buckets] == [
+        ("2024-05#Tesco", Decimal("16.72"), 6, 3)
+    ]
+
+
+def test_a_reparse_that_changes_month_and_shop_moves_the_receipt():
+    table = FakeTable()
+    store = DynamoAggregateStore(table)
+    store.apply_receipts([receipt_processor.build_record(parse(), "bucket", "alice/r1.jpg")])
+    store.apply_receipts([receipt_processor.build_record(
+        parse(shop="Aldi", date="02/06/2024", prices=("4.00",)), "bucket", "alice/r1.jpg")])
+
+    buckets = table.buckets("alice")
+    assert buckets["2024-05#Tesco"]["receipt_count"] == 0
+    assert buckets["2024-05#Tesco"]["total"] == 0
+    assert buckets["2024-06#Aldi"]["receipt_count"] == 1
+    assert buckets["2024-06#Aldi"]["total"] == Decimal("4.00")
+
+
+def test_a_contribution_changed_by_another_writer_is_reread():
+    table = FakeTable()
+    store = DynamoAggregateStore(table)
+    record = receipt_processor.build_record(parse(), "bucket", "alice/r1.jpg")
+    transact = table.transact_write_items
+
+    def racing_transact(TransactItems):
+        # Another invocation saves the same receipt between our read and write
+        table.transact_write_items = transact
+        DynamoAggregateStore(table).apply_receipts([record])
+        return transact(TransactItems)
+
+    table.transact_write_items = racing_transact
+    assert store.apply_receipts([record]) == {}
+    assert table.buckets("alice")["2024-05#Tesco"]["receipt_count"] == 1
+
+
+class FakeDynamoDB:
+    def batch_write_item(self, RequestItems):
+        return {"UnprocessedItems": {}}
+
+
+def test_reprocessing_the_same_object_does_not_inflate_aggregates(monkeypatch):
+    monkeypatch.setattr(receipt_processor, "get_dynamodb", lambda: FakeDynamoDB())
+    table = FakeTable()
+    store = DynamoAggregateStore(table)
+    objects = [("alice/r1.jpg", ("1.50", "2.25")), ("alice/r2.jpg", ("10.00",)), ("alice/r3.jpg", ("5.00",))]
+
+    def process(key, prices):
+        record = receipt_processor.build_record(parse(prices=prices), "bucket", key)
+        assert receipt_processor.save_records([record], aggregates=store) == {}
+
+    for key, prices in objects:
+        process(key, prices)
+    # Redelivered message, or a force_reparse of the same object
+    process(*objects[0])
+    process(*objects[0])
+
+    bucket = table.buckets("alice")["2024-05#Tesco"]
+    assert bucket["receipt_count"] == 3
+    assert bucket["total"] == Decimal("18.75")
+    assert bucket["item_count"] == 4
+    assert table.items[("alice", VERSION_KEY)]["version"] == 5
+    assert ("alice", CONTRIBUTION_PREFIX + receipt_processor.receipt_id("bucket", "alice/r1.jpg")) in table.items
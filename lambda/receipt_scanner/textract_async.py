@@ -0,0 +1,107 @@
+import hashlib
+import logging
+import os
+import time
+
+# Completion notifications for StartExpenseAnalysis jobs. Without both, jobs
+# are polled to completion inside the invocation that started them.
+SNS_TOPIC_ARN = os.getenv("TEXTRACT_SNS_TOPIC_ARN")
+SNS_ROLE_ARN  = os.getenv("TEXTRACT_SNS_ROLE_ARN")
+
+# Polling happens inside the scanner invocation, so it must end well before
+# the function's timeout (30 s) to leave time to parse and save; the scanner
+# also caps it by the invocation's remaining time. A job that outlasts it
+# fails the record, and the retry picks up the same job (see start_expense_job).
+POLL_SECONDS     = float(os.getenv("TEXTRACT_POLL_SECONDS", "2"))
+MAX_WAIT_SECONDS = float(os.getenv("TEXTRACT_MAX_WAIT_SECONDS", "20"))
+PAGE_SIZE        = 20
+
+
+class ExpenseJobFailed(Exception):
+    pass
+
+
+def notifications_enabled():
+    return bool(SNS_TOPIC_ARN and SNS_ROLE_ARN)
+
+
+def start_expense_job(client, bucket, key):
+    """
+    Starts an asynchronous expense analysis of s3://bucket/key and returns
+    its JobId. The request token is derived from the object, so a retried
+    S3 event reuses the running job instead of starting a second one.
+    """
+    params = {
+        "DocumentLocation":   {"S3Object": {"Bucket": bucket, "Name": key}},
+        "ClientRequestToken": hashlib.sha256(f"{bucket}/{key}".encode()).hexdigest()[:64],
+    }
+    if notifications_enabled():
+        params["NotificationChannel"] = {"SNSTopicArn": SNS_TOPIC_ARN, "RoleArn": SNS_ROLE_ARN}
+    return client.start_expense_analysis(**params)["JobId"]
+
+
+def get_expense_results(client, job_id):
+    """
+    Pages through GetExpenseAnalysis for a job and returns the results in
+    the same shape as an AnalyzeExpense response, or None if the job is
+    still running.
+    """
+    docs, warnings = [], []
+    next_token = None
+    while True:
+        params = {"JobId": job_id, "MaxResults": PAGE_SIZE}
+        if next_token:
+            params["NextToken"] = next_token
+        resp = client.get_expense_analysis(**params)
+
+        status = resp.get("JobStatus")
+        if status == "IN_PROGRESS":
+            return None
+        if status == "FAILED":
+            raise ExpenseJobFailed(f"Textract job {job_id} failed: {resp.get('StatusMessage')}")
+
+        docs.extend(resp.get("ExpenseDocuments", []))
+        warnings.extend(resp.get("Warnings", []))
+        next_token = resp.get("NextToken")
+        if not next_token:
+            break
+
+    if status == "PARTIAL_SUCCESS":
+        logging.warning("Textract job %s partially succeeded: %s", job_id, warnings)
+    return {
+        "DocumentMetadata": resp.get("DocumentMetadata", {}),
+        "ExpenseDocuments": docs,
+        "JobStatus":        status,
+        "Warnings":         warnings
+    }
+
+
+def wait_for_expense_job(client, job_id, poll_seconds=POLL_SECONDS,
+                         max_wait=MAX_WAIT_SECONDS, sleep=time.sleep):
+    """
+    Polls a job with backoff until it finishes; raises TimeoutError after max_wait.
+    """
+    deadline = time.monotonic() + max_wait
+    delay = poll_seconds
+    while True:
+        result = get_expense_results(client, job_id)
+        if result is not None:
+            return result
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(f"Textract job {job_id} still running after {max_wait:.0f}s")
+        sleep(delay)
+        delay = min(delay * 1.5, 10)
+
+
+def parse_job_notification(message):
+    """
+    Reads the SNS message Textract publishes on completion.
+    Returns (job_id, status, bucket, key).
+    """
+    location = message.get("DocumentLocation", {})
+    return (
+        message["JobId"],
+        message.get("Status"),
+        location.get("S3Bucket"),
+        location.get("S3ObjectName")
+    )
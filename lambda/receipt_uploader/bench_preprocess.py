@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark the upload-time image pre-processing on sample receipts.
+
+Reports original vs optimised bytes, dimensions, whether the paper was
+found and cropped, and processing time. With --textract, also runs both
+versions through Textract and the scanner's parser and reports whether the
+parsed items change (needs AWS credentials). Run it on real phone photos,
+not just the bundled samples, before changing the pre-processing settings.
+
+Usage: python bench_preprocess.py [--textract] [image ...]
+"""
+import argparse
+import glob
+import io
+import os
+import sys
+import time
+
+from PIL import Image
+
+from image_preprocess import find_paper, preprocess_image
+
+HERE        = os.path.dirname(os.path.abspath(__file__))
+SCANNER_DIR = os.path.join(HERE, "..", "receipt_scanner")
+
+
+def parse_bytes(data):
+    """Parsed line items for image bytes, via the scanner's own code path."""
+    if SCANNER_DIR not in sys.path:
+        sys.path.insert(0, SCANNER_DIR)
+    from receipt_processor import fetch_expense, parse_expense
+
+    response = fetch_expense(None, "bench", mode="local", img_bytes=data)
+    return [(i["item"], str(i["price"])) for i in parse_expense(response, "bench")["items"]]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("images", nargs="*")
+    parser.add_argument("--textract", action="store_true", help="compare parse output (calls AWS)")
+    args = parser.parse_args()
+
+    paths = args.images or sorted(
+        glob.glob(os.path.join(HERE, "images", "*")) + glob.glob(os.path.join(SCANNER_DIR, "images", "*"))
+    )
+
+    total_in = total_out = 0
+    print(f"{'image':<40} | {'bytes in':>9} | {'bytes out':>9} | {'saved':>6} | {'size out':>10} | {'paper':>5} | {'ms':>6}")
+    print("-" * 103)
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+
+        start = time.perf_counter()
+        optimised = preprocess_image(data)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        out = optimised or data
+        width, height = Image.open(io.BytesIO(out)).size
+        paper = "crop" if find_paper(Image.open(io.BytesIO(data)).convert("L")) else "none"
+        total_in, total_out = total_in + len(data), total_out + len(out)
+        name = os.path.relpath(path, HERE)
+        print(f"{name:<40} | {len(data):>9} | {len(out):>9} | {1 - len(out) / len(data):>6.1%} | "
+              f"{f'{width}x{height}':>10} | {paper:>5} | {elapsed_ms:>6.1f}")
+
+        if args.textract:
+            before, after = parse_bytes(data), parse_bytes(out)
+            if before == after:
+                print(f"    parse unchanged ({len(before)} items)")
+            else:
+                lost   = [i for i in before if i not in after]
+                gained = [i for i in after if i not in before]
+                print(f"    parse CHANGED: {len(before)} → {len(after)} items; lost {lost}; gained {gained}")
+
+    if total_in:
+        print(f"\nTotal: {total_in} → {total_out} bytes ({1 - total_out / total_in:.1%} saved)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import io
+import logging
+import os
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # without Pillow, uploads are stored exactly as received
+    Image = None
+
+# Receipts are printed on ~80 mm till roll; scale the cropped paper so it
+# lands at TARGET_DPI, which is plenty for OCR.
+TARGET_DPI     = int(os.getenv("PREPROCESS_TARGET_DPI", "300"))
+PAPER_WIDTH_MM = float(os.getenv("PREPROCESS_PAPER_WIDTH_MM", "80"))
+JPEG_QUALITY   = int(os.getenv("PREPROCESS_JPEG_QUALITY", "80"))
+
+# When no paper is found the whole photo is kept, and the receipt may be a
+# small part of it, so it is only capped by its long edge instead
+MAX_LONG_EDGE = int(os.getenv("PREPROCESS_MAX_LONG_EDGE", "4000"))
+
+# Size of the thumbnail used to find the paper, and how bright a column must
+# be (relative to the brightest) to count as part of the receipt. Rows need
+# less, since logos, barcodes and dense text rows are still paper.
+DETECT_SIZE     = 256
+PAPER_FILL      = 0.5
+ROW_FILL        = 0.25
+MIN_PAPER_SHARE = 0.1   # ignore detections smaller than this share of the photo
+MIN_PAPER_WIDTH = 0.15  # or narrower than this share of its width
+CROP_MARGIN     = 0.02
+# Just outside a crop, rows and columns must be background: if more than
+# this share of them is as bright as paper, the crop would cut the receipt
+EDGE_FILL       = 0.35
+
+
+def available():
+    return Image is not None
+
+
+def _otsu_threshold(histogram):
+    """Grey level that best separates dark background from bright paper."""
+    total = sum(histogram)
+    sum_all = sum(i * h for i, h in enumerate(histogram))
+    sum_bg, weight_bg = 0, 0
+    best, threshold = -1.0, 128
+    for level, count in enumerate(histogram):
+        weight_bg += count
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += level * count
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if between > best:
+            best, threshold = between, level
+    return threshold
+
+
+def _longest_run(flags):
+    """(start, end) of the longest run of True values, or None."""
+    best, start = None, None
+    for i, flag in enumerate(list(flags) + [False]):
+        if flag and start is None:
+            start = i
+        elif not flag and start is not None:
+            if best is None or i - start > best[1] - best[0]:
+                best = (start, i)
+            start = None
+    return best
+
+
+def find_paper(gray):
+    """
+    Bounding box (left, top, right, bottom) of the receipt in a greyscale
+    image, or None if no clear paper region is found or the box would not
+    be a plausible crop: paper running off the sides of the photo, too small
+    or narrow a region, or paper just outside the box, which it would cut.
+    """
+    thumb = gray.copy()
+    thumb.thumbnail((DETECT_SIZE, DETECT_SIZE))
+    threshold = _otsu_threshold(thumb.histogram())
+    width, height = thumb.size
+    pixels = thumb.load()
+    bright = [[pixels[x, y] > threshold for x in range(width)] for y in range(height)]
+
+    # Paper columns are the ones nearly as bright as the brightest column
+    col_fill = [sum(row[x] for row in bright) for x in range(width)]
+    cols = _longest_run(fill >= PAPER_FILL * max(col_fill) for fill in col_fill)
+    if cols is None:
+        return None
+    left, right = cols
+    # Paper running off the side of the photo is not a till roll in full view
+    if left == 0 or right == width:
+        return None
+    rows = _longest_run(sum(row[left:right]) >= ROW_FILL * (right - left) for row in bright)
+    if rows is None:
+        return None
+    top, bottom = rows
+
+    if (right - left) * (bottom - top) < MIN_PAPER_SHARE * width * height or \
+            right - left < MIN_PAPER_WIDTH * width:
+        return None
+
+    # The first row and column outside each side of the crop, margin included
+    margin_x, margin_y = round(CROP_MARGIN * width), round(CROP_MARGIN * height)
+    outside_cols = [x for x in (left - margin_x - 1, right + margin_x) if 0 <= x < width]
+    outside_rows = [y for y in (top - margin_y - 1, bottom + margin_y) if 0 <= y < height]
+    for x in outside_cols:
+        if sum(bright[y][x] for y in range(top, bottom)) > EDGE_FILL * (bottom - top):
+            return None
+    for y in outside_rows:
+        if sum(bright[y][left:right]) > EDGE_FILL * (right - left):
+            return None
+
+    scale_x, scale_y = gray.width / width, gray.height / height
+    return (
+        max(0, int((left - margin_x) * scale_x)),
+        max(0, int((top - margin_y) * scale_y)),
+        min(gray.width, int((right + margin_x) * scale_x)),
+        min(gray.height, int((bottom + margin_y) * scale_y)),
+    )
+
+
+def preprocess_image(data: bytes) -> bytes:
+    """
+    Shrinks a receipt photo before OCR: applies the EXIF rotation, converts
+    to greyscale, crops to the paper, downscales to TARGET_DPI (or, if no
+    paper is found, to MAX_LONG_EDGE) and recompresses as JPEG. Returns None if Pillow is missing, the bytes are
+    not an image, or the result would not be smaller than the input.
+    """
+    if Image is None:
+        return None
+    try:
+        img = Image.open(io.BytesIO(data))
+        img = ImageOps.exif_transpose(img)
+        gray = img.convert("L")
+    except Exception as e:
+        logging.warning("Skipping pre-processing, not a readable image: %s", e)
+        return None
+
+    box = find_paper(gray)
+    if box:
+        gray = gray.crop(box)
+        scale = TARGET_DPI * PAPER_WIDTH_MM / 25.4 / gray.width
+    else:
+        scale = MAX_LONG_EDGE / max(gray.size)
+    if scale < 1:
+        size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+        gray = gray.resize(size, Image.LANCZOS)
+
+    out = io.BytesIO()
+    gray.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    optimised = out.getvalue()
+    return optimised if len(optimised) < len(data) else None
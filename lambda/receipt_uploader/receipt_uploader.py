@@ -1,19 +1,295 @@
 import os
 import json
+import logging
 import uuid
 import base64
+import binascii
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from email.parser import BytesParser
+from email.policy import HTTP
 import boto3
+from botocore.config import Config
 
-s3 = boto3.client('s3')
 BUCKET = os.environ.get('RECEIPTS_BUCKET')
 
+# Shrink photos before storing/OCR; the untouched original is kept under
+# ORIGINALS_PREFIX, which the scanner ignores. image_preprocess (and Pillow)
+# is imported on the first upload that needs it, not at cold start.
+PREPROCESS_IMAGES       = os.environ.get('PREPROCESS_IMAGES', 'true').lower() == 'true'
+ORIGINALS_PREFIX        = os.environ.get('ORIGINALS_PREFIX', 'originals/')
+ORIGINALS_STORAGE_CLASS = os.environ.get('ORIGINALS_STORAGE_CLASS', 'STANDARD_IA')
+
+# Direct uploads: clients POST to UPLOAD_URL_PATH for a presigned PUT URL or
+# POST policy and send the image straight to S3, so it never passes through
+# Lambda. Both are limited to MAX_UPLOAD_BYTES and CONTENT_TYPES.
+UPLOAD_URL_PATH    = os.environ.get('UPLOAD_URL_PATH', '/receipt-upload-url')
+UPLOAD_URL_EXPIRES = int(os.environ.get('UPLOAD_URL_EXPIRES', '300'))
+MAX_UPLOAD_BYTES   = int(os.environ.get('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+
+# Batch uploads: several images per request, stored concurrently
+UPLOAD_BATCH_PATH  = os.environ.get('UPLOAD_BATCH_PATH', '/receipt-upload-batch')
+MAX_BATCH_IMAGES   = int(os.environ.get('MAX_BATCH_IMAGES', '20'))
+UPLOAD_MAX_WORKERS = int(os.environ.get('UPLOAD_MAX_WORKERS', '8'))
+
+# PDFs and TIFFs (possibly several pages) keep their extension, which is
+# what sends them to the scanner's asynchronous Textract path; only photos
+# are pre-processed
+CONTENT_TYPES = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'application/pdf': 'pdf',
+    'image/tiff': 'tif'
+}
+MAGIC_NUMBERS = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'%PDF-', 'application/pdf'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff')
+)
+PREPROCESSED_TYPES = ('image/jpeg', 'image/png')
+
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*',
     'Access-Control-Allow-Methods': 'POST,OPTIONS',
     'Access-Control-Allow-Headers': 'Content-Type,Authorization,user-id'
 }
 
+# Created on first use and kept for warm invocations, with the connection
+# held open between them. Presigned URLs must point at the bucket's regional
+# endpoint and be signed with SigV4.
+CLIENT_CONFIG = Config(
+    tcp_keepalive=True,
+    connect_timeout=5,
+    read_timeout=30,
+    max_pool_connections=max(10, UPLOAD_MAX_WORKERS),
+    signature_version='s3v4',
+    s3={'addressing_style': 'virtual'}
+)
+_s3 = None
+
+def get_s3():
+    global _s3
+    if _s3 is None:
+        _s3 = boto3.client('s3', config=CLIENT_CONFIG)
+    return _s3
+
+def respond(status, body):
+    return {
+        'statusCode': status,
+        'headers': CORS_HEADERS,
+        'body': json.dumps(body)
+    }
+
+def new_key(user_id, content_type='image/jpeg'):
+    timestamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+    return f"{user_id}/{timestamp}_{uuid.uuid4().hex}.{CONTENT_TYPES[content_type]}"
+
+def sniff_content_type(data):
+    for magic, content_type in MAGIC_NUMBERS:
+        if data.startswith(magic):
+            return content_type
+    return None
+
+def upload_url(event, user_id):
+    """
+    Hands out a presigned upload for a new receipt key.
+    Body: {"content_type": "image/jpeg", "method": "put" | "post", "content_length": N}
+    A PUT URL signs the exact Content-Length, so "content_length" is required;
+    a POST policy enforces the size range itself.
+    """
+    body = event.get('body') or '{}'
+    try:
+        if event.get('isBase64Encoded', False):
+            body = base64.b64decode(body)
+        params = json.loads(body)
+    except ValueError:
+        return respond(400, {'error': 'Body must be JSON'})
+    if not isinstance(params, dict):
+        return respond(400, {'error': 'Body must be a JSON object'})
+
+    content_type = params.get('content_type', 'image/jpeg')
+    if not isinstance(content_type, str) or content_type not in CONTENT_TYPES:
+        return respond(415, {'error': f"content_type must be one of {', '.join(CONTENT_TYPES)}"})
+
+    key = new_key(user_id, content_type)
+    result = {'bucket': BUCKET, 'key': key, 'expires_in': UPLOAD_URL_EXPIRES}
+
+    method = str(params.get('method', 'put')).lower()
+    if method == 'post':
+        post = get_s3().generate_presigned_post(
+            BUCKET,
+            key,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, MAX_UPLOAD_BYTES]
+            ],
+            ExpiresIn=UPLOAD_URL_EXPIRES
+        )
+        result.update({'method': 'POST', 'url': post['url'], 'fields': post['fields']})
+    elif method == 'put':
+        size = params.get('content_length')
+        if not isinstance(size, int) or isinstance(size, bool) or size < 1:
+            return respond(400, {'error': 'content_length (bytes) is required for PUT'})
+        if size > MAX_UPLOAD_BYTES:
+            return respond(413, {'error': f"Images are limited to {MAX_UPLOAD_BYTES} bytes"})
+        url = get_s3().generate_presigned_url(
+            'put_object',
+            Params={
+                'Bucket': BUCKET,
+                'Key': key,
+                'ContentType': content_type,
+                'ContentLength': size
+            },
+            ExpiresIn=UPLOAD_URL_EXPIRES
+        )
+        result.update({'method': 'PUT', 'url': url, 'headers': {'Content-Type': content_type}})
+    else:
+        return respond(400, {'error': 'method must be "put" or "post"'})
+
+    return respond(200, result)
+
+def read_image(event):
+    """
+    Decodes the request body once. With binary media types API Gateway
+    base64-encodes the raw upload, so that decode yields the image itself;
+    older clients send the image as base64 text, which needs a second decode
+    only when the first result is not already an image.
+    Raises ValueError if the body is not base64.
+    """
+    body = event.get('body') or ''
+    try:
+        data = base64.b64decode(body)
+        if event.get('isBase64Encoded', False) and sniff_content_type(data) is None:
+            data = base64.b64decode(data)
+    except (binascii.Error, ValueError):
+        raise ValueError('Body must be a base64-encoded JPEG, PNG, PDF or TIFF file')
+    return data
+
+def store_image(image_data, user_id):
+    """
+    Validates one image and stores it under a new key, keeping the original
+    when pre-processing makes a smaller copy. Returns the response entry
+    ({'key', ...}) or raises ValueError with a client-facing message.
+    """
+    if len(image_data) > MAX_UPLOAD_BYTES:
+        raise ValueError(f"Images are limited to {MAX_UPLOAD_BYTES} bytes")
+    content_type = sniff_content_type(image_data)
+    if content_type is None:
+        raise ValueError('Body must be a JPEG, PNG, PDF or TIFF file')
+
+    # Keep the original, then store the optimised (always JPEG) copy under the normal key
+    s3 = get_s3()
+    optimised = None
+    if PREPROCESS_IMAGES and content_type in PREPROCESSED_TYPES:
+        from image_preprocess import preprocess_image
+        optimised = preprocess_image(image_data)
+    key = new_key(user_id, 'image/jpeg' if optimised is not None else content_type)
+    result = { 'bucket': BUCKET, 'key': key }
+
+    if optimised is not None:
+        original_key = ORIGINALS_PREFIX + key
+        s3.put_object(
+            Bucket=BUCKET,
+            Key=original_key,
+            Body=image_data,
+            ContentType=content_type,
+            StorageClass=ORIGINALS_STORAGE_CLASS
+        )
+        result['original_key'] = original_key
+        image_data, content_type = optimised, 'image/jpeg'
+
+    # Upload to S3
+    s3.put_object(
+        Bucket=BUCKET,
+        Key=key,
+        Body=image_data,
+        ContentType=content_type
+    )
+    return result
+
+def read_batch(event):
+    """
+    Images of a batch request, as a list of bytes or of errors for entries
+    that could not be decoded. Accepts multipart/form-data (one file part
+    per image) or JSON: a list of base64 strings, or {"images": [...]}.
+    """
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    content_type = headers.get('content-type', '')
+    body = event.get('body') or ''
+
+    if content_type.startswith('multipart/form-data'):
+        try:
+            raw = base64.b64decode(body) if event.get('isBase64Encoded', False) else body.encode('latin-1')
+        except (binascii.Error, UnicodeEncodeError):
+            raise ValueError('Malformed multipart body')
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + raw
+        )
+        if not message.is_multipart():
+            raise ValueError('Malformed multipart body')
+        return [part.get_payload(decode=True) or b'' for part in message.iter_parts()]
+
+    try:
+        if event.get('isBase64Encoded', False):
+            body = base64.b64decode(body)
+        payload = json.loads(body)
+    except ValueError:
+        raise ValueError('Body must be JSON')
+    images = payload.get('images') if isinstance(payload, dict) else payload
+    if not isinstance(images, list):
+        raise ValueError('Expected a JSON array of base64 images or {"images": [...]}')
+
+    decoded = []
+    for image in images:
+        try:
+            decoded.append(base64.b64decode(image, validate=True))
+        except (TypeError, ValueError):
+            decoded.append(ValueError('Image is not valid base64'))
+    return decoded
+
+def upload_batch(event, user_id):
+    """
+    Stores every image of a batch request concurrently. Each image gets its
+    own entry in the response, in request order, with its key or its error;
+    one bad image does not fail the others.
+    """
+    try:
+        images = read_batch(event)
+    except ValueError as e:
+        return respond(400, {'error': str(e)})
+    event['body'] = None
+    if not images:
+        return respond(400, {'error': 'No images in request'})
+    if len(images) > MAX_BATCH_IMAGES:
+        return respond(413, {'error': f"At most {MAX_BATCH_IMAGES} images per request"})
+
+    def store(index, image):
+        entry = {'index': index}
+        try:
+            if isinstance(image, Exception):
+                raise image
+            entry.update(store_image(image, user_id), status='ok')
+        except ValueError as e:
+            entry.update(status='error', error=str(e))
+        except Exception as e:
+            logging.error('Failed to store image %d: %s', index, e, exc_info=True)
+            entry.update(status='error', error='Upload failed')
+        return entry
+
+    with ThreadPoolExecutor(max_workers=max(1, min(UPLOAD_MAX_WORKERS, len(images)))) as pool:
+        results = list(pool.map(store, range(len(images)), images))
+
+    failed = sum(1 for r in results if r['status'] == 'error')
+    return respond(200, {
+        'bucket': BUCKET,
+        'uploaded': len(results) - failed,
+        'failed': failed,
+        'images': results
+    })
+
 def lambda_handler(event, context):
     # Preflight support
     if event.get('httpMethod') == 'OPTIONS':
@@ -23,28 +299,28 @@ def lambda_handler(event, context):
             'body': ''
         }
 
-    # Extract user ID and base64 body
-    user_id = event.get('headers', {}).get('user-id', 'anonymous')
-    body = event.get('body', '')
-    if event.get('isBase64Encoded', False):
-        body = base64.b64decode(body).decode('utf-8')
-    image_data = base64.b64decode(body)
+    user_id = (event.get('headers') or {}).get('user-id', 'anonymous')
 
-    # Construct S3 key
-    timestamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
-    key = f"{user_id}/{timestamp}_{uuid.uuid4().hex}.jpg"
+    if event.get('resource') == UPLOAD_URL_PATH:
+        return upload_url(event, user_id)
+    if event.get('resource') == UPLOAD_BATCH_PATH:
+        return upload_batch(event, user_id)
 
-    # Upload to S3
-    s3.put_object(
-        Bucket=BUCKET,
-        Key=key,
-        Body=image_data,
-        ContentType='image/jpeg'
-    )
+    # Fallback: the image arrives in the request body. Reject bodies that
+    # cannot hold an allowed image even when base64-encoded twice (16/9 of
+    # the image size) before decoding anything.
+    if len(event.get('body') or '') > 2 * MAX_UPLOAD_BYTES:
+        return respond(413, {'error': f"Images are limited to {MAX_UPLOAD_BYTES} bytes"})
+    try:
+        image_data = read_image(event)
+    except ValueError as e:
+        return respond(400, {'error': str(e)})
+    event['body'] = None
+    try:
+        result = store_image(image_data, user_id)
+    except ValueError as e:
+        status = 413 if len(image_data) > MAX_UPLOAD_BYTES else 415
+        return respond(status, {'error': str(e)})
 
     # Response
-    return {
-        'statusCode': 200,
-        'headers': CORS_HEADERS,
-        'body': json.dumps({ 'bucket': BUCKET, 'key': key })
-    }
\ No newline at end of file
+    return respond(200, result)
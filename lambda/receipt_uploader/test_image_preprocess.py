@@ -0,0 +1,77 @@
+import io
+import os
+
+from PIL import Image, ImageDraw
+
+from image_preprocess import MAX_LONG_EDGE, find_paper, preprocess_image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def photo(size=(1200, 1600), paper=(450, 100, 750, 1500), background=40):
+    """A dark table with a white till receipt on it, lines of 'text' included."""
+    img = Image.new("L", size, background)
+    draw = ImageDraw.Draw(img)
+    draw.rectangle(paper, fill=245)
+    left, top, right, bottom = paper
+    for y in range(top + 40, bottom - 40, 30):
+        for x in range(left + 20, right - 40, 24):
+            draw.rectangle((x, y, x + 12, y + 8), fill=30)
+    return img
+
+
+def jpeg(img):
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=95)
+    return out.getvalue()
+
+
+def test_finds_the_paper_on_a_dark_background():
+    left, top, right, bottom = find_paper(photo())
+    assert 400 <= left <= 450 and 750 <= right <= 800
+    assert 50 <= top <= 100 and 1500 <= bottom <= 1550
+
+
+def test_keeps_the_header_of_the_sample_receipt():
+    # The "Sainsbury's" logo rows are dark enough to break a strict row fill
+    gray = Image.open(os.path.join(HERE, "..", "receipt_scanner", "images", "receipt.png")).convert("L")
+    left, top, right, bottom = find_paper(gray)
+    assert top <= 10 and bottom == gray.height
+    assert left <= 165 and right >= 320
+
+
+def test_a_dark_band_across_the_paper_does_not_split_it():
+    img = photo()
+    draw = ImageDraw.Draw(img)
+    for x in range(520, 680, 8):                                    # a barcode
+        draw.rectangle((x, 700, x + 4, 760), fill=30)
+    _, top, _, bottom = find_paper(img)
+    assert top <= 100 and bottom >= 1500
+
+
+def test_no_crop_when_the_paper_is_too_narrow():
+    assert find_paper(photo(paper=(580, 100, 620, 1500))) is None
+
+
+def test_no_crop_when_paper_continues_past_the_box():
+    # A fold's shadow across the receipt: cropping to the longer part
+    # would cut off the rest
+    img = photo()
+    ImageDraw.Draw(img).rectangle((450, 1000, 750, 1020), fill=40)
+    assert find_paper(img) is None
+
+
+def test_no_crop_when_the_paper_runs_off_the_sides():
+    assert find_paper(photo(paper=(0, 100, 1200, 1500))) is None
+
+
+def test_an_uncropped_photo_is_only_capped_at_the_long_edge():
+    scene = Image.new("L", (4032, 3024), 200)
+    ImageDraw.Draw(scene).rectangle((0, 0, 4032, 1500), fill=60)
+    out = Image.open(io.BytesIO(preprocess_image(jpeg(scene))))
+    assert max(out.size) == MAX_LONG_EDGE
+    assert out.size == (4000, 3000)
+
+
+def test_returns_none_for_bytes_that_are_not_an_image():
+    assert preprocess_image(b"not an image") is None
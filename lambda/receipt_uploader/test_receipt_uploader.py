@@ -0,0 +1,104 @@
+import base64
+import io
+import json
+
+import pytest
+from PIL import Image
+
+import receipt_uploader
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, ContentType, **kwargs):
+        self.objects[Key] = (Body, ContentType)
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    fake = FakeS3()
+    monkeypatch.setattr(receipt_uploader, "get_s3", lambda: fake)
+    monkeypatch.setattr(receipt_uploader, "PREPROCESS_IMAGES", False)
+    return fake
+
+
+def png_bytes():
+    out = io.BytesIO()
+    Image.new("RGB", (8, 8), "white").save(out, format="PNG")
+    return out.getvalue()
+
+
+def upload(body, base64_encoded=False, resource="/receipt_uploader_lambda", headers=None):
+    event = {"resource": resource, "body": body, "isBase64Encoded": base64_encoded,
+             "headers": dict({"user-id": "alice"}, **(headers or {}))}
+    response = receipt_uploader.lambda_handler(event, None)
+    return response["statusCode"], json.loads(response["body"])
+
+
+@pytest.mark.parametrize("body", ["abc", "not base64 !!!"])
+@pytest.mark.parametrize("base64_encoded", [False, True])
+def test_a_body_that_is_not_base64_is_a_400(s3, body, base64_encoded):
+    status, response = upload(body, base64_encoded)
+    assert status == 400
+    assert response == {"error": "Body must be a base64-encoded JPEG, PNG, PDF or TIFF file"}
+    assert s3.objects == {}
+
+
+def test_base64_text_of_a_png_is_stored(s3):
+    status, response = upload(base64.b64encode(png_bytes()).decode())
+    assert status == 200
+    assert response["key"].startswith("alice/") and response["key"].endswith(".png")
+    assert s3.objects[response["key"]] == (png_bytes(), "image/png")
+
+
+def test_a_binary_upload_is_decoded_once(s3):
+    status, response = upload(base64.b64encode(png_bytes()).decode(), base64_encoded=True)
+    assert status == 200
+    assert s3.objects[response["key"]][0] == png_bytes()
+
+
+def test_a_decodable_body_that_is_not_an_image_is_a_415(s3):
+    status, response = upload(base64.b64encode(b"GIF89a not allowed").decode())
+    assert status == 415
+
+
+def test_a_batch_body_that_is_not_json_gets_a_fixed_message(s3):
+    status, response = upload("[not json", resource=receipt_uploader.UPLOAD_BATCH_PATH,
+                              headers={"Content-Type": "application/json"})
+    assert status == 400
+    assert response == {"error": "Body must be JSON"}
+
+
+def test_batch_entries_fail_on_their_own(s3):
+    images = [base64.b64encode(png_bytes()).decode(), "abc"]
+    status, response = upload(json.dumps(images), resource=receipt_uploader.UPLOAD_BATCH_PATH)
+    assert status == 200
+    assert [entry["status"] for entry in response["images"]] == ["ok", "error"]
+    assert response["images"][1]["error"] == "Image is not valid base64"
+
+
+@pytest.mark.parametrize("body", ["null", "[]", "3", "true"])
+def test_upload_url_bodies_that_are_not_objects_are_a_400(s3, body):
+    status, response = upload(body, resource=receipt_uploader.UPLOAD_URL_PATH)
+    assert status == 400
+    assert response == {"error": "Body must be a JSON object"}
+
+
+def test_upload_url_needs_an_integer_content_length_for_put(s3):
+    status, _ = upload(json.dumps({"content_length": True}), resource=receipt_uploader.UPLOAD_URL_PATH)
+    assert status == 400
+
+
+@pytest.mark.parametrize("data, content_type, extension", [
+    (b"%PDF-1.7\n...", "application/pdf", ".pdf"),
+    (b"II*\x00" + bytes(16), "image/tiff", ".tif"),
+    (b"MM\x00*" + bytes(16), "image/tiff", ".tif"),
+])
+def test_documents_are_stored_as_is_for_the_async_textract_path(s3, monkeypatch, data, content_type, extension):
+    monkeypatch.setattr(receipt_uploader, "PREPROCESS_IMAGES", True)
+    status, response = upload(base64.b64encode(data).decode())
+    assert status == 200
+    assert response["key"].endswith(extension) and "original_key" not in response
+    assert s3.objects == {response["key"]: (data, content_type)}
@@ -0,0 +1,159 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+
+logger = logging.getLogger()
+
+# In-process layer: per warm container
+LOCAL_CACHE_SIZE = int(os.getenv("FEED_CACHE_LOCAL_SIZE", "256"))
+
+# Shared layer: DynamoDB table keyed by cache_key; unset keeps the cache local
+FEED_CACHE_TABLE = os.getenv("FEED_CACHE_TABLE")
+
+# Entrez only treats these as operators when they are upper case
+BOOLEAN_OPERATORS = {"AND", "OR", "NOT"}
+
+# Entries bigger than this are kept local only (DynamoDB items max out at 400 KB)
+MAX_SHARED_BYTES = 350 * 1024
+
+
+def normalize_params(params):
+    """
+    Canonical form of eutils query parameters: names lowercased, values
+    stripped, empty ones dropped, and search terms whitespace- and
+    case-folded (keeping AND/OR/NOT), so equivalent searches share a cache
+    entry. The result is also what gets sent to eutils.
+    """
+    normalized = {}
+    for name, value in params.items():
+        name = str(name).strip().lower()
+        words = str(value).split()
+        if not words:
+            continue
+        if name == "term":
+            words = [w if w in BOOLEAN_OPERATORS else w.lower() for w in words]
+        normalized[name] = " ".join(words)
+    return dict(sorted(normalized.items()))
+
+
+def cache_key(endpoint, params):
+    """Short, fixed-length key for an endpoint and its normalized parameters."""
+    query = urllib.parse.urlencode(normalize_params(params))
+    return f"{endpoint}:{hashlib.sha256(query.encode('utf-8')).hexdigest()}"
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire at a given time.
+    Doubles as the local stand-in for the shared layer. Both layers store
+    (value, expires_at), so an entry copied from the shared layer expires
+    when the original does.
+    """
+
+    def __init__(self, maxsize=LOCAL_CACHE_SIZE, clock=time.time):
+        self.maxsize = maxsize
+        self.clock   = clock
+        self.entries = OrderedDict()
+        self.lock    = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= self.clock():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, value, expires_at):
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+
+class DynamoCache:
+    """
+    Shared layer in DynamoDB. `expires_at` doubles as the table's TTL
+    attribute; it is also checked on read because DynamoDB removes expired
+    items lazily.
+    """
+
+    def __init__(self, table, clock=time.time):
+        self.table = table
+        self.clock = clock
+
+    def get(self, key):
+        item = self.table.get_item(Key={"cache_key": key}).get("Item")
+        if not item or int(item.get("expires_at", 0)) <= self.clock():
+            return None
+        return item["value"], int(item["expires_at"])
+
+    def put(self, key, value, expires_at):
+        self.table.put_item(Item={
+            "cache_key":  key,
+            "value":      value,
+            "expires_at": int(expires_at)
+        })
+
+
+class TwoTierCache:
+    """
+    In-process TTL cache in front of an optional shared cache. A local miss
+    tries the shared layer (and copies a hit into the local one); a miss on
+    both calls fetch() and stores the result in both. Shared-layer errors
+    are logged and treated as misses, so the cache never fails a request.
+    """
+
+    def __init__(self, local, shared=None, clock=time.time):
+        self.local  = local
+        self.shared = shared
+        self.clock  = clock
+        self.stats  = {"local_hits": 0, "shared_hits": 0, "misses": 0, "shared_errors": 0}
+        self.lock   = threading.Lock()
+
+    def _count(self, counter):
+        with self.lock:
+            self.stats[counter] += 1
+
+    def get_or_fetch(self, key, fetch, ttl):
+        """Returns (value, "local" | "shared" | "miss")."""
+        entry = self.local.get(key)
+        if entry is not None:
+            self._count("local_hits")
+            return entry[0], "local"
+
+        if self.shared is not None:
+            try:
+                entry = self.shared.get(key)
+            except Exception as e:
+                self._count("shared_errors")
+                logger.warning("Shared cache read failed for %s: %s", key, e)
+            if entry is not None:
+                self._count("shared_hits")
+                self.local.put(key, *entry)
+                return entry[0], "shared"
+
+        self._count("misses")
+        value = fetch()
+        expires_at = self.clock() + ttl
+        self.local.put(key, value, expires_at)
+        if self.shared is not None and len(value) <= MAX_SHARED_BYTES:
+            try:
+                self.shared.put(key, value, expires_at)
+            except Exception as e:
+                self._count("shared_errors")
+                logger.warning("Shared cache write failed for %s: %s", key, e)
+        return value, "miss"
+
+    def hit_rate(self):
+        hits = self.stats["local_hits"] + self.stats["shared_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
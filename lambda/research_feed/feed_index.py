@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from feed_cache import normalize_params
+
+logger = logging.getLogger()
+
+# Summaries for the feed's recurring topics, harvested on a schedule into a
+# SQLite file. With FEED_INDEX_BUCKET set, the harvester publishes it to S3
+# and each container keeps a copy at FEED_INDEX_PATH, re-checking S3 every
+# FEED_INDEX_CHECK seconds; without it, a file packaged at FEED_INDEX_PATH
+# is used as is.
+FEED_INDEX_BUCKET = os.getenv("FEED_INDEX_BUCKET")
+FEED_INDEX_KEY    = os.getenv("FEED_INDEX_KEY", "research-feed/feed_index.sqlite")
+FEED_INDEX_PATH   = os.getenv("FEED_INDEX_PATH", "/tmp/feed_index.sqlite")
+FEED_INDEX_CHECK  = int(os.getenv("FEED_INDEX_CHECK", "300"))
+
+# Topics harvested longer ago than this are not served from the index
+FEED_INDEX_MAX_AGE = int(os.getenv("FEED_INDEX_MAX_AGE", str(2 * 86400)))
+
+# What to harvest: [{"term": ..., "source": "pubmed" | "pmc"}, ...], and how
+# many of each topic's newest results to keep
+FEED_TOPICS_FILE = os.getenv("FEED_TOPICS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "feed_topics.json"))
+HARVEST_DEPTH    = int(os.getenv("HARVEST_DEPTH", "200"))
+
+# topic_articles keeps every ID ESearch returned, in order, so any window of
+# it matches the live search; articles has the summary of each one found
+SCHEMA = """
+CREATE TABLE topics (
+    source TEXT, term TEXT, total INTEGER, harvested INTEGER, harvested_at INTEGER,
+    PRIMARY KEY (source, term)
+);
+CREATE TABLE topic_articles (
+    source TEXT, term TEXT, rank INTEGER, uid TEXT,
+    PRIMARY KEY (source, term, rank)
+);
+CREATE TABLE articles (
+    source TEXT, uid TEXT, article TEXT,
+    PRIMARY KEY (source, uid)
+);
+"""
+
+
+def topic_key(term):
+    """The form a search term is stored and looked up in: as normalized for the cache."""
+    return normalize_params({"term": term}).get("term", "")
+
+
+def load_topics(path=FEED_TOPICS_FILE):
+    with open(path) as f:
+        return [(topic.get("source", "pubmed"), topic["term"]) for topic in json.load(f)]
+
+
+def build_index(path, topics, search, summarize, depth=HARVEST_DEPTH, clock=time.time):
+    """
+    Harvests each (source, term) topic into a new SQLite index at path: the
+    first `depth` IDs ESearch returns for it and their summaries.
+    search(source, term, depth) returns (ids, total count) and
+    summarize(source, ids) returns {uid: article}. A topic that fails is
+    logged and left out, so searches for it go live.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    summary = {"topics": 0, "articles": 0, "failed": []}
+    for source, term in topics:
+        term = topic_key(term)
+        try:
+            ids, total = search(source, term, depth)
+            articles = summarize(source, ids) if ids else {}
+        except Exception as e:
+            logger.warning("Harvest of %s %r failed: %s", source, term, e)
+            summary["failed"].append(term)
+            continue
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO topics VALUES (?, ?, ?, ?, ?)",
+                         (source, term, total, len(ids), int(clock())))
+            conn.executemany("INSERT INTO topic_articles VALUES (?, ?, ?, ?)",
+                             [(source, term, rank, uid) for rank, uid in enumerate(ids)])
+            conn.executemany("INSERT OR REPLACE INTO articles VALUES (?, ?, ?)",
+                             [(source, uid, json.dumps(article)) for uid, article in articles.items()])
+        summary["topics"] += 1
+        summary["articles"] += len(articles)
+    conn.close()
+    return summary
+
+
+class FeedIndex:
+    """Read-only view of a harvested index file."""
+
+    def __init__(self, path, max_age=FEED_INDEX_MAX_AGE, clock=time.time):
+        self.path    = path
+        self.conn    = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self.max_age = max_age
+        self.clock   = clock
+
+    def lookup(self, source, term, retstart, retmax):
+        """
+        (articles, age in seconds) for results retstart..retstart+retmax of
+        a search, or None when the index can't answer it exactly as ESearch
+        would: topic not harvested, harvest too old, or the window reaches
+        past the harvested results.
+        """
+        row = self.conn.execute(
+            "SELECT total, harvested, harvested_at FROM topics WHERE source = ? AND term = ?",
+            (source, topic_key(term))
+        ).fetchone()
+        if row is None:
+            return None
+        total, harvested, harvested_at = row
+        age = self.clock() - harvested_at
+        if age > self.max_age or (retstart + retmax > harvested and harvested < total):
+            return None
+        rows = self.conn.execute(
+            "SELECT a.article FROM topic_articles t JOIN articles a ON a.source = t.source AND a.uid = t.uid "
+            "WHERE t.source = ? AND t.term = ? AND t.rank >= ? AND t.rank < ? ORDER BY t.rank",
+            (source, topic_key(term), retstart, retstart + retmax)
+        ).fetchall()
+        return [json.loads(article) for article, in rows], age
+
+    def close(self):
+        self.conn.close()
+
+
+class IndexLoader:
+    """
+    Keeps a container's FeedIndex current. With an S3 client it checks the
+    object's ETag at most every `check_every` seconds and downloads a new
+    version next to the old one before swapping it in; without one it opens
+    the file at path if there is one. Errors are logged and leave the
+    current index (or none) in place, so the feed falls back to eutils.
+    """
+
+    def __init__(self, s3=None, bucket=FEED_INDEX_BUCKET, key=FEED_INDEX_KEY, path=FEED_INDEX_PATH,
+                 check_every=FEED_INDEX_CHECK, clock=time.monotonic):
+        self.s3          = s3
+        self.bucket      = bucket
+        self.key         = key
+        self.path        = path
+        self.check_every = check_every
+        self.clock       = clock
+        self.index       = None
+        self.etag        = None
+        self.checked     = None
+
+    def current(self):
+        """The index to search, or None."""
+        now = self.clock()
+        if self.checked is None or (self.s3 is not None and now - self.checked >= self.check_every):
+            self.checked = now
+            try:
+                self._refresh()
+            except Exception as e:
+                logger.warning("Feed index refresh failed: %s", e)
+        return self.index
+
+    def _refresh(self):
+        if self.s3 is None:
+            if os.path.exists(self.path):
+                self.index = FeedIndex(self.path)
+            return
+        etag = self.s3.head_object(Bucket=self.bucket, Key=self.key)["ETag"]
+        if etag == self.etag:
+            return
+        # Each version gets its own file, so the one in use is never overwritten
+        version = etag.strip('"')
+        path = f"{self.path}.{version}"
+        self.s3.download_file(self.bucket, self.key, path)
+        old, self.index, self.etag = self.index, FeedIndex(path), etag
+        if old is not None:
+            old.close()
+            os.remove(old.path)
+        logger.info("Loaded feed index %s (%s)", self.key, etag)
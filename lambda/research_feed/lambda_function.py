@@ -1,20 +1,137 @@
 import json
-import urllib.parse
-import urllib.request
+import os
 import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from functools import lru_cache
+
+from feed_cache import FEED_CACHE_TABLE, DynamoCache, TTLCache, TwoTierCache, cache_key, normalize_params
+from feed_index import FEED_INDEX_BUCKET, FEED_INDEX_KEY, IndexLoader, build_index, load_topics
+from ncbi_client import get_client
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-NCBI_ESEARCH_BASE = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
-NCBI_ESUMMARY_BASE = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi"
+ESEARCH  = "esearch.fcgi"
+ESUMMARY = "esummary.fcgi"
+
+# How long responses are reused: searches pick up new papers, while the
+# summary of a given article list hardly ever changes
+SEARCH_CACHE_TTL  = int(os.getenv("SEARCH_CACHE_TTL", "900"))
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", "86400"))
+
+# ESummary is fetched in chunks of this many IDs, several at a time; every
+# request to NCBI (cache misses only) goes through the client's rate limiter
+ESUMMARY_CHUNK   = int(os.getenv("ESUMMARY_CHUNK", "50"))
+ESUMMARY_WORKERS = int(os.getenv("ESUMMARY_WORKERS", "4"))
+
+_cache        = None
+_index_loader = None
+
+
+def get_cache():
+    """
+    Two-tier response cache: in-process, then the shared DynamoDB table
+    when FEED_CACHE_TABLE is set. Created on first use and kept for warm
+    invocations.
+    """
+    global _cache
+    if _cache is None:
+        shared = None
+        if FEED_CACHE_TABLE:
+            import boto3
+            shared = DynamoCache(boto3.resource("dynamodb").Table(FEED_CACHE_TABLE))
+        _cache = TwoTierCache(TTLCache(), shared)
+    return _cache
+
+
+def get_index():
+    """
+    The harvested topic index (see feed_index.py), or None. Kept in sync
+    with S3 when FEED_INDEX_BUCKET is set; otherwise read from a file
+    packaged at FEED_INDEX_PATH, if any.
+    """
+    global _index_loader
+    if _index_loader is None:
+        s3 = None
+        if FEED_INDEX_BUCKET:
+            import boto3
+            s3 = boto3.client("s3")
+        _index_loader = IndexLoader(s3)
+    return _index_loader.current()
+
+
+def cached_fetch(endpoint, params, ttl):
+    """
+    Response body of an eutils call, from the cache when an equivalent
+    request (same normalized parameters) was made within ttl seconds.
+    Returns (body, "local" | "shared" | "miss").
+    """
+    params = normalize_params(params)
+    return get_cache().get_or_fetch(cache_key(endpoint, params), lambda: get_client().get(endpoint, params), ttl)
+
+
+def fetch_summaries(source, id_list):
+    """
+    ESummary results for id_list, fetched in ESUMMARY_CHUNK-sized chunks on
+    a small thread pool and merged back in the original order: returns
+    ({"uids": [...], uid: item, ...}, cache status of each chunk).
+    """
+    chunks = [id_list[i:i + ESUMMARY_CHUNK] for i in range(0, len(id_list), ESUMMARY_CHUNK)]
+
+    def fetch_chunk(chunk):
+        params = {"db": source, "id": ",".join(chunk), "retmode": "json"}
+        body, status = cached_fetch(ESUMMARY, params, SUMMARY_CACHE_TTL)
+        return json.loads(body).get("result", {}), status
+
+    with ThreadPoolExecutor(max_workers=max(1, min(ESUMMARY_WORKERS, len(chunks)))) as pool:
+        parts = list(pool.map(fetch_chunk, chunks))
+
+    merged = {"uids": []}
+    for result, _ in parts:
+        merged["uids"].extend(result.get("uids", []))
+        merged.update((uid, item) for uid, item in result.items() if uid != "uids")
+    return merged, [status for _, status in parts]
+
+
+def to_article(uid, item, source):
+    """Feed entry for one ESummary item."""
+    return {
+        "id": uid,
+        "title": item.get("title"),
+        "journal": item.get("fulljournalname"),
+        "authors": [a.get("name") for a in item.get("authors", [])],
+        "pubdate": item.get("pubdate", ""),
+        "source": source,
+        "url": f"https://www.ncbi.nlm.nih.gov/{source}/articles/{uid}/" if source == "pmc" else f"https://pubmed.ncbi.nlm.nih.gov/{uid}/"
+    }
+
+
+def published(article):
+    """False for articles dated in a future year, which the feed leaves out."""
+    try:
+        return int(article["pubdate"][:4]) <= datetime.now().year
+    except ValueError:
+        return True
+
+
+def search_ids(source, term, retmax):
+    """(IDs, total count) of a live, uncached ESearch in feed order."""
+    params = {"db": source, "term": term, "retmode": "json", "retmax": retmax, "retstart": 0, "sort": "pub+date"}
+    result = json.loads(get_client().get(ESEARCH, normalize_params(params))).get("esearchresult", {})
+    return result.get("idlist", []), int(result.get("count", 0))
+
+
+def summarize_ids(source, id_list):
+    """{uid: feed entry} for the IDs ESummary has an item for."""
+    result, _ = fetch_summaries(source, id_list)
+    return {uid: to_article(uid, result[uid], source) for uid in result["uids"] if result.get(uid)}
+
+
+def cache_header(cache_status):
+    """X-Cache value, e.g. "esearch=local, esummary=miss"."""
+    return ", ".join(f"{name}={status}" for name, status in cache_status.items())
 
-@lru_cache(maxsize=128)
-def cached_fetch(url):
-    with urllib.request.urlopen(url) as response:
-        return response.read().decode()
 
 def lambda_handler(event, context):
     cors_headers = {
@@ -38,6 +155,22 @@ def lambda_handler(event, context):
             "headers": cors_headers
         }
 
+    # Recurring topics are answered from the harvested index when it is fresh
+    index = get_index()
+    if index is not None:
+        try:
+            hit = index.lookup(source, term, int(retstart), int(retmax))
+        except Exception as e:
+            logger.warning("Feed index lookup failed: %s", e)
+            hit = None
+        if hit is not None:
+            articles, age = hit
+            return {
+                "statusCode": 200,
+                "body": json.dumps({"articles": [a for a in articles if published(a)]}),
+                "headers": dict(cors_headers, **{"X-Cache": "index", "X-Index-Age": str(int(age))})
+            }
+
     esearch_params = {
         "db": source,
         "term": term,
@@ -47,9 +180,10 @@ def lambda_handler(event, context):
         "sort": "pub+date"
     }
 
-    esearch_url = f"{NCBI_ESEARCH_BASE}?{urllib.parse.urlencode(esearch_params)}"
+    cache_status = {}
     try:
-        esearch_data = json.loads(cached_fetch(esearch_url))
+        body, cache_status["esearch"] = cached_fetch(ESEARCH, esearch_params, SEARCH_CACHE_TTL)
+        esearch_data = json.loads(body)
     except Exception as e:
         return {
             "statusCode": 502,
@@ -62,18 +196,12 @@ def lambda_handler(event, context):
         return {
             "statusCode": 200,
             "body": json.dumps({"articles": []}),
-            "headers": cors_headers
+            "headers": dict(cors_headers, **{"X-Cache": cache_header(cache_status)})
         }
 
-    esummary_params = {
-        "db": source,
-        "id": ",".join(id_list),
-        "retmode": "json"
-    }
-
-    esummary_url = f"{NCBI_ESUMMARY_BASE}?{urllib.parse.urlencode(esummary_params)}"
     try:
-        esummary_data = json.loads(cached_fetch(esummary_url))
+        result, chunk_status = fetch_summaries(source, id_list)
+        cache_status["esummary"] = "/".join(chunk_status)
     except Exception as e:
         return {
             "statusCode": 502,
@@ -81,7 +209,6 @@ def lambda_handler(event, context):
             "headers": cors_headers
         }
 
-    result = esummary_data.get("result", {})
     uids = result.get("uids", [])
     articles = []
 
@@ -90,26 +217,28 @@ def lambda_handler(event, context):
         if not item:
             continue
 
-        pub_date = item.get("pubdate", "")
-        try:
-            pub_year = int(pub_date[:4])
-            if pub_year > datetime.now().year:
-                continue
-        except:
-            pass
-
-        articles.append({
-            "id": uid,
-            "title": item.get("title"),
-            "journal": item.get("fulljournalname"),
-            "authors": [a.get("name") for a in item.get("authors", [])],
-            "pubdate": pub_date,
-            "source": source,
-            "url": f"https://www.ncbi.nlm.nih.gov/{source}/articles/{uid}/" if source == "pmc" else f"https://pubmed.ncbi.nlm.nih.gov/{uid}/"
-        })
+        article = to_article(uid, item, source)
+        if published(article):
+            articles.append(article)
 
+    cache = get_cache()
+    logger.info("Feed cache: %s, hit rate %.0f%%", json.dumps(cache.stats), 100 * cache.hit_rate())
+    logger.info("NCBI client: %s", json.dumps(get_client().stats))
     return {
         "statusCode": 200,
         "body": json.dumps({"articles": articles}),
-        "headers": cors_headers
-    }
\ No newline at end of file
+        "headers": dict(cors_headers, **{"X-Cache": cache_header(cache_status)})
+    }
+
+def harvest_handler(event, context):
+    """
+    Scheduled job (same image, separate function): rebuilds the topic index
+    from live eutils and publishes it to S3, where the feed picks it up.
+    """
+    path = os.path.join(tempfile.gettempdir(), "feed_index.build.sqlite")
+    summary = build_index(path, load_topics(), search_ids, summarize_ids)
+    if FEED_INDEX_BUCKET:
+        import boto3
+        boto3.client("s3").upload_file(path, FEED_INDEX_BUCKET, FEED_INDEX_KEY)
+    logger.info("Harvested feed index: %s", json.dumps(summary))
+    return summary
@@ -5,6 +5,8 @@ LOCAL_SCRIPT_PATH="glue/products_embedding_job.py"
 S3_BUCKET="food-scanner-046873714594"
 S3_SCRIPT_PREFIX="glue-scripts"
 S3_SCRIPT_URI="s3://${S3_BUCKET}/${S3_SCRIPT_PREFIX}/${LOCAL_SCRIPT_PATH}"
+# Modules the job imports, passed to Glue with --extra-py-files
+LOCAL_MODULE_PATHS="glue/embedding.py glue/pipeline.py glue/embedding_cache.py glue/checkpoint.py"
 
 # === PARAMETERS FOR GLUE JOB ===
 GLUE_JOB_NAME="ProductsEmbeddingJob"
@@ -14,6 +16,12 @@ PYTHON_VERSION="3.9"
 # === 1. Upload your script to S3 ===
 echo "Uploading script to S3..."
 aws s3 cp "$LOCAL_SCRIPT_PATH" "$S3_SCRIPT_URI"
+EXTRA_PY_FILES=""
+for MODULE_PATH in $LOCAL_MODULE_PATHS; do
+  MODULE_URI="s3://${S3_BUCKET}/${S3_SCRIPT_PREFIX}/${MODULE_PATH}"
+  aws s3 cp "$MODULE_PATH" "$MODULE_URI"
+  EXTRA_PY_FILES="${EXTRA_PY_FILES:+${EXTRA_PY_FILES},}${MODULE_URI}"
+done
 
 # === 2. Output job creation command ===
 echo ""
@@ -30,6 +38,7 @@ aws glue create-job \\
     "--region": "eu-west-2",
     "--opensearch_endpoint": "k1w9nv2qspg7rk5c5aif.eu-west-2.aoss.amazonaws.com",
     "--collection_name": "products-embeddings",
+    "--extra-py-files": "${EXTRA_PY_FILES}",
     "--additional-python-modules": "langchain_aws,opensearch-py,pyarrow,tqdm"
   }' \\
   --max-capacity 2.0
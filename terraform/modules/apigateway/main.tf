@@ -1,3 +1,9 @@
 resource "aws_api_gateway_rest_api" "api" {
   name = "intake"
+
+  # Lets Lambda proxy responses with isBase64Encoded (gzip/br-compressed
+  # history bodies) go out as binary; request bodies then arrive base64-encoded.
+  # MOCK integrations (the CORS preflights) must set content_handling =
+  # "CONVERT_TO_TEXT" on the integration and its response to keep working
+  binary_media_types = ["*/*"]
 }
@@ -27,6 +27,7 @@ resource "aws_api_gateway_integration" "options_request" {
   http_method             = aws_api_gateway_method.options_request.http_method
   type                    = "MOCK"
   passthrough_behavior    = "WHEN_NO_MATCH"
+  content_handling        = "CONVERT_TO_TEXT"
   request_templates = {
     "application/json" = <<EOF
 {
@@ -71,10 +72,11 @@ resource "aws_api_gateway_method_response" "get_response_200" {
 }
 
 resource "aws_api_gateway_integration_response" "options_integration_response" {
-  rest_api_id = data.aws_api_gateway_rest_api.api.id
-  resource_id = aws_api_gateway_resource.request.id
-  http_method = aws_api_gateway_method.options_request.http_method
-  status_code = aws_api_gateway_method_response.options_response_200.status_code
+  rest_api_id      = data.aws_api_gateway_rest_api.api.id
+  resource_id      = aws_api_gateway_resource.request.id
+  http_method      = aws_api_gateway_method.options_request.http_method
+  status_code      = aws_api_gateway_method_response.options_response_200.status_code
+  content_handling = "CONVERT_TO_TEXT"
 
   response_parameters = {
     "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,X-Amz-Date,Authorization,X-Api-Key'"
@@ -110,6 +112,12 @@ resource "aws_lambda_function" "processor" {
   package_type  = "Image"
   image_uri     = var.lambda_image_uri
   role          = aws_iam_role.lambda_exec.arn
+
+  environment {
+    variables = {
+      NCBI_RATE_TABLE = var.ncbi_rate_table_name
+    }
+  }
 }
 
 resource "aws_lambda_permission" "allow_api_gateway" {
@@ -140,6 +148,12 @@ resource "aws_iam_role_policy_attachment" "lambda_basic_execution" {
   policy_arn = "arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole"
 }
 
+resource "aws_iam_role_policy_attachment" "ncbi_rate_limit" {
+  count      = var.ncbi_rate_limit_policy_arn == "" ? 0 : 1
+  role       = aws_iam_role.lambda_exec.name
+  policy_arn = var.ncbi_rate_limit_policy_arn
+}
+
 resource "aws_api_gateway_deployment" "deployment" {
   rest_api_id = data.aws_api_gateway_rest_api.api.id
   depends_on = [
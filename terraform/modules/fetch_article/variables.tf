@@ -7,4 +7,16 @@ variable "lambda_image_uri" {
 variable "region" {
   default = "eu-west-2"
   type = string
-}
\ No newline at end of file
+}
+
+variable "ncbi_rate_table_name" {
+  description = "Shared NCBI rate limit table (research_feed's ncbi_rate_table_name output). Empty limits each container on its own"
+  type        = string
+  default     = ""
+}
+
+variable "ncbi_rate_limit_policy_arn" {
+  description = "IAM policy for the shared NCBI rate limit table (research_feed's ncbi_rate_limit_policy_arn output)"
+  type        = string
+  default     = ""
+}
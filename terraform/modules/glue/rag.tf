@@ -108,6 +108,29 @@ resource "aws_opensearchserverless_access_policy" "glue_access" {
   ])
 }
 
+# ---------- Job script and the modules it imports ----------
+# Uploaded from the repo's glue/ folder, so the job always runs with modules
+# that match its script; changing a file changes its etag and re-uploads it
+locals {
+  embedding_job_files = [
+    "products_embedding_job.py",
+    "embedding.py",
+    "pipeline.py",
+    "embedding_cache.py",
+    "checkpoint.py"
+  ]
+  embedding_job_modules = [for f in local.embedding_job_files : f if f != "products_embedding_job.py"]
+}
+
+resource "aws_s3_object" "embedding_job_scripts" {
+  for_each = toset(local.embedding_job_files)
+
+  bucket = data.aws_s3_bucket.food_bucket.id
+  key    = "scripts/${each.value}"
+  source = "${path.module}/../../../glue/${each.value}"
+  etag   = filemd5("${path.module}/../../../glue/${each.value}")
+}
+
 # ---------- Glue job (minimal free-tier) ----------
 resource "aws_glue_job" "products_embedding_job" {
   name     = "products-embedding-job"
@@ -116,7 +139,7 @@ resource "aws_glue_job" "products_embedding_job" {
   command {
     name            = "glueetl"
     python_version  = "3"
-    script_location = "s3://${local.bucket_name}/scripts/products_embedding_job.py"
+    script_location = "s3://${local.bucket_name}/${aws_s3_object.embedding_job_scripts["products_embedding_job.py"].key}"
   }
 
   glue_version       = "4.0"
@@ -128,6 +151,7 @@ resource "aws_glue_job" "products_embedding_job" {
     "--additional-python-modules" = "awswrangler,pyarrow,langchain_aws,boto3,opensearch-py"
     "--job-language"              = "python"
     "--INPUT_KEY"                 = "clean_data/"
+    "--extra-py-files"            = join(",", [for f in local.embedding_job_modules : "s3://${local.bucket_name}/${aws_s3_object.embedding_job_scripts[f].key}"])
   }
 }
 
@@ -31,6 +31,7 @@ resource "aws_api_gateway_integration" "options_receipt-scanner" {
   http_method             = aws_api_gateway_method.options_receipt-scanner.http_method
   type                    = "MOCK"
   passthrough_behavior    = "WHEN_NO_MATCH"
+  content_handling        = "CONVERT_TO_TEXT"
   request_templates = {
     "application/json" = <<EOF
 {
@@ -74,10 +75,11 @@ resource "aws_api_gateway_method_response" "post_response_200" {
 }
 
 resource "aws_api_gateway_integration_response" "options_integration_response" {
-  rest_api_id = data.aws_api_gateway_rest_api.api.id
-  resource_id = aws_api_gateway_resource.receipt-scanner.id
-  http_method = aws_api_gateway_method.options_receipt-scanner.http_method
-  status_code = aws_api_gateway_method_response.options_response_200.status_code
+  rest_api_id      = data.aws_api_gateway_rest_api.api.id
+  resource_id      = aws_api_gateway_resource.receipt-scanner.id
+  http_method      = aws_api_gateway_method.options_receipt-scanner.http_method
+  status_code      = aws_api_gateway_method_response.options_response_200.status_code
+  content_handling = "CONVERT_TO_TEXT"
 
   response_parameters = {
     "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,user-id'"
@@ -110,6 +112,163 @@ resource "aws_api_gateway_integration_response" "post_integration_response" {
   ]
 }
 
+#
+# Presigned upload URLs: clients fetch a PUT URL / POST policy from the
+# uploader and send the image straight to the bucket
+#
+resource "aws_api_gateway_resource" "receipt-upload-url" {
+  rest_api_id = data.aws_api_gateway_rest_api.api.id
+  parent_id   = data.aws_api_gateway_rest_api.api.root_resource_id
+  path_part   = "receipt-upload-url"
+}
+
+resource "aws_api_gateway_method" "post_receipt-upload-url" {
+  rest_api_id   = data.aws_api_gateway_rest_api.api.id
+  resource_id   = aws_api_gateway_resource.receipt-upload-url.id
+  http_method   = "POST"
+  authorization = "NONE"
+  request_models = {
+    "application/json" = "Empty"
+  }
+}
+
+resource "aws_api_gateway_method" "options_receipt-upload-url" {
+  rest_api_id   = data.aws_api_gateway_rest_api.api.id
+  resource_id   = aws_api_gateway_resource.receipt-upload-url.id
+  http_method   = "OPTIONS"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_integration" "options_receipt-upload-url" {
+  rest_api_id          = data.aws_api_gateway_rest_api.api.id
+  resource_id          = aws_api_gateway_resource.receipt-upload-url.id
+  http_method          = aws_api_gateway_method.options_receipt-upload-url.http_method
+  type                 = "MOCK"
+  passthrough_behavior = "WHEN_NO_MATCH"
+  content_handling     = "CONVERT_TO_TEXT"
+  request_templates = {
+    "application/json" = <<EOF
+{
+  "statusCode": 200
+}
+EOF
+  }
+}
+
+resource "aws_api_gateway_method_response" "options_upload_url_response_200" {
+  rest_api_id = data.aws_api_gateway_rest_api.api.id
+  resource_id = aws_api_gateway_resource.receipt-upload-url.id
+  http_method = aws_api_gateway_method.options_receipt-upload-url.http_method
+  status_code = "200"
+  response_models = {
+    "application/json" = "Empty"
+  }
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = true
+    "method.response.header.Access-Control-Allow-Methods" = true
+    "method.response.header.Access-Control-Allow-Origin"  = true
+  }
+}
+
+resource "aws_api_gateway_integration_response" "options_upload_url_integration" {
+  rest_api_id      = data.aws_api_gateway_rest_api.api.id
+  resource_id      = aws_api_gateway_resource.receipt-upload-url.id
+  http_method      = aws_api_gateway_method.options_receipt-upload-url.http_method
+  status_code      = aws_api_gateway_method_response.options_upload_url_response_200.status_code
+  content_handling = "CONVERT_TO_TEXT"
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,Authorization,user-id'"
+    "method.response.header.Access-Control-Allow-Methods" = "'OPTIONS,POST'"
+    "method.response.header.Access-Control-Allow-Origin"  = "'*'"
+  }
+}
+
+resource "aws_api_gateway_integration" "lambda_proxy_post_upload_url" {
+  rest_api_id             = data.aws_api_gateway_rest_api.api.id
+  resource_id             = aws_api_gateway_resource.receipt-upload-url.id
+  http_method             = aws_api_gateway_method.post_receipt-upload-url.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.uploader.invoke_arn
+}
+
+# Batch uploads: several images per request, stored concurrently
+resource "aws_api_gateway_resource" "receipt-upload-batch" {
+  rest_api_id = data.aws_api_gateway_rest_api.api.id
+  parent_id   = data.aws_api_gateway_rest_api.api.root_resource_id
+  path_part   = "receipt-upload-batch"
+}
+
+resource "aws_api_gateway_method" "post_receipt-upload-batch" {
+  rest_api_id   = data.aws_api_gateway_rest_api.api.id
+  resource_id   = aws_api_gateway_resource.receipt-upload-batch.id
+  http_method   = "POST"
+  authorization = "NONE"
+  request_models = {
+    "application/json" = "Empty"
+  }
+}
+
+resource "aws_api_gateway_method" "options_receipt-upload-batch" {
+  rest_api_id   = data.aws_api_gateway_rest_api.api.id
+  resource_id   = aws_api_gateway_resource.receipt-upload-batch.id
+  http_method   = "OPTIONS"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_integration" "options_receipt-upload-batch" {
+  rest_api_id          = data.aws_api_gateway_rest_api.api.id
+  resource_id          = aws_api_gateway_resource.receipt-upload-batch.id
+  http_method          = aws_api_gateway_method.options_receipt-upload-batch.http_method
+  type                 = "MOCK"
+  passthrough_behavior = "WHEN_NO_MATCH"
+  content_handling     = "CONVERT_TO_TEXT"
+  request_templates = {
+    "application/json" = <<EOF
+{
+  "statusCode": 200
+}
+EOF
+  }
+}
+
+resource "aws_api_gateway_method_response" "options_upload_batch_response_200" {
+  rest_api_id = data.aws_api_gateway_rest_api.api.id
+  resource_id = aws_api_gateway_resource.receipt-upload-batch.id
+  http_method = aws_api_gateway_method.options_receipt-upload-batch.http_method
+  status_code = "200"
+  response_models = {
+    "application/json" = "Empty"
+  }
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = true
+    "method.response.header.Access-Control-Allow-Methods" = true
+    "method.response.header.Access-Control-Allow-Origin"  = true
+  }
+}
+
+resource "aws_api_gateway_integration_response" "options_upload_batch_integration" {
+  rest_api_id      = data.aws_api_gateway_rest_api.api.id
+  resource_id      = aws_api_gateway_resource.receipt-upload-batch.id
+  http_method      = aws_api_gateway_method.options_receipt-upload-batch.http_method
+  status_code      = aws_api_gateway_method_response.options_upload_batch_response_200.status_code
+  content_handling = "CONVERT_TO_TEXT"
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,Authorization,user-id'"
+    "method.response.header.Access-Control-Allow-Methods" = "'OPTIONS,POST'"
+    "method.response.header.Access-Control-Allow-Origin"  = "'*'"
+  }
+}
+
+resource "aws_api_gateway_integration" "lambda_proxy_post_upload_batch" {
+  rest_api_id             = data.aws_api_gateway_rest_api.api.id
+  resource_id             = aws_api_gateway_resource.receipt-upload-batch.id
+  http_method             = aws_api_gateway_method.post_receipt-upload-batch.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.uploader.invoke_arn
+}
+
 resource "aws_lambda_function" "processor" {
   function_name = "receipt_lambda"
   package_type  = "Image"
@@ -121,6 +280,19 @@ resource "aws_lambda_function" "processor" {
 
   # (Optional) Increase memory so Textract calls and JSON parsing run faster
   memory_size   = 512  
+
+  environment {
+    variables = {
+      DDB_TABLE              = aws_dynamodb_table.ReceiptsTable.name
+      PARSE_CACHE_TABLE      = aws_dynamodb_table.ReceiptParseCache.name
+      ITEMS_TABLE            = aws_dynamodb_table.ReceiptItemsTable.name
+      AGGREGATES_TABLE       = aws_dynamodb_table.ReceiptSpendAggregates.name
+      RECEIPT_LAYOUT         = "embedded"
+      TEXTRACT_MODE          = "auto"
+      TEXTRACT_SNS_TOPIC_ARN = aws_sns_topic.textract_jobs.arn
+      TEXTRACT_SNS_ROLE_ARN  = aws_iam_role.textract_publish.arn
+    }
+  }
 }
 
 resource "aws_lambda_function" "uploader" {
@@ -133,7 +305,12 @@ resource "aws_lambda_function" "uploader" {
 
   environment {
     variables = {
-      RECEIPTS_BUCKET = aws_s3_bucket.receipts_bucket.bucket
+      RECEIPTS_BUCKET    = aws_s3_bucket.receipts_bucket.bucket
+      UPLOAD_URL_PATH    = "/${aws_api_gateway_resource.receipt-upload-url.path_part}"
+      UPLOAD_URL_EXPIRES = "300"
+      MAX_UPLOAD_BYTES   = tostring(10 * 1024 * 1024)
+      UPLOAD_BATCH_PATH  = "/${aws_api_gateway_resource.receipt-upload-batch.path_part}"
+      MAX_BATCH_IMAGES   = "20"
     }
   }
 }
@@ -238,13 +415,71 @@ resource "aws_iam_policy" "lambda_textract" {
     Statement = [
       {
         Effect   = "Allow"
-        Action   = ["textract:AnalyzeExpense"]
+        Action   = [
+          "textract:AnalyzeExpense",
+          "textract:StartExpenseAnalysis",
+          "textract:GetExpenseAnalysis"
+        ]
         Resource = ["*"]
+      },
+      {
+        Effect   = "Allow"
+        Action   = ["iam:PassRole"]
+        Resource = [aws_iam_role.textract_publish.arn]
       }
     ]
   })
 }
 
+# Completion notifications for asynchronous expense analysis (multi-page PDFs)
+resource "aws_sns_topic" "textract_jobs" {
+  name = "AmazonTextractReceiptJobs"
+}
+
+resource "aws_iam_role" "textract_publish" {
+  name = "textract_receipt_jobs_publish_role"
+
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [{
+      Action = "sts:AssumeRole",
+      Effect = "Allow",
+      Principal = {
+        Service = "textract.amazonaws.com"
+      }
+    }]
+  })
+}
+
+resource "aws_iam_role_policy" "textract_publish" {
+  name = "textract_receipt_jobs_publish"
+  role = aws_iam_role.textract_publish.id
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = ["sns:Publish"]
+        Resource = [aws_sns_topic.textract_jobs.arn]
+      }
+    ]
+  })
+}
+
+resource "aws_sns_topic_subscription" "textract_jobs_to_processor" {
+  topic_arn = aws_sns_topic.textract_jobs.arn
+  protocol  = "lambda"
+  endpoint  = aws_lambda_function.processor.arn
+}
+
+resource "aws_lambda_permission" "allow_sns_invoke" {
+  statement_id  = "AllowSNSInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.processor.function_name
+  principal     = "sns.amazonaws.com"
+  source_arn    = aws_sns_topic.textract_jobs.arn
+}
+
 # Attach the Textract policy to the Lambda execution role
 resource "aws_iam_role_policy_attachment" "lambda_textract_attach" {
   role       = aws_iam_role.lambda_exec.name
@@ -256,7 +491,9 @@ resource "aws_iam_role_policy_attachment" "lambda_textract_attach" {
 resource "aws_api_gateway_deployment" "deployment" {
   rest_api_id = data.aws_api_gateway_rest_api.api.id
   depends_on = [
-    aws_api_gateway_integration.lambda_proxy_post
+    aws_api_gateway_integration.lambda_proxy_post,
+    aws_api_gateway_integration.lambda_proxy_post_upload_url,
+    aws_api_gateway_integration.lambda_proxy_post_upload_batch
   ]
 }
 
@@ -307,6 +544,11 @@ resource "aws_dynamodb_table" "ReceiptsTable" {
     type = "S"
   }
 
+  attribute {
+    name = "receipt_ts"
+    type = "S"
+  }
+
   
   global_secondary_index {
     name               = "user_id-index"
@@ -314,6 +556,79 @@ resource "aws_dynamodb_table" "ReceiptsTable" {
     projection_type    = "ALL"
   }
 
+  # Date-range history queries: receipt_ts is the ISO receipt date
+  global_secondary_index {
+    name               = "user_id-receipt_ts-index"
+    hash_key           = "user_id"
+    range_key          = "receipt_ts"
+    projection_type    = "ALL"
+  }
+
+  tags = {
+    Project     = "receipt-scanner"
+  }
+}
+
+# Line items of receipts saved with RECEIPT_LAYOUT = "normalized"
+resource "aws_dynamodb_table" "ReceiptItemsTable" {
+  name         = "ReceiptItemsTable"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "receipt_id"
+  range_key    = "line_no"
+
+  attribute {
+    name = "receipt_id"
+    type = "S"
+  }
+
+  attribute {
+    name = "line_no"
+    type = "N"
+  }
+
+  tags = {
+    Project     = "receipt-scanner"
+  }
+}
+
+# Parsed receipts keyed by image content hash, so duplicate uploads skip Textract
+resource "aws_dynamodb_table" "ReceiptParseCache" {
+  name         = "ReceiptParseCache"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "content_hash"
+
+  attribute {
+    name = "content_hash"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Project     = "receipt-scanner"
+  }
+}
+
+# Per-user, per-month, per-shop spend, updated by the scanner as receipts are saved
+resource "aws_dynamodb_table" "ReceiptSpendAggregates" {
+  name         = "ReceiptSpendAggregates"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "user_id"
+  range_key    = "period_shop"
+
+  attribute {
+    name = "user_id"
+    type = "S"
+  }
+
+  attribute {
+    name = "period_shop"
+    type = "S"
+  }
+
   tags = {
     Project     = "receipt-scanner"
   }
@@ -326,27 +641,96 @@ resource "aws_s3_bucket" "receipts_bucket" {
   }
 }
 
-resource "aws_lambda_permission" "allow_s3_invoke" {
-  statement_id  = "AllowS3Invoke"
-  action        = "lambda:InvokeFunction"
-  function_name = aws_lambda_function.processor.function_name
-  principal     = "s3.amazonaws.com"
-  source_arn    = aws_s3_bucket.receipts_bucket.arn
+# Browsers upload straight to the bucket with presigned PUT URLs / POST policies
+resource "aws_s3_bucket_cors_configuration" "receipts_bucket" {
+  bucket = aws_s3_bucket.receipts_bucket.id
+
+  cors_rule {
+    allowed_methods = ["PUT", "POST"]
+    allowed_origins = ["*"]
+    allowed_headers = ["*"]
+    expose_headers  = ["ETag"]
+    max_age_seconds = 3000
+  }
+}
+
+# Upload notifications are queued so the scanner receives them in batches
+# (up to 10 receipts or 10 seconds per invocation) rather than one per image
+resource "aws_sqs_queue" "receipt_uploads_dlq" {
+  name                      = "ReceiptUploadsDLQ"
+  message_retention_seconds = 1209600
+}
+
+resource "aws_sqs_queue" "receipt_uploads" {
+  name                       = "ReceiptUploads"
+  visibility_timeout_seconds = 180   # 6x the scanner's timeout
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.receipt_uploads_dlq.arn
+    maxReceiveCount     = 3
+  })
+}
+
+resource "aws_sqs_queue_policy" "receipt_uploads" {
+  queue_url = aws_sqs_queue.receipt_uploads.id
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [{
+      Effect    = "Allow",
+      Principal = { Service = "s3.amazonaws.com" },
+      Action    = "sqs:SendMessage",
+      Resource  = aws_sqs_queue.receipt_uploads.arn,
+      Condition = {
+        ArnEquals = { "aws:SourceArn" = aws_s3_bucket.receipts_bucket.arn }
+      }
+    }]
+  })
 }
 
 resource "aws_s3_bucket_notification" "receipts_trigger" {
   bucket = aws_s3_bucket.receipts_bucket.id
 
-  lambda_function {
-    lambda_function_arn = aws_lambda_function.processor.arn
-    events              = ["s3:ObjectCreated:*"]
+  queue {
+    queue_arn = aws_sqs_queue.receipt_uploads.arn
+    events    = ["s3:ObjectCreated:*"]
   }
 
   depends_on = [
-    aws_lambda_permission.allow_s3_invoke
+    aws_sqs_queue_policy.receipt_uploads
   ]
 }
 
+resource "aws_lambda_event_source_mapping" "receipt_uploads" {
+  event_source_arn                   = aws_sqs_queue.receipt_uploads.arn
+  function_name                      = aws_lambda_function.processor.arn
+  batch_size                         = 10
+  maximum_batching_window_in_seconds = 10
+  function_response_types            = ["ReportBatchItemFailures"]
+}
+
+resource "aws_iam_policy" "lambda_sqs_consume" {
+  name = "lambda_receipt_uploads_consume"
+
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Action = [
+          "sqs:ReceiveMessage",
+          "sqs:DeleteMessage",
+          "sqs:GetQueueAttributes"
+        ],
+        Effect   = "Allow",
+        Resource = [aws_sqs_queue.receipt_uploads.arn]
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "lambda_sqs_consume_attach" {
+  role       = aws_iam_role.lambda_exec.name
+  policy_arn = aws_iam_policy.lambda_sqs_consume.arn
+}
+
 #
 # Receipt History Lambda
 #
@@ -374,11 +758,15 @@ resource "aws_iam_policy" "lambda_history_dynamodb_read" {
         Effect   = "Allow",
         Action   = [
           "dynamodb:Query",
-          "dynamodb:GetItem"
+          "dynamodb:GetItem",
+          "dynamodb:BatchGetItem"
         ],
         Resource = [
           aws_dynamodb_table.ReceiptsTable.arn,
-          "${aws_dynamodb_table.ReceiptsTable.arn}/index/user_id-index"
+          "${aws_dynamodb_table.ReceiptsTable.arn}/index/user_id-index",
+          "${aws_dynamodb_table.ReceiptsTable.arn}/index/user_id-receipt_ts-index",
+          aws_dynamodb_table.ReceiptItemsTable.arn,
+          aws_dynamodb_table.ReceiptSpendAggregates.arn
         ]
       }
     ]
@@ -400,8 +788,12 @@ resource "aws_lambda_function" "history" {
 
   environment {
     variables = {
-      DDB_TABLE   = aws_dynamodb_table.ReceiptsTable.name
-      USER_INDEX  = "user_id-index"
+      DDB_TABLE        = aws_dynamodb_table.ReceiptsTable.name
+      USER_INDEX       = "user_id-index"
+      TIME_INDEX       = "user_id-receipt_ts-index"
+      ITEMS_TABLE      = aws_dynamodb_table.ReceiptItemsTable.name
+      AGGREGATES_TABLE = aws_dynamodb_table.ReceiptSpendAggregates.name
+      SUMMARY_PATH     = "/${aws_api_gateway_resource.receipt-summary.path_part}"
     }
   }
 }
@@ -443,6 +835,7 @@ resource "aws_api_gateway_integration" "options_receipt-history" {
   http_method          = aws_api_gateway_method.options_receipt-history.http_method
   type                 = "MOCK"
   passthrough_behavior = "WHEN_NO_MATCH"
+  content_handling     = "CONVERT_TO_TEXT"
   request_templates = {
     "application/json" = <<EOF
 {
@@ -468,12 +861,13 @@ resource "aws_api_gateway_method_response" "options_history_response_200" {
 }
 
 resource "aws_api_gateway_integration_response" "options_history_integration" {
-  rest_api_id = data.aws_api_gateway_rest_api.api.id
-  resource_id = aws_api_gateway_resource.receipt-history.id
-  http_method = aws_api_gateway_method.options_receipt-history.http_method
-  status_code = aws_api_gateway_method_response.options_history_response_200.status_code
+  rest_api_id      = data.aws_api_gateway_rest_api.api.id
+  resource_id      = aws_api_gateway_resource.receipt-history.id
+  http_method      = aws_api_gateway_method.options_receipt-history.http_method
+  status_code      = aws_api_gateway_method_response.options_history_response_200.status_code
+  content_handling = "CONVERT_TO_TEXT"
   response_parameters = {
-    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,Authorization'"
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,Authorization,If-None-Match'"
     "method.response.header.Access-Control-Allow-Methods" = "'OPTIONS,GET'"
     "method.response.header.Access-Control-Allow-Origin"  = "'*'"
   }
@@ -518,6 +912,123 @@ resource "aws_api_gateway_integration_response" "get_history_integration_respons
   ]
 }
 
+#
+# Monthly spend summary, served by the history Lambda from ReceiptSpendAggregates
+#
+resource "aws_lambda_permission" "allow_api_gateway_summary" {
+  statement_id  = "AllowExecutionFromAPIGatewaySummary"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.history.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${data.aws_api_gateway_rest_api.api.execution_arn}/*/GET/receipt-summary"
+}
+
+resource "aws_api_gateway_resource" "receipt-summary" {
+  rest_api_id = data.aws_api_gateway_rest_api.api.id
+  parent_id   = data.aws_api_gateway_rest_api.api.root_resource_id
+  path_part   = "receipt-summary"
+}
+
+resource "aws_api_gateway_method" "get_receipt-summary" {
+  rest_api_id   = data.aws_api_gateway_rest_api.api.id
+  resource_id   = aws_api_gateway_resource.receipt-summary.id
+  http_method   = "GET"
+  authorization = "NONE"
+  request_models = {
+    "application/json" = "Empty"
+  }
+}
+
+resource "aws_api_gateway_method" "options_receipt-summary" {
+  rest_api_id   = data.aws_api_gateway_rest_api.api.id
+  resource_id   = aws_api_gateway_resource.receipt-summary.id
+  http_method   = "OPTIONS"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_integration" "options_receipt-summary" {
+  rest_api_id          = data.aws_api_gateway_rest_api.api.id
+  resource_id          = aws_api_gateway_resource.receipt-summary.id
+  http_method          = aws_api_gateway_method.options_receipt-summary.http_method
+  type                 = "MOCK"
+  passthrough_behavior = "WHEN_NO_MATCH"
+  content_handling     = "CONVERT_TO_TEXT"
+  request_templates = {
+    "application/json" = <<EOF
+{
+  "statusCode": 200
+}
+EOF
+  }
+}
+
+resource "aws_api_gateway_method_response" "options_summary_response_200" {
+  rest_api_id = data.aws_api_gateway_rest_api.api.id
+  resource_id = aws_api_gateway_resource.receipt-summary.id
+  http_method = aws_api_gateway_method.options_receipt-summary.http_method
+  status_code = "200"
+  response_models = {
+    "application/json" = "Empty"
+  }
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = true
+    "method.response.header.Access-Control-Allow-Methods" = true
+    "method.response.header.Access-Control-Allow-Origin"  = true
+  }
+}
+
+resource "aws_api_gateway_integration_response" "options_summary_integration" {
+  rest_api_id      = data.aws_api_gateway_rest_api.api.id
+  resource_id      = aws_api_gateway_resource.receipt-summary.id
+  http_method      = aws_api_gateway_method.options_receipt-summary.http_method
+  status_code      = aws_api_gateway_method_response.options_summary_response_200.status_code
+  content_handling = "CONVERT_TO_TEXT"
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,Authorization,If-None-Match'"
+    "method.response.header.Access-Control-Allow-Methods" = "'OPTIONS,GET'"
+    "method.response.header.Access-Control-Allow-Origin"  = "'*'"
+  }
+}
+
+resource "aws_api_gateway_integration" "lambda_proxy_get_summary" {
+  rest_api_id             = data.aws_api_gateway_rest_api.api.id
+  resource_id             = aws_api_gateway_resource.receipt-summary.id
+  http_method             = aws_api_gateway_method.get_receipt-summary.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.history.invoke_arn
+}
+
+resource "aws_api_gateway_method_response" "get_summary_response_200" {
+  rest_api_id = data.aws_api_gateway_rest_api.api.id
+  resource_id = aws_api_gateway_resource.receipt-summary.id
+  http_method = aws_api_gateway_method.get_receipt-summary.http_method
+  status_code = "200"
+  response_models = {
+    "application/json" = "Empty"
+  }
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Origin" = true
+    "method.response.header.Access-Control-Allow-Methods" = true
+    "method.response.header.Access-Control-Allow-Headers" = true
+  }
+}
+
+resource "aws_api_gateway_integration_response" "get_summary_integration_response" {
+  rest_api_id = data.aws_api_gateway_rest_api.api.id
+  resource_id = aws_api_gateway_resource.receipt-summary.id
+  http_method = aws_api_gateway_method.get_receipt-summary.http_method
+  status_code = aws_api_gateway_method_response.get_summary_response_200.status_code
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Origin"  = "'*'"
+    "method.response.header.Access-Control-Allow-Methods" = "'OPTIONS,GET'"
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,Authorization'"
+  }
+  depends_on = [
+    aws_api_gateway_integration.lambda_proxy_get_summary
+  ]
+}
+
 resource "aws_cloudwatch_log_group" "lambda_log_group" {
   name              = "/aws/lambda/${aws_lambda_function.processor.function_name}"
   retention_in_days = 14
@@ -537,7 +1048,7 @@ resource "aws_cloudwatch_log_group" "uploader_lambda_log_group" {
 # Allow Lambda to write to DynamoDB
 resource "aws_iam_policy" "lambda_dynamodb_write" {
   name        = "lambda_dynamodb_write"
-  description = "Allow Lambda to put items into ReceiptsTable"
+  description = "Allow Lambda to write receipts and their line items"
   policy = jsonencode({
     Version = "2012-10-17"
     Statement = [
@@ -545,11 +1056,34 @@ resource "aws_iam_policy" "lambda_dynamodb_write" {
         Effect   = "Allow"
         Action   = [
           "dynamodb:PutItem",
-          "dynamodb:UpdateItem"
+          "dynamodb:UpdateItem",
+          "dynamodb:BatchWriteItem"
         ]
         Resource = [
-          aws_dynamodb_table.ReceiptsTable.arn
+          aws_dynamodb_table.ReceiptsTable.arn,
+          aws_dynamodb_table.ReceiptItemsTable.arn
+        ]
+      },
+      {
+        Effect   = "Allow"
+        Action   = [
+          "dynamodb:GetItem",
+          "dynamodb:PutItem"
+        ]
+        Resource = [
+          aws_dynamodb_table.ReceiptParseCache.arn
+        ]
+      },
+      {
+        Effect   = "Allow"
+        # Each receipt's contribution is read, then replaced together with
+        # the aggregate updates in one TransactWriteItems call
+        Action   = [
+          "dynamodb:GetItem",
+          "dynamodb:PutItem",
+          "dynamodb:UpdateItem"
         ]
+        Resource = [aws_dynamodb_table.ReceiptSpendAggregates.arn]
       }
     ]
   })
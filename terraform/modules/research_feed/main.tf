@@ -27,6 +27,7 @@ resource "aws_api_gateway_integration" "options_research-feed" {
   http_method             = aws_api_gateway_method.options_research-feed.http_method
   type                    = "MOCK"
   passthrough_behavior    = "WHEN_NO_MATCH"
+  content_handling        = "CONVERT_TO_TEXT"
   request_templates = {
     "application/json" = <<EOF
 {
@@ -71,10 +72,11 @@ resource "aws_api_gateway_method_response" "get_response_200" {
 }
 
 resource "aws_api_gateway_integration_response" "options_integration_response" {
-  rest_api_id = data.aws_api_gateway_rest_api.api.id
-  resource_id = aws_api_gateway_resource.research-feed.id
-  http_method = aws_api_gateway_method.options_research-feed.http_method
-  status_code = aws_api_gateway_method_response.options_response_200.status_code
+  rest_api_id      = data.aws_api_gateway_rest_api.api.id
+  resource_id      = aws_api_gateway_resource.research-feed.id
+  http_method      = aws_api_gateway_method.options_research-feed.http_method
+  status_code      = aws_api_gateway_method_response.options_response_200.status_code
+  content_handling = "CONVERT_TO_TEXT"
 
   response_parameters = {
     "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,X-Amz-Date,Authorization,X-Api-Key'"
@@ -115,6 +117,218 @@ resource "aws_lambda_function" "processor" {
   package_type  = "Image"
   image_uri     = var.lambda_image_uri
   role          = aws_iam_role.lambda_exec.arn
+
+  environment {
+    variables = {
+      FEED_CACHE_TABLE  = aws_dynamodb_table.ResearchFeedCache.name
+      SEARCH_CACHE_TTL  = "900"
+      SUMMARY_CACHE_TTL = "86400"
+      ESUMMARY_CHUNK    = "50"
+      ESUMMARY_WORKERS  = "4"
+      NCBI_API_KEY      = var.ncbi_api_key
+      NCBI_RATE_TABLE   = aws_dynamodb_table.NCBIRateLimit.name
+      FEED_INDEX_BUCKET = var.feed_index_bucket
+      FEED_INDEX_KEY    = local.feed_index_key
+    }
+  }
+}
+
+# Harvests summaries for the topics in feed_topics.json into a SQLite index
+# in S3, which research_feed answers those searches from
+locals {
+  feed_index_key = "research-feed/feed_index.sqlite"
+}
+
+resource "aws_lambda_function" "harvester" {
+  function_name = "research_feed_harvester"
+  package_type  = "Image"
+  image_uri     = var.lambda_image_uri
+  role          = aws_iam_role.harvester_exec.arn
+  timeout       = 900
+  memory_size   = 512
+
+  image_config {
+    command = ["lambda_function.harvest_handler"]
+  }
+
+  environment {
+    variables = {
+      FEED_CACHE_TABLE  = aws_dynamodb_table.ResearchFeedCache.name
+      NCBI_API_KEY      = var.ncbi_api_key
+      NCBI_RATE_TABLE   = aws_dynamodb_table.NCBIRateLimit.name
+      FEED_INDEX_BUCKET = var.feed_index_bucket
+      FEED_INDEX_KEY    = local.feed_index_key
+      HARVEST_DEPTH     = "200"
+    }
+  }
+}
+
+resource "aws_cloudwatch_event_rule" "harvest_schedule" {
+  name                = "research_feed_harvest"
+  schedule_expression = var.harvest_schedule
+}
+
+resource "aws_cloudwatch_event_target" "harvest_target" {
+  rule = aws_cloudwatch_event_rule.harvest_schedule.name
+  arn  = aws_lambda_function.harvester.arn
+}
+
+resource "aws_lambda_permission" "allow_harvest_schedule" {
+  statement_id  = "AllowExecutionFromEventBridge"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.harvester.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.harvest_schedule.arn
+}
+
+# The feed only reads the index; publishing it is left to the harvester's
+# own role, so the request-serving function can't replace what it trusts
+resource "aws_iam_policy" "feed_index" {
+  name = "research_feed_index_access"
+
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Action   = ["s3:GetObject"],
+        Effect   = "Allow",
+        Resource = ["arn:aws:s3:::${var.feed_index_bucket}/${local.feed_index_key}"]
+      },
+      {
+        # Lets HeadObject on a missing index return 404 rather than 403
+        Action   = ["s3:ListBucket"],
+        Effect   = "Allow",
+        Resource = ["arn:aws:s3:::${var.feed_index_bucket}"]
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "feed_index_attach" {
+  role       = aws_iam_role.lambda_exec.name
+  policy_arn = aws_iam_policy.feed_index.arn
+}
+
+resource "aws_iam_policy" "feed_index_publish" {
+  name = "research_feed_index_publish"
+
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Action   = ["s3:PutObject"],
+        Effect   = "Allow",
+        Resource = ["arn:aws:s3:::${var.feed_index_bucket}/${local.feed_index_key}"]
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role" "harvester_exec" {
+  name = "research_feed_harvester_exec_role"
+
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [{
+      Action = "sts:AssumeRole",
+      Effect = "Allow",
+      Principal = {
+        Service = "lambda.amazonaws.com"
+      }
+    }]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "harvester_index_publish" {
+  role       = aws_iam_role.harvester_exec.name
+  policy_arn = aws_iam_policy.feed_index_publish.arn
+}
+
+resource "aws_iam_role_policy_attachment" "harvester_feed_cache" {
+  role       = aws_iam_role.harvester_exec.name
+  policy_arn = aws_iam_policy.feed_cache.arn
+}
+
+resource "aws_iam_role_policy_attachment" "harvester_basic_execution" {
+  role       = aws_iam_role.harvester_exec.name
+  policy_arn = "arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole"
+}
+
+# eutils responses shared by every research_feed container, keyed by
+# normalized query parameters
+resource "aws_dynamodb_table" "ResearchFeedCache" {
+  name         = "ResearchFeedCache"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "cache_key"
+
+  attribute {
+    name = "cache_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+}
+
+resource "aws_iam_policy" "feed_cache" {
+  name = "research_feed_cache_access"
+
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Action   = ["dynamodb:GetItem", "dynamodb:PutItem"],
+        Effect   = "Allow",
+        Resource = [aws_dynamodb_table.ResearchFeedCache.arn]
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "feed_cache_attach" {
+  role       = aws_iam_role.lambda_exec.name
+  policy_arn = aws_iam_policy.feed_cache.arn
+}
+
+# NCBI counts requests per API key (or IP), not per container: every
+# function calling eutils reserves its request slots in this table (see
+# SharedRateLimiter in ncbi_client.py), so together they stay under the limit
+resource "aws_dynamodb_table" "NCBIRateLimit" {
+  name         = "NCBIRateLimit"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "limiter"
+
+  attribute {
+    name = "limiter"
+    type = "S"
+  }
+}
+
+resource "aws_iam_policy" "ncbi_rate_limit" {
+  name = "ncbi_rate_limit_access"
+
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Action   = ["dynamodb:UpdateItem"],
+        Effect   = "Allow",
+        Resource = [aws_dynamodb_table.NCBIRateLimit.arn]
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "ncbi_rate_limit_attach" {
+  role       = aws_iam_role.lambda_exec.name
+  policy_arn = aws_iam_policy.ncbi_rate_limit.arn
+}
+
+resource "aws_iam_role_policy_attachment" "harvester_ncbi_rate_limit" {
+  role       = aws_iam_role.harvester_exec.name
+  policy_arn = aws_iam_policy.ncbi_rate_limit.arn
 }
 
 resource "aws_lambda_permission" "allow_api_gateway" {
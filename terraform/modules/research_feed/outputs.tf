@@ -7,3 +7,13 @@ output "api_gateway_rest_api_id" {
   value       = data.aws_api_gateway_rest_api.api.id
   description = "API Gateway REST API ID"
 }
+
+output "ncbi_rate_table_name" {
+  value       = aws_dynamodb_table.NCBIRateLimit.name
+  description = "DynamoDB table every NCBI-calling Lambda shares its eutils rate limit through"
+}
+
+output "ncbi_rate_limit_policy_arn" {
+  value       = aws_iam_policy.ncbi_rate_limit.arn
+  description = "IAM policy granting access to the shared NCBI rate limit table"
+}
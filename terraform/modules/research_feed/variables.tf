@@ -7,4 +7,22 @@ variable "lambda_image_uri" {
 variable "region" {
   default = "eu-west-2"
   type = string
-}
\ No newline at end of file
+}
+variable "ncbi_api_key" {
+  description = "NCBI eutils API key; raises the rate limit from 3 to 10 requests/second. Empty uses no key"
+  type        = string
+  default     = ""
+  sensitive   = true
+}
+
+variable "feed_index_bucket" {
+  description = "S3 bucket the harvested research feed index is published to"
+  type        = string
+  default     = "food-scanner-046873714594"
+}
+
+variable "harvest_schedule" {
+  description = "How often the research feed harvester rebuilds the topic index"
+  type        = string
+  default     = "rate(6 hours)"
+}